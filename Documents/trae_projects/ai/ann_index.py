@@ -0,0 +1,187 @@
+"""
+近似最近邻索引（IVF）- 语料达到百万级时替代逐条计算内积的精确检索
+
+- 训练：对向量做球面k-means，得到nlist个聚类中心（粗量化器）
+- 插入：每个向量归入最近的聚类中心对应的倒排列表；训练之后的新向量增量归入，不需要重建
+- 检索：先找出与查询最接近的nprobe个聚类中心，只对这些列表中的向量计算内积
+- nprobe越大召回率越高、速度越慢；nprobe等于nlist时与精确检索结果相同
+- 一批查询按倒排列表分组：每个被探测的列表只取一次向量，与探测它的所有查询做一次矩阵乘法
+
+向量数量达到训练阈值之前使用精确检索，达到阈值时自动训练；
+数据分布变化较大时可以手动调用 train() 重新训练。
+
+默认参数按 benchmark_ann.py 的 text 语料（默认哈希嵌入）选取：nlist 取 sqrt(n)，
+nprobe 取 nlist 的 60%，recall@10 在 0.9 以上（5千到10万条文档均如此）。哈希嵌入的向量几乎没有聚类结构，
+要达到这个召回率需要探测大部分列表，此时逐列表计算比一次矩阵乘法的精确检索更慢，
+因此探测比例超过 EXACT_SEARCH_FRACTION 时直接做精确检索——默认参数下 IVF 不会比精确检索快。
+嵌入向量有明显聚类结构时（例如语义嵌入模型，benchmark_ann.py 的 clustered 数据），
+nprobe 取 nlist 的 5% 即可接近完全召回，应显式指定较小的 nprobe。
+"""
+
+from array import array
+from typing import List, Optional, Set, Tuple
+import math
+
+import numpy as np
+
+from dense_index import DenseIndex, _normalize
+
+# 未指定 nprobe 时探测的列表比例
+DEFAULT_NPROBE_FRACTION = 0.6
+
+# 探测的列表比例达到该值时改用精确检索（按列表分组计算在探测约30%的列表时与精确检索的矩阵乘法持平）
+EXACT_SEARCH_FRACTION = 0.3
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 15, seed: int = 0,
+                     chunk_size: int = 8192) -> np.ndarray:
+    """对已归一化的向量做球面k-means（按内积分配），返回归一化的聚类中心"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=k)
+        # 空簇用随机向量重新初始化
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """分块计算每个向量最近的聚类中心，避免一次生成 n×k 的大矩阵"""
+    result = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        result[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return result
+
+
+class IVFIndex(DenseIndex):
+    """倒排文件（IVF）近似最近邻索引"""
+
+    def __init__(self, embedder=None, nlist: Optional[int] = None, nprobe: Optional[int] = None,
+                 train_threshold: int = 10000, max_train_samples: int = 100000,
+                 initial_capacity: int = 1024, seed: int = 0):
+        """
+        Args:
+            embedder: 嵌入器，默认使用哈希嵌入
+            nlist: 聚类中心数，默认按训练时的向量数取 sqrt(n)
+            nprobe: 每次检索访问的列表数，默认取 nlist 的 DEFAULT_NPROBE_FRACTION
+            train_threshold: 向量数达到该值时自动训练
+            max_train_samples: 训练时最多采样的向量数
+        """
+        super().__init__(embedder, initial_capacity)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.max_train_samples = max_train_samples
+        self.seed = seed
+        self.centroids = None
+        self._lists = []  # 每个聚类中心的文档ID
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self):
+        """用当前所有向量训练聚类中心，并重新分配倒排列表"""
+        vectors = self.vectors
+        if len(vectors) == 0:
+            return
+        nlist = min(self.nlist or max(1, int(math.sqrt(len(vectors)))), len(vectors))
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.max_train_samples:
+            sample = vectors[rng.choice(len(vectors), self.max_train_samples, replace=False)]
+        else:
+            sample = vectors
+        self.centroids = spherical_kmeans(sample, nlist, seed=self.seed)
+        self._lists = [array("q") for _ in range(nlist)]
+        self._add_to_lists(0, vectors)
+
+    def _add_to_lists(self, start: int, vectors: np.ndarray):
+        for offset, list_id in enumerate(assign(vectors, self.centroids).tolist()):
+            self._lists[list_id].append(start + offset)
+
+    def add_vectors(self, vectors: np.ndarray) -> List[int]:
+        ids = super().add_vectors(vectors)
+        if not ids:
+            return ids
+        if self.trained:
+            self._add_to_lists(ids[0], self.vectors[ids[0]:])
+        elif len(self) >= self.train_threshold:
+            self.train()
+        return ids
+
+    def effective_nprobe(self, nprobe: Optional[int] = None) -> int:
+        """实际访问的列表数（未训练时为0）"""
+        nlist = len(self._lists)
+        if not nlist:
+            return 0
+        nprobe = nprobe or self.nprobe or math.ceil(DEFAULT_NPROBE_FRACTION * nlist)
+        return max(1, min(nprobe, nlist))
+
+    def search_vectors(self, queries: np.ndarray, top_k: int = 3, allowed: Optional[Set[int]] = None,
+                       nprobe: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+        # 元数据过滤后的候选集合通常很小，直接对候选文档做精确检索，召回率不受nprobe影响
+        if not self.trained or allowed is not None:
+            return super().search_vectors(queries, top_k, allowed)
+        nlist = len(self._lists)
+        nprobe = self.effective_nprobe(nprobe)
+        # 探测大部分列表时，一次矩阵乘法的精确检索更快，结果也更准确
+        if nprobe >= EXACT_SEARCH_FRACTION * nlist:
+            return super().search_vectors(queries, top_k)
+        queries = _normalize(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        # 一次矩阵乘法算出所有查询与所有聚类中心的相似度
+        centroid_scores = queries @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+        # 把 (列表, 查询) 对按列表排序分组，每个列表与探测它的查询做一次矩阵乘法
+        list_ids = probes.ravel()
+        query_ids = np.repeat(np.arange(len(queries)), nprobe)
+        order = np.argsort(list_ids, kind="stable")
+        list_ids, query_ids = list_ids[order], query_ids[order]
+        bounds = np.flatnonzero(np.diff(list_ids)) + 1
+        candidate_ids = [[] for _ in range(len(queries))]
+        candidate_scores = [[] for _ in range(len(queries))]
+        vectors = self.vectors
+        for group_lists, group_queries in zip(np.split(list_ids, bounds), np.split(query_ids, bounds)):
+            ids = np.frombuffer(self._lists[group_lists[0]], dtype=np.int64)
+            if not len(ids):
+                continue
+            scores = vectors[ids] @ queries[group_queries].T
+            for column, query_id in enumerate(group_queries.tolist()):
+                candidate_ids[query_id].append(ids)
+                candidate_scores[query_id].append(scores[:, column])
+
+        results = []
+        for ids, scores in zip(candidate_ids, candidate_scores):
+            if not ids:
+                results.append([])
+                continue
+            ids, scores = np.concatenate(ids), np.concatenate(scores)
+            results.append([(int(ids[i]), score) for i, score in self._top_k(scores, top_k)])
+        return results
+
+    def search(self, query: str, top_k: int = 3, allowed: Optional[Set[int]] = None,
+               nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        return self.search_vectors(self.embedder.embed([query]), top_k, allowed, nprobe)[0]
+
+    def search_exact(self, queries: np.ndarray, top_k: int = 3) -> List[List[Tuple[int, float]]]:
+        """精确检索（用于计算召回率）"""
+        return DenseIndex.search_vectors(self, queries, top_k)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            "trained": self.trained,
+            "nlist": len(self._lists),
+            "nprobe": self.effective_nprobe()
+        })
+        if self._lists:
+            sizes = [len(ids) for ids in self._lists]
+            stats["list_size_max"] = max(sizes)
+            stats["list_size_mean"] = round(sum(sizes) / len(sizes), 1)
+        return stats
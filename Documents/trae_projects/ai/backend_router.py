@@ -0,0 +1,273 @@
+"""
+多后端模型路由 - 在多个OpenAI兼容后端（多个本地Ollama实例、统一大模型网关）之间做负载均衡
+
+- 最少在途请求（least outstanding requests）负载均衡
+- 连续失败的后端会被摘除一段时间；冷却结束后放行请求试探（半开），请求成功才恢复，
+  失败则立即再次摘除。健康探测只标记后端是否在线，不会提前结束摘除
+- 在收到第一个token之前失败的请求会自动换一个后端重试
+"""
+
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List, Optional
+import itertools
+import os
+import time
+
+import httpx
+
+from model_metrics import BACKEND_FAILURES
+
+
+class NoBackendAvailable(Exception):
+    """没有可以处理该模型请求的后端"""
+
+
+class Backend:
+    """一个OpenAI兼容后端"""
+
+    def __init__(self, api_base: str, api_key: str = "dummy", name: str = None,
+                 models: Optional[Iterable[str]] = None, limits: httpx.Limits = None):
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key or "dummy"  # Ollama兼容接口不需要真实API密钥，任意字符串即可
+        self.name = name or self.api_base
+        # 该后端提供的模型；None表示不限制（例如Ollama实例）
+        self.models = set(models) if models else None
+        self.limits = limits or httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=30.0)
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+        self._http = None
+
+    @classmethod
+    def from_llm_config(cls, config: Dict[str, Any], name: str = None) -> "Backend":
+        """根据llm_config.py中的配置字典（api_base、api_key、model_name）创建后端"""
+        return cls(
+            config["api_base"],
+            config.get("api_key"),
+            name=name or config.get("provider"),
+            models=[config["model_name"]] if config.get("model_name") else None
+        )
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """每个后端一个连接池，第一次使用时创建"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.api_base,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                limits=self.limits,
+                # 流式生成可能持续较长时间，读超时按单个分块计算
+                timeout=httpx.Timeout(connect=5.0, read=300.0, write=30.0, pool=60.0)
+            )
+        return self._http
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def available(self, now: float) -> bool:
+        """健康且未被摘除"""
+        return self.healthy and now >= self.ejected_until
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "api_base": self.api_base,
+            "models": sorted(self.models) if self.models else None,
+            "healthy": self.healthy,
+            "ejected": time.time() < self.ejected_until,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.consecutive_failures,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures
+        }
+
+
+class BackendRouter:
+    """按最少在途请求在多个后端之间分发请求"""
+
+    def __init__(self, backends: List[Backend], max_failures: int = 3, eject_seconds: float = 30.0,
+                 max_affinity_keys: int = 10000):
+        if not backends:
+            raise ValueError("至少需要一个后端")
+        self.backends = backends
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.max_affinity_keys = max_affinity_keys
+        self._tiebreak = itertools.count()
+        self._affinity = OrderedDict()  # 亲和键（如会话ID） -> 上次处理该键的后端
+
+    def capacity(self, model: str) -> int:
+        """能够处理该模型的后端数量"""
+        return sum(1 for backend in self.backends if backend.serves(model)) or 1
+
+    def pick(self, model: str, exclude: Iterable[Backend] = (), affinity: str = None) -> Backend:
+        """
+        选择在途请求最少的可用后端；没有可用后端时退而选择被摘除的后端
+
+        指定affinity时优先选择上次处理该键的后端（只要它仍然可用），以便复用其KV缓存
+        """
+        now = time.time()
+        candidates = [b for b in self.backends if b.serves(model) and b not in exclude]
+        if not candidates:
+            raise NoBackendAvailable(f"没有可用的后端处理模型 {model}")
+        preferred = self._affinity.get(affinity) if affinity is not None else None
+        if preferred in candidates and preferred.available(now):
+            return preferred
+        available = [b for b in candidates if b.available(now)] or candidates
+        # 在途请求相同时轮流选择，避免总是压在第一个后端上
+        offset = next(self._tiebreak)
+        count = len(available)
+        return min(
+            (available[(offset + i) % count] for i in range(count)),
+            key=lambda b: b.outstanding
+        )
+
+    @asynccontextmanager
+    async def _lease(self, backend: Backend):
+        backend.outstanding += 1
+        backend.total_requests += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+
+    def _remember(self, affinity: Optional[str], backend: Backend):
+        if affinity is None:
+            return
+        self._affinity[affinity] = backend
+        self._affinity.move_to_end(affinity)
+        while len(self._affinity) > self.max_affinity_keys:
+            self._affinity.popitem(last=False)
+
+    def _record_success(self, backend: Backend):
+        """请求成功：清零连续失败次数，结束摘除（冷却结束后的半开请求成功即恢复）"""
+        backend.consecutive_failures = 0
+        backend.healthy = True
+        backend.ejected_until = 0.0
+
+    def _record_failure(self, backend: Backend):
+        """请求失败：连续失败达到上限时摘除（半开请求失败时连续失败次数仍在上限之上，立即再次摘除）"""
+        backend.consecutive_failures += 1
+        backend.total_failures += 1
+        BACKEND_FAILURES.labels(backend.name).inc()
+        if backend.consecutive_failures >= self.max_failures:
+            backend.ejected_until = time.time() + self.eject_seconds
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """连接错误和5xx可以换后端重试；4xx说明请求本身有问题"""
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, httpx.TransportError)
+
+    async def post(self, path: str, model: str, json: Dict[str, Any], affinity: str = None) -> httpx.Response:
+        """非流式请求：失败时换一个后端重试，直到所有后端都试过"""
+        tried = []
+        while True:
+            backend = self.pick(model, tried, affinity)
+            tried.append(backend)
+            async with self._lease(backend):
+                try:
+                    response = await backend.http.post(path, json=json)
+                    response.raise_for_status()
+                    self._record_success(backend)
+                    self._remember(affinity, backend)
+                    return response
+                except Exception as e:
+                    if not self._is_retryable(e):
+                        raise
+                    self._record_failure(backend)
+                    if len(tried) >= self.capacity(model):
+                        raise
+
+    async def stream_lines(self, path: str, model: str, json: Dict[str, Any], affinity: str = None):
+        """
+        流式请求，逐行返回上游输出
+
+        收到第一行之前失败会换一个后端重试；已经开始输出后失败则直接抛出，避免重复内容。
+        """
+        tried = []
+        while True:
+            backend = self.pick(model, tried, affinity)
+            tried.append(backend)
+            started = False
+            async with self._lease(backend):
+                try:
+                    async with backend.http.stream("POST", path, json=json) as response:
+                        if response.status_code != 200:
+                            await response.aread()
+                            response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if line:
+                                started = True
+                            yield line
+                    self._record_success(backend)
+                    self._remember(affinity, backend)
+                    return
+                except Exception as e:
+                    if not self._is_retryable(e):
+                        raise
+                    self._record_failure(backend)
+                    if started or len(tried) >= self.capacity(model):
+                        raise
+
+    async def probe(self, backend: Backend) -> bool:
+        """
+        探测单个后端是否在线
+
+        探测结果只更新healthy，不影响请求失败计数：/models 正常不代表生成请求正常，
+        因请求失败被摘除的后端要等冷却结束、半开请求成功后才恢复
+        """
+        try:
+            response = await backend.http.get("/models", timeout=5)
+            response.raise_for_status()
+            backend.healthy = True
+        except Exception:
+            backend.healthy = False
+        return backend.healthy
+
+    async def probe_all(self) -> bool:
+        """探测所有后端，至少一个可用时返回True"""
+        results = [await self.probe(backend) for backend in self.backends]
+        return any(results)
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [backend.status() for backend in self.backends]
+
+
+def backends_from_env(host: str = None) -> List[Backend]:
+    """
+    根据环境变量创建后端列表
+
+    - OLLAMA_BACKENDS：逗号分隔的多个Ollama地址，例如 http://localhost:11434,http://localhost:11435
+    - 未设置时使用 OLLAMA_HOST（默认 http://localhost:11434）
+    - 设置了 LLM_API_KEY 时，统一大模型网关（LLM_API_BASE）作为 LLM_MODEL_NAME 模型的后端一并加入
+    """
+    if host:
+        hosts = [host]
+    else:
+        hosts = [h.strip() for h in os.getenv("OLLAMA_BACKENDS", "").split(",") if h.strip()]
+        hosts = hosts or [os.getenv("OLLAMA_HOST", "http://localhost:11434")]
+    backends = [Backend(f"{h.rstrip('/')}/v1", name=h) for h in hosts]
+
+    if not host and os.getenv("LLM_API_KEY"):
+        backends.append(Backend.from_llm_config({
+            "model_name": os.getenv("LLM_MODEL_NAME", "gpt-4o-mini"),
+            "provider": os.getenv("LLM_PROVIDER", "openai"),
+            "api_base": os.getenv("LLM_API_BASE", "http://205.185.126.106:3000/v1"),
+            "api_key": os.getenv("LLM_API_KEY")
+        }, name="unified_gateway"))
+    return backends
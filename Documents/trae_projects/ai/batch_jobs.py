@@ -0,0 +1,202 @@
+"""
+批量生成任务 - 为夜间批处理（例如为题库中每道题生成讲解）提供可恢复的批量调用
+
+- 批次和每条prompt的执行状态保存在SQLite中，网关重启后可以按批次ID继续执行未完成的部分
+- 以有限的并发执行，结果按完成顺序以NDJSON流式返回，每条结果带有其在批次中的序号
+- 待执行的prompt分页从数据库读取，结果队列有上限，内存占用与批次大小无关
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+
+class BatchStore:
+    """批次状态存储（SQLite，WAL模式）"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            "  id TEXT PRIMARY KEY, model TEXT, max_tokens INTEGER NOT NULL, temp REAL NOT NULL,"
+            "  total INTEGER NOT NULL, created REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS batch_items ("
+            "  batch_id TEXT NOT NULL, idx INTEGER NOT NULL, prompt TEXT NOT NULL,"
+            "  status TEXT NOT NULL DEFAULT 'pending', result TEXT, finished REAL,"
+            "  PRIMARY KEY (batch_id, idx));"
+        )
+        self._conn.commit()
+
+    def create(self, prompts: Iterable[str], model: str = None, max_tokens: int = 1024, temp: float = 0.7) -> str:
+        batch_id = uuid.uuid4().hex
+        rows = ((batch_id, idx, prompt) for idx, prompt in enumerate(prompts))
+        with self._conn:
+            self._conn.executemany("INSERT INTO batch_items (batch_id, idx, prompt) VALUES (?, ?, ?)", rows)
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM batch_items WHERE batch_id = ?", (batch_id,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO batches (id, model, max_tokens, temp, total, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (batch_id, model, max_tokens, temp, total, time.time())
+            )
+        return batch_id
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT id, model, max_tokens, temp, total, created FROM batches WHERE id = ?", (batch_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        counts = dict(self._conn.execute(
+            "SELECT status, COUNT(*) FROM batch_items WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ).fetchall())
+        return {
+            "batch_id": row[0],
+            "model": row[1],
+            "max_tokens": row[2],
+            "temp": row[3],
+            "total": row[4],
+            "created": row[5],
+            "pending": counts.get("pending", 0),
+            "completed": counts.get("ok", 0),
+            "failed": counts.get("error", 0)
+        }
+
+    def pending(self, batch_id: str, after: int = -1, limit: int = 500) -> List[tuple]:
+        """分页读取待执行的条目（按序号）"""
+        return self._conn.execute(
+            "SELECT idx, prompt FROM batch_items WHERE batch_id = ? AND status = 'pending' AND idx > ? "
+            "ORDER BY idx LIMIT ?",
+            (batch_id, after, limit)
+        ).fetchall()
+
+    def finished(self, batch_id: str):
+        """按序号遍历已完成（成功或失败）的结果"""
+        cursor = self._conn.execute(
+            "SELECT idx, status, result FROM batch_items WHERE batch_id = ? AND status != 'pending' ORDER BY idx",
+            (batch_id,)
+        )
+        for idx, status, result in cursor:
+            yield idx, status, json.loads(result)
+
+    def save_result(self, batch_id: str, idx: int, status: str, result: Dict[str, Any]):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE batch_items SET status = ?, result = ?, finished = ? WHERE batch_id = ? AND idx = ?",
+                (status, json.dumps(result, ensure_ascii=False), time.time(), batch_id, idx)
+            )
+
+    def retry_failed(self, batch_id: str) -> int:
+        """把失败的条目重新标记为待执行"""
+        with self._conn:
+            return self._conn.execute(
+                "UPDATE batch_items SET status = 'pending', result = NULL, finished = NULL "
+                "WHERE batch_id = ? AND status = 'error'",
+                (batch_id,)
+            ).rowcount
+
+
+def _line(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+async def run_batch(client, store: BatchStore, batch_id: str, concurrency: int = 4,
+                    include_finished: bool = False):
+    """
+    执行批次中所有待执行的条目，按完成顺序逐行输出NDJSON
+
+    输出依次为：批次信息行、（可选）已完成的历史结果、本次执行的结果、汇总行。
+    消费方断开时工作协程会被取消，未完成的条目保持pending，之后可以继续执行。
+    """
+    batch = store.get(batch_id)
+    yield _line({"object": "batch", **batch})
+
+    if include_finished:
+        for idx, status, result in store.finished(batch_id):
+            yield _line({"batch_id": batch_id, "index": idx, "status": status, **result})
+
+    queue = asyncio.Queue(maxsize=concurrency * 2)   # 待执行条目
+    results = asyncio.Queue(maxsize=concurrency * 2)  # 已完成结果，按完成顺序
+    done_marker = object()
+
+    async def feed():
+        try:
+            last = -1
+            while True:
+                page = store.pending(batch_id, after=last)
+                if not page:
+                    break
+                for item in page:
+                    await queue.put(item)
+                last = page[-1][0]
+            for _ in range(concurrency):
+                await queue.put(done_marker)
+        except Exception as e:
+            # 意外错误（例如数据库读取失败）交给输出流抛出，避免一直等待
+            await results.put(e)
+
+    async def work():
+        try:
+            while True:
+                item = await queue.get()
+                if item is done_marker:
+                    await results.put(done_marker)
+                    return
+                idx, prompt = item
+                try:
+                    response = await client.chat(prompt, batch["model"], batch["max_tokens"], batch["temp"])
+                    status, result = "ok", {
+                        "content": response["choices"][0]["message"]["content"],
+                        "usage": response["usage"]
+                    }
+                except Exception as e:
+                    status, result = "error", {"error": str(getattr(e, "detail", None) or e)}
+                store.save_result(batch_id, idx, status, result)
+                await results.put({"batch_id": batch_id, "index": idx, "status": status, **result})
+        except Exception as e:
+            await results.put(e)
+
+    tasks = [asyncio.ensure_future(feed())] + [asyncio.ensure_future(work()) for _ in range(concurrency)]
+    try:
+        running = concurrency
+        while running:
+            result = await results.get()
+            if result is done_marker:
+                running -= 1
+                continue
+            if isinstance(result, Exception):
+                raise result
+            yield _line(result)
+        summary = store.get(batch_id)
+        yield _line({"object": "batch.summary", "done": summary["pending"] == 0, **summary})
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def parse_jsonl_prompts(data: bytes) -> List[str]:
+    """解析JSONL上传：每行是 {"prompt": "..."} 对象或一个JSON字符串"""
+    prompts = []
+    for number, raw in enumerate(data.decode("utf-8").splitlines(), 1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第{number}行不是合法的JSON：{e}")
+        prompt = item.get("prompt") if isinstance(item, dict) else item
+        if not isinstance(prompt, str):
+            raise ValueError(f"第{number}行缺少prompt字段")
+        prompts.append(prompt)
+    return prompts
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近似最近邻基准测试 - IVF索引在不同nprobe下的召回率和查询吞吐
+
+以精确检索（全部向量做内积）的前k个结果为基准，计算IVF检索的 recall@k，
+同时输出建库/训练耗时、精确检索与各nprobe（以及默认nprobe）下的每秒查询数，以JSON输出。
+探测比例达到 ann_index.EXACT_SEARCH_FRACTION 时索引改用精确检索，结果中 exact_fallback 为 true。
+
+数据：
+- text：合成中英文文档（与 benchmark_retrieval.py 相同），用默认的哈希嵌入器嵌入
+- clustered：高斯混合分布的随机向量，生成速度快，适合测试百万级规模
+
+前 --train-fraction 比例的向量插入后训练聚类中心，其余向量增量插入，以同时验证增量插入后的召回率。
+
+用法：
+    python benchmark_ann.py --size 100000
+    python benchmark_ann.py --data clustered --size 1000000 --nprobes 1,4,16,64
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ann_index import EXACT_SEARCH_FRACTION, IVFIndex
+from benchmark_retrieval import CorpusGenerator
+from dense_index import HashingEmbedder
+
+
+def clustered_vectors(count: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    return centers[labels] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+
+
+def build_data(args):
+    """返回 (文档向量, 查询向量)"""
+    if args.data == "clustered":
+        rng = np.random.default_rng(args.seed)
+        vectors = clustered_vectors(args.size + args.queries, args.dim, args.clusters, rng)
+        return vectors[:args.size], vectors[args.size:]
+    generator = CorpusGenerator(seed=args.seed)
+    embedder = HashingEmbedder(args.dim)
+    vectors = np.empty((args.size, args.dim), dtype=np.float32)
+    for start in range(0, args.size, 10000):
+        count = min(10000, args.size - start)
+        vectors[start:start + count] = embedder.embed([generator.document() for _ in range(count)])
+    queries = embedder.embed([generator.query() for _ in range(args.queries)])
+    return vectors, queries
+
+
+def recall_at_k(expected, actual, k: int) -> float:
+    total = 0.0
+    for exact_hits, hits in zip(expected, actual):
+        exact_ids = {doc_id for doc_id, _ in exact_hits}
+        if exact_ids:
+            total += len(exact_ids & {doc_id for doc_id, _ in hits}) / min(k, len(exact_ids))
+        else:
+            total += 1.0
+    return total / len(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF近似最近邻索引召回率与吞吐基准测试")
+    parser.add_argument("--data", choices=["text", "clustered"], default="text")
+    parser.add_argument("--size", type=int, default=100000, help="文档（向量）数")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=1000, help="clustered 数据的真实簇数")
+    parser.add_argument("--nlist", type=int, default=None, help="聚类中心数，默认 sqrt(n)")
+    parser.add_argument("--nprobes", default="1,2,4,8,16,32,64")
+    parser.add_argument("--train-fraction", type=float, default=0.5, help="训练前插入的向量比例，其余增量插入")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果JSON的输出文件，默认只打印")
+    args = parser.parse_args()
+
+    vectors, queries = build_data(args)
+    index = IVFIndex(HashingEmbedder(args.dim), nlist=args.nlist, train_threshold=float("inf"))
+
+    split = max(1, int(len(vectors) * args.train_fraction))
+    start = time.perf_counter()
+    index.add_vectors(vectors[:split])
+    insert_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index.train()
+    train_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for offset in range(split, len(vectors), 10000):
+        index.add_vectors(vectors[offset:offset + 10000])
+    incremental_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact = index.search_exact(queries, args.top_k)
+    exact_seconds = time.perf_counter() - start
+
+    sweeps = []
+    # 第一项为默认nprobe
+    for nprobe in [None] + [int(n) for n in args.nprobes.split(",")]:
+        start = time.perf_counter()
+        approximate = index.search_vectors(queries, args.top_k, nprobe=nprobe)
+        elapsed = time.perf_counter() - start
+        effective = index.effective_nprobe(nprobe)
+        sweeps.append({
+            "nprobe": effective,
+            "default": nprobe is None,
+            "exact_fallback": effective >= EXACT_SEARCH_FRACTION * len(index._lists),
+            f"recall_at_{args.top_k}": round(recall_at_k(exact, approximate, args.top_k), 4),
+            "queries_per_second": round(len(queries) / elapsed, 2),
+            "speedup_vs_exact": round(exact_seconds / elapsed, 2)
+        })
+
+    report = {
+        "config": vars(args),
+        "index": index.stats(),
+        "insert_seconds": round(insert_seconds, 3),
+        "train_seconds": round(train_seconds, 3),
+        "incremental_insert_seconds": round(incremental_seconds, 3),
+        "exact_queries_per_second": round(len(queries) / exact_seconds, 2),
+        "ivf": sweeps
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+网关吞吐与延迟基准测试
+
+启动确定性的模拟上游（fake_ollama.py，可配置token速率和首token延迟）和网关（main:app），
+用N个并发客户端分别压测非流式（/api/model/chat）和流式（/api/model/chat/stream）接口，
+以JSON输出 p50/p95/p99 延迟、首token延迟（TTFT）和每秒请求数，便于在评审中发现 model_router 的性能回退。
+
+用法：
+    python benchmark_gateway.py --clients 50 --duration 10 --token-rate 50 --output bench.json
+    python benchmark_gateway.py --scenarios chat --repeat-prompts   # 测试相同prompt的请求合并
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+
+import httpx
+
+from benchmark_streaming import start_process, wait_until_ready
+
+
+def percentile(values, pct: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples, errors: int, elapsed: float) -> dict:
+    """汇总一个场景的结果"""
+    latencies = [s["latency"] for s in samples]
+    summary = {
+        "requests": len(samples),
+        "errors": errors,
+        "requests_per_second": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "latency_max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0
+    }
+    ttfts = [s["ttft"] for s in samples if s.get("ttft") is not None]
+    if ttfts:
+        summary.update({
+            "ttft_p50_ms": round(percentile(ttfts, 50) * 1000, 2),
+            "ttft_p95_ms": round(percentile(ttfts, 95) * 1000, 2),
+            "ttft_p99_ms": round(percentile(ttfts, 99) * 1000, 2)
+        })
+    tokens = sum(s.get("tokens", 0) for s in samples)
+    if tokens:
+        summary["tokens_per_second"] = round(tokens / elapsed, 2)
+    return summary
+
+
+async def chat_request(client: httpx.AsyncClient, prompt: str) -> dict:
+    start = time.perf_counter()
+    response = await client.post("/api/model/chat", json={"prompt": prompt})
+    response.raise_for_status()
+    usage = response.json().get("usage", {})
+    return {"latency": time.perf_counter() - start, "tokens": usage.get("completion_tokens", 0)}
+
+
+async def stream_request(client: httpx.AsyncClient, prompt: str) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    tokens = 0
+    async with client.stream("POST", "/api/model/chat/stream", json={"prompt": prompt}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(chunk["error"]["message"])
+            if chunk["choices"][0]["delta"].get("content"):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                tokens += 1
+    return {"latency": time.perf_counter() - start, "ttft": ttft, "tokens": tokens}
+
+
+async def run_scenario(gateway_url: str, scenario: str, clients: int, duration: float,
+                       repeat_prompts: bool) -> dict:
+    """N个客户端在duration秒内循环发送请求（闭环压测）"""
+    request = chat_request if scenario == "chat" else stream_request
+    samples = []
+    errors = 0
+    counter = iter(range(10 ** 9))
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=gateway_url, limits=limits, timeout=300) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                # 默认每个请求的prompt都不同，避免被请求合并和响应缓存命中
+                prompt = "基准测试问题" if repeat_prompts else f"基准测试问题 {scenario} {next(counter)}"
+                try:
+                    samples.append(await request(client, prompt))
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    return summarize(samples, errors, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网关吞吐与延迟基准测试")
+    parser.add_argument("--clients", type=int, default=50, help="并发客户端数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每个场景的持续时间（秒）")
+    parser.add_argument("--scenarios", default="chat,stream", help="逗号分隔：chat、stream")
+    parser.add_argument("--tokens", type=int, default=32, help="模拟上游每次回复的token数")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="模拟上游每秒生成的token数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟上游首token延迟（秒）")
+    parser.add_argument("--max-concurrency-per-model", type=int, default=None,
+                        help="网关按模型的并发上限，默认不限制（等于客户端数）")
+    parser.add_argument("--repeat-prompts", action="store_true", help="所有请求使用相同的prompt")
+    parser.add_argument("--fake-port", type=int, default=11510)
+    parser.add_argument("--gateway-port", type=int, default=8795)
+    parser.add_argument("--output", help="结果JSON的输出文件，默认只打印")
+    args = parser.parse_args()
+
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    gateway_url = f"http://127.0.0.1:{args.gateway_port}"
+    config = {
+        "clients": args.clients,
+        "duration_seconds": args.duration,
+        "upstream_tokens": args.tokens,
+        "upstream_token_rate": args.token_rate,
+        "upstream_latency_seconds": args.latency,
+        "max_concurrency_per_model": args.max_concurrency_per_model or args.clients,
+        "repeat_prompts": args.repeat_prompts
+    }
+
+    fake = start_process([
+        "fake_ollama.py",
+        "--port", str(args.fake_port),
+        "--tokens", str(args.tokens),
+        "--token-delay", str(1.0 / args.token_rate),
+        "--first-token-latency", str(args.latency)
+    ])
+    gateway = None
+    try:
+        wait_until_ready(f"{fake_url}/v1/models")
+        env = dict(
+            os.environ,
+            OLLAMA_HOST=fake_url,
+            OLLAMA_MAX_CONCURRENCY_PER_MODEL=str(config["max_concurrency_per_model"])
+        )
+        # 网关只使用 fake_ollama 一个后端：不读取多后端列表，也不加入统一大模型网关
+        for name in ("OLLAMA_BACKENDS", "LLM_API_KEY", "LLM_API_BASE"):
+            env.pop(name, None)
+        gateway = start_process(
+            ["-m", "uvicorn", "main:app", "--port", str(args.gateway_port), "--log-level", "warning"],
+            env=env
+        )
+        wait_until_ready(f"{gateway_url}/health/ready")
+
+        results = {}
+        for scenario in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            if scenario not in ("chat", "stream"):
+                raise SystemExit(f"未知场景：{scenario}")
+            results[scenario] = asyncio.run(
+                run_scenario(gateway_url, scenario, args.clients, args.duration, args.repeat_prompts)
+            )
+
+        report = {"config": config, "scenarios": results}
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        print(output)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+    finally:
+        for process in (gateway, fake):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RAG检索质量与性能基准测试 - 用带标注的查询集对比 SimpleVectorDB 的各个检索后端
+
+对每个后端测量：
+- 检索质量：recall@k（相关文档出现在前k个结果中的比例）、MRR（第一个相关文档排名的倒数的平均值）
+- 性能：建库时间、每秒查询数、查询延迟p50/p99、峰值常驻内存（每个后端在单独的子进程中运行）
+
+查询集可以从文件加载，也可以合成：从合成文档（见 benchmark_retrieval.CorpusGenerator）中
+按词的稀有程度抽取2~4个词作为查询，该文档即为相关文档（已知条目检索）。
+"hybrid" 表示 bm25 + 稠密索引的RRF混合检索。结果为每行一个（文档数, 后端）的表格，输出JSON或CSV。
+
+用法：
+    python benchmark_rag.py
+    python benchmark_rag.py --sizes 10000,100000 --backends bm25,dense,ivf,hybrid --format csv
+    python benchmark_rag.py --documents docs.jsonl --queries-file queries.jsonl
+
+数据文件格式（JSONL）：
+    documents：{"id": "doc-1", "content": "..."}，id 可省略（默认为行号，从0开始）
+    queries：{"query": "...", "relevant": ["doc-1", ...]}
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+import argparse
+import csv
+import io
+import json
+import random
+import shutil
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，不统计峰值内存
+    resource = None
+
+from benchmark_retrieval import CorpusGenerator, percentile
+from rag_demo import SimpleVectorDB
+
+BACKENDS = ("linear", "bm25", "tfidf", "dense", "ivf", "disk", "hybrid")
+COLUMNS = [
+    "documents", "backend", "recall_at_k", "mrr", "build_seconds", "queries_per_second",
+    "latency_p50_ms", "latency_p99_ms", "peak_rss_mb", "index_rss_mb"
+]
+
+# 一条标注查询：(查询文本, 相关文档在 documents 中的下标集合)
+LabeledQuery = Tuple[str, List[int]]
+
+
+def synthetic_dataset(size: int, query_count: int, vocabulary: int = 50000,
+                      seed: int = 42) -> Tuple[List[str], List[LabeledQuery]]:
+    """生成合成文档和已知条目查询（查询词从目标文档中抽取，越稀有的词越容易被抽中）"""
+    generator = CorpusGenerator(vocabulary, seed)
+    rank = {word: i for i, word in enumerate(generator.vocabulary)}
+    rng = random.Random(seed + 1)
+    documents, word_lists = [], []
+    for _ in range(size):
+        words = generator.words(rng.randint(8, 40))
+        documents.append(" ".join(words))
+        word_lists.append(words)
+    queries = []
+    for _ in range(query_count):
+        target = rng.randrange(size)
+        distinct = set(word_lists[target])
+        # 按稀有程度加权的无放回抽样：键为 u^(1/权重)，取最大的几个
+        keyed = sorted(distinct, key=lambda word: rng.random() ** (1.0 / (rank[word] + 1)), reverse=True)
+        queries.append((" ".join(keyed[:rng.randint(2, 4)]), [target]))
+    return documents, queries
+
+
+def load_dataset(documents_path: str, queries_path: str) -> Tuple[List[str], List[LabeledQuery]]:
+    documents, positions = [], {}
+    with open(documents_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                positions[str(record.get("id", len(documents)))] = len(documents)
+                documents.append(record["content"])
+    queries = []
+    with open(queries_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                relevant = [positions[str(doc_id)] for doc_id in record["relevant"] if str(doc_id) in positions]
+                queries.append((record["query"], relevant))
+    return documents, queries
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return None
+    # Linux 上 ru_maxrss 的单位是KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def quality(ranked: List[List[int]], queries: List[LabeledQuery], top_k: int) -> Dict[str, float]:
+    """计算 recall@k 和 MRR（只看前k个结果）"""
+    recall_total = reciprocal_total = 0.0
+    for ids, (_, relevant) in zip(ranked, queries):
+        relevant = set(relevant)
+        if not relevant:
+            continue
+        top = ids[:top_k]
+        recall_total += len(relevant.intersection(top)) / len(relevant)
+        for position, doc_id in enumerate(top, 1):
+            if doc_id in relevant:
+                reciprocal_total += 1.0 / position
+                break
+    return {
+        "recall_at_k": round(recall_total / len(queries), 4),
+        "mrr": round(reciprocal_total / len(queries), 4)
+    }
+
+
+def run_backend(backend: str, documents: List[str], queries: List[LabeledQuery], top_k: int) -> Dict[str, Any]:
+    """在当前进程中建库并执行全部查询（由 main 放到单独的子进程中运行，以便统计峰值内存）"""
+    baseline_rss = _peak_rss_mb()
+    path = tempfile.mkdtemp(prefix="rag-bench-") if backend == "disk" else None
+    try:
+        if backend == "hybrid":
+            db, mode = SimpleVectorDB("bm25", hybrid=True), "hybrid"
+        elif backend == "disk":
+            db, mode = SimpleVectorDB("disk", path=path), None
+        else:
+            db, mode = SimpleVectorDB(backend), None
+
+        start = time.perf_counter()
+        for offset in range(0, len(documents), 1000):
+            db.add_documents([{"content": content} for content in documents[offset:offset + 1000]])
+        if backend == "disk":
+            db.index.flush()
+            db.index.wait_for_compaction()
+        # 倒排索引的idf和归一化因子在第一次查询时计算，计入建库时间
+        db.search(queries[0][0], top_k, mode=mode)
+        build_seconds = time.perf_counter() - start
+
+        ranked, latencies = [], []
+        start = time.perf_counter()
+        for query, _ in queries:
+            query_start = time.perf_counter()
+            results = db.search(query, top_k, mode=mode)
+            latencies.append(time.perf_counter() - query_start)
+            ranked.append([result["document"]["id"] for result in results])
+        elapsed = time.perf_counter() - start
+        db.close()
+    finally:
+        if path:
+            shutil.rmtree(path, ignore_errors=True)
+
+    peak_rss = _peak_rss_mb()
+    row = {
+        "documents": len(documents),
+        "backend": backend,
+        **quality(ranked, queries, top_k),
+        "build_seconds": round(build_seconds, 3),
+        "queries_per_second": round(len(queries) / elapsed, 2),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+        # 子进程收到数据集后的峰值内存作为基线，差值近似为索引（含建库过程）占用的内存
+        "index_rss_mb": round(peak_rss - baseline_rss, 1) if peak_rss is not None else None
+    }
+    return row
+
+
+def format_table(rows: List[Dict[str, Any]], fmt: str) -> str:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=COLUMNS, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().rstrip("\n")
+    return json.dumps(rows, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG检索后端的质量与性能基准测试")
+    parser.add_argument("--sizes", default="10000,100000", help="逗号分隔的合成文档数")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="逗号分隔的检索后端")
+    parser.add_argument("--linear-max", type=int, default=10000, help="linear 后端测试的最大文档数")
+    parser.add_argument("--queries", type=int, default=200, help="合成查询数")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--vocabulary", type=int, default=50000, help="合成词表大小")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--documents", help="文档JSONL文件（与 --queries-file 一起使用，替代合成数据）")
+    parser.add_argument("--queries-file", help="标注查询JSONL文件")
+    parser.add_argument("--format", default="json", choices=["json", "csv"])
+    parser.add_argument("--output", help="结果的输出文件，默认只打印")
+    args = parser.parse_args()
+
+    if bool(args.documents) != bool(args.queries_file):
+        parser.error("--documents 和 --queries-file 需要同时指定")
+    backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    for backend in backends:
+        if backend not in BACKENDS:
+            parser.error(f"不支持的后端：{backend}，可选：{', '.join(BACKENDS)}")
+
+    if args.documents:
+        datasets = [load_dataset(args.documents, args.queries_file)]
+    else:
+        sizes = [int(size) for size in args.sizes.split(",")]
+        datasets = (synthetic_dataset(size, args.queries, args.vocabulary, args.seed) for size in sizes)
+
+    rows = []
+    for documents, queries in datasets:
+        for backend in backends:
+            if backend == "linear" and len(documents) > args.linear_max:
+                continue
+            # 每个后端一个新的子进程，峰值内存互不影响
+            with ProcessPoolExecutor(1) as pool:
+                rows.append(pool.submit(run_backend, backend, documents, queries, args.top_k).result())
+
+    output = format_table(rows, args.format)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检索基准测试 - 对比 SimpleVectorDB 各检索后端的建库时间和查询吞吐
+
+生成中英文混合的合成文档（词频服从Zipf分布），分别在 10k / 100k / 1M 篇文档上
+测量建库耗时、每秒查询数和单次查询延迟，以JSON输出。
+线性扫描（linear）在大规模下过慢，默认只在不超过 --linear-max 篇文档时测试。
+磁盘索引（disk）建在临时目录中，测试结束后删除。
+
+用法：
+    python benchmark_retrieval.py
+    python benchmark_retrieval.py --sizes 10000,100000 --backends bm25,tfidf --queries 200
+"""
+
+import argparse
+import itertools
+import json
+import random
+import shutil
+import tempfile
+import time
+
+from rag_demo import SimpleVectorDB
+
+ENGLISH_WORDS = [
+    "python", "java", "function", "variable", "equation", "matrix", "vector", "energy", "force", "cell",
+    "history", "grammar", "reading", "essay", "algebra", "geometry", "probability", "theorem", "proof", "lesson"
+]
+CHINESE_CHARS = "学习数学物理化学生命历史地理语文英语函数方程几何概率向量能量细胞语法阅读作文定理证明课程练习考试复习知识"
+
+
+def build_vocabulary(size: int, seed: int) -> list:
+    """生成中英文混合词表：英文词加编号，中文词由2~3个汉字组成"""
+    rng = random.Random(seed)
+    vocabulary = set()
+    while len(vocabulary) < size:
+        if rng.random() < 0.5:
+            vocabulary.add(f"{rng.choice(ENGLISH_WORDS)}{rng.randrange(size)}")
+        else:
+            vocabulary.add("".join(rng.choice(CHINESE_CHARS) for _ in range(rng.randint(2, 3))))
+    return sorted(vocabulary)
+
+
+class CorpusGenerator:
+    """按Zipf分布从词表中抽词，生成合成文档和查询"""
+
+    def __init__(self, vocabulary_size: int = 50000, seed: int = 42):
+        self.vocabulary = build_vocabulary(vocabulary_size, seed)
+        self.cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, vocabulary_size + 1)))
+        self.rng = random.Random(seed)
+
+    def words(self, count: int) -> list:
+        return self.rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=count)
+
+    def document(self, min_words: int = 8, max_words: int = 40) -> str:
+        return " ".join(self.words(self.rng.randint(min_words, max_words)))
+
+    def query(self) -> str:
+        return " ".join(self.words(self.rng.randint(2, 4)))
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_backend(backend: str, documents: list, queries: list, top_k: int) -> dict:
+    path = tempfile.mkdtemp(prefix="retrieval-bench-") if backend == "disk" else None
+    try:
+        db = SimpleVectorDB(backend, path=path) if path else SimpleVectorDB(backend)
+        start = time.perf_counter()
+        for offset in range(0, len(documents), 1000):
+            db.add_documents([{"content": content} for content in documents[offset:offset + 1000]])
+        if backend == "disk":
+            db.index.flush()
+            db.index.wait_for_compaction()
+        # 倒排索引的idf和归一化因子在第一次查询时计算，计入建库时间
+        db.search(queries[0], top_k)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        start = time.perf_counter()
+        for query in queries:
+            query_start = time.perf_counter()
+            db.search(query, top_k)
+            latencies.append(time.perf_counter() - query_start)
+        elapsed = time.perf_counter() - start
+
+        # 批量查询（稠密后端为一次矩阵乘法，其他后端逐个查询）
+        start = time.perf_counter()
+        db.search_batch(queries, top_k)
+        batch_elapsed = time.perf_counter() - start
+
+        result = {
+            "build_seconds": round(build_seconds, 3),
+            "queries": len(queries),
+            "queries_per_second": round(len(queries) / elapsed, 2),
+            "batch_queries_per_second": round(len(queries) / batch_elapsed, 2),
+            "latency_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "latency_p99_ms": round(percentile(latencies, 99) * 1000, 3)
+        }
+        if db.index is not None:
+            result["index"] = db.index.stats()
+        db.close()
+    finally:
+        if path:
+            shutil.rmtree(path, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SimpleVectorDB 检索后端基准测试")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="逗号分隔的文档数")
+    parser.add_argument("--backends", default=",".join(SimpleVectorDB.BACKENDS), help="逗号分隔的检索后端")
+    parser.add_argument("--linear-max", type=int, default=10000, help="linear 后端测试的最大文档数")
+    parser.add_argument("--queries", type=int, default=100, help="每个后端的查询数")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--vocabulary", type=int, default=50000, help="合成词表大小")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果JSON的输出文件，默认只打印")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    report = {"config": vars(args), "results": {}}
+
+    for size in sizes:
+        generator = CorpusGenerator(args.vocabulary, args.seed)
+        documents = [generator.document() for _ in range(size)]
+        queries = [generator.query() for _ in range(args.queries)]
+        results = {}
+        for backend in backends:
+            if backend == "linear" and size > args.linear_max:
+                results[backend] = {"skipped": f"文档数超过 --linear-max={args.linear_max}"}
+                continue
+            results[backend] = run_backend(backend, documents, queries, args.top_k)
+        report["results"][str(size)] = results
+        del documents
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
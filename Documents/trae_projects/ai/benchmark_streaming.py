@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发流式压测：验证网关的并发流数量可以超过FastAPI线程池上限（默认40）
+
+流程：
+1. 启动本地模拟Ollama服务（fake_ollama.py）
+2. 启动网关（main:app），通过OLLAMA_HOST指向模拟服务
+3. 同时发起N个 /api/model/chat/stream 请求，并在压测期间探测 /health 延迟
+
+同步实现下每个流占用一个线程，N个流至少需要 ceil(N/40) 轮；
+异步实现下总耗时应接近单个流的耗时。
+
+用法：
+    python benchmark_streaming.py --streams 200 --tokens 20 --token-delay 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+THREADPOOL_LIMIT = 40
+
+
+def start_process(args, env=None):
+    """在子进程中启动服务"""
+    return subprocess.Popen(
+        [sys.executable] + args,
+        cwd=BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def wait_until_ready(url: str, timeout: float = 30.0):
+    """轮询直到服务可用"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务启动超时：{url}")
+
+
+async def run_stream(client: httpx.AsyncClient, index: int) -> dict:
+    """发起一个流式请求，记录首块时间和总耗时"""
+    start = time.perf_counter()
+    first_chunk = None
+    chunks = 0
+    async with client.stream("POST", "/api/model/chat/stream", json={"prompt": f"问题{index}"}) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+            chunks += 1
+    return {"ttft": first_chunk or 0.0, "latency": time.perf_counter() - start, "chunks": chunks}
+
+
+async def probe_health(client: httpx.AsyncClient, stop: asyncio.Event) -> list:
+    """压测期间持续探测 /health 的响应时间"""
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+    return latencies
+
+
+async def run_benchmark(gateway_url: str, streams: int) -> dict:
+    limits = httpx.Limits(max_connections=streams + 10, max_keepalive_connections=streams + 10)
+    async with httpx.AsyncClient(base_url=gateway_url, limits=limits, timeout=300) as client:
+        stop = asyncio.Event()
+        health_task = asyncio.create_task(probe_health(client, stop))
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run_stream(client, i) for i in range(streams)))
+        wall = time.perf_counter() - start
+        stop.set()
+        health = await health_task
+    latencies = sorted(r["latency"] for r in results)
+    return {
+        "wall_time": wall,
+        "results": results,
+        "latency_p50": latencies[len(latencies) // 2],
+        "latency_max": latencies[-1],
+        "health_max": max(health) if health else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网关并发流式压测")
+    parser.add_argument("--streams", type=int, default=200, help="并发流数量")
+    parser.add_argument("--tokens", type=int, default=20, help="每个流的token数")
+    parser.add_argument("--token-delay", type=float, default=0.1, help="token间隔（秒）")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="首token延迟（秒）")
+    parser.add_argument("--fake-port", type=int, default=11500)
+    parser.add_argument("--gateway-port", type=int, default=8790)
+    args = parser.parse_args()
+
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    gateway_url = f"http://127.0.0.1:{args.gateway_port}"
+
+    fake = start_process([
+        "fake_ollama.py",
+        "--port", str(args.fake_port),
+        "--tokens", str(args.tokens),
+        "--token-delay", str(args.token_delay),
+        "--first-token-latency", str(args.first_token_latency)
+    ])
+    gateway = None
+    try:
+        wait_until_ready(f"{fake_url}/v1/models")
+        # 模拟服务没有并行上限，放开按模型的并发限制，只测网关本身
+        env = dict(os.environ, OLLAMA_HOST=fake_url, OLLAMA_MAX_CONCURRENCY_PER_MODEL=str(args.streams))
+        gateway = start_process(
+            ["-m", "uvicorn", "main:app", "--port", str(args.gateway_port), "--log-level", "warning"],
+            env=env
+        )
+        wait_until_ready(f"{gateway_url}/health")
+
+        summary = asyncio.run(run_benchmark(gateway_url, args.streams))
+
+        single_stream = args.first_token_latency + args.tokens * args.token_delay
+        threadpool_bound = math.ceil(args.streams / THREADPOOL_LIMIT) * single_stream
+        report = {
+            "streams": args.streams,
+            "single_stream_seconds": round(single_stream, 3),
+            "wall_time_seconds": round(summary["wall_time"], 3),
+            "threadpool_bound_seconds": round(threadpool_bound, 3),
+            "speedup_vs_threadpool": round(threadpool_bound / summary["wall_time"], 2),
+            "latency_p50_seconds": round(summary["latency_p50"], 3),
+            "latency_max_seconds": round(summary["latency_max"], 3),
+            "health_max_seconds": round(summary["health_max"], 3),
+            "incomplete_streams": sum(1 for r in summary["results"] if r["chunks"] < args.tokens + 1)
+        }
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        for process in (gateway, fake):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分词器微基准测试 - 对比 tokenizer.Tokenizer 与原来的逐字符分词实现
+
+用示例文档的句子和合成的中英文文档拼出约10MB的语料，测量：
+- 原实现（正则清洗 + 逐字符循环拼接字符串）
+- 新分词器（单次正则扫描 + 汉字二元组），逐条和批量
+- 带词典的正向最大匹配分词
+- 重复查询命中LRU缓存时的耗时
+
+用法：
+    python benchmark_tokenizer.py
+    python benchmark_tokenizer.py --size-mb 50 --dictionary dict.txt
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict
+
+from benchmark_retrieval import CorpusGenerator
+from rag_demo import load_documents
+from tokenizer import Tokenizer, load_dictionary
+
+# 没有提供词典文件时使用的示例词典
+SAMPLE_DICTIONARY = [
+    "编程语言", "面向对象", "函数式编程", "数据科学", "人工智能", "前端开发", "后端开发", "移动应用",
+    "企业级应用", "系统编程", "嵌入式系统", "高性能计算", "云原生", "微服务", "分布式系统", "设计目标",
+    "数学", "物理", "化学", "函数", "方程", "几何", "概率", "向量", "能量", "细胞", "语法", "阅读", "作文"
+]
+
+
+def legacy_generate_vector(text: str) -> Dict[str, int]:
+    """原来的 SimpleVectorDB._generate_vector 实现（用于对比）"""
+    text = text.lower()
+    text = re.sub(r'[^a-zA-Z0-9\u4e00-\u9fa5\s]', '', text)
+    words = []
+    current_word = ""
+    for char in text:
+        if char.isspace():
+            if current_word:
+                words.append(current_word)
+                current_word = ""
+        elif char.isalpha() or char.isdigit():
+            current_word += char
+        else:
+            if current_word:
+                words.append(current_word)
+                current_word = ""
+            words.append(char)
+    if current_word:
+        words.append(current_word)
+    vector = {}
+    for word in words:
+        if word not in vector:
+            vector[word] = 0
+        vector[word] += 1
+    return vector
+
+
+def build_corpus(size_mb: float, seed: int) -> list:
+    """示例文档的句子随机组合，与合成文档交替，直到总大小达到 size_mb"""
+    rng = random.Random(seed)
+    sentences = [s + "。" for doc in load_documents() for s in doc["content"].split("。") if s]
+    generator = CorpusGenerator(vocabulary_size=5000, seed=seed)
+    corpus, total = [], 0
+    limit = size_mb * 1024 * 1024
+    while total < limit:
+        if len(corpus) % 2:
+            text = generator.document()
+        else:
+            text = "".join(rng.choice(sentences) for _ in range(rng.randint(2, 5)))
+        corpus.append(text)
+        total += len(text.encode("utf-8"))
+    return corpus
+
+
+def timed(function, *args, repeat: int = 3) -> float:
+    """重复执行取最短耗时，减少机器负载波动的影响"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分词器微基准测试")
+    parser.add_argument("--size-mb", type=float, default=10.0, help="语料大小（MB）")
+    parser.add_argument("--dictionary", help="词典文件（每行一个词），默认使用内置示例词典")
+    parser.add_argument("--queries", type=int, default=100000, help="重复查询测试的查询次数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size_mb, args.seed)
+    megabytes = sum(len(text.encode("utf-8")) for text in corpus) / 1024 / 1024
+    tokenizer = Tokenizer()
+    dictionary = load_dictionary(args.dictionary) if args.dictionary else SAMPLE_DICTIONARY
+    dictionary_tokenizer = Tokenizer(dictionary)
+
+    results = {
+        "legacy": timed(lambda: [legacy_generate_vector(text) for text in corpus]),
+        "tokenizer": timed(lambda: [Counter(tokenizer.tokenize(text)) for text in corpus]),
+        "tokenizer_batch": timed(tokenizer.counts_batch, corpus),
+        "tokenizer_dictionary_batch": timed(dictionary_tokenizer.counts_batch, corpus)
+    }
+    report = {
+        "corpus_mb": round(megabytes, 2),
+        "texts": len(corpus),
+        "dictionary_words": len(dictionary),
+        "results": {
+            name: {
+                "seconds": round(seconds, 3),
+                "mb_per_second": round(megabytes / seconds, 2),
+                "speedup_vs_legacy": round(results["legacy"] / seconds, 2)
+            }
+            for name, seconds in results.items()
+        }
+    }
+
+    # 重复查询：少量不同的查询字符串反复出现，命中LRU缓存
+    rng = random.Random(args.seed)
+    generator = CorpusGenerator(vocabulary_size=5000, seed=args.seed)
+    distinct = [generator.query() for _ in range(1000)]
+    queries = [rng.choice(distinct) for _ in range(args.queries)]
+    legacy_seconds = timed(lambda: [legacy_generate_vector(query) for query in queries])
+    cached_seconds = timed(lambda: [tokenizer.counts(query) for query in queries], repeat=1)
+    info = tokenizer.cache_info()
+    report["repeated_queries"] = {
+        "queries": len(queries),
+        "distinct": len(distinct),
+        "legacy_us_per_query": round(legacy_seconds / len(queries) * 1e6, 3),
+        "cached_us_per_query": round(cached_seconds / len(queries) * 1e6, 3),
+        "cache_hit_rate": round(info.hits / (info.hits + info.misses), 4)
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+对话会话 - 在网关侧保存多轮对话历史
+
+- 每个会话的system提示固定不变并始终放在最前面，历史消息只在末尾追加，
+  这样连续两轮请求的前缀完全相同，Ollama可以复用上一轮的KV缓存
+- 历史超过token上限时按块裁剪（一次裁掉一半），而不是每轮裁掉一条，
+  避免前缀每轮都变化导致KV缓存失效
+- 每轮记录复用的prompt token数：优先取上游的cached_tokens，否则按与上一轮请求的公共前缀估算，
+  估算值按本地估算的prompt大小与上游prompt_tokens的比例换算成上游的token单位
+- 同一会话的多轮请求串行执行：从读取历史到记录本轮回复期间持有会话的锁，
+  并发请求依次排队，不会基于同一份历史生成、也不会交错写入历史
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import asyncio
+import time
+import uuid
+
+from model_metrics import estimate_tokens
+
+# 默认system提示（保持固定，不要放入时间等会变化的内容，否则无法复用KV缓存）
+DEFAULT_SYSTEM_PROMPT = "你是一名专业的学科辅导讲师，能够针对学生的问题提供详细的解答和讲解。"
+
+# 每条消息的角色标记等额外开销（token）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    """估算单条消息的token数"""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class ChatSession:
+    """对话会话数据结构"""
+    id: str
+    system: str
+    model: str = None
+    history: List[Dict[str, str]] = field(default_factory=list)  # 不含system的历史消息
+    last_sent: List[Dict[str, str]] = field(default_factory=list)  # 上一轮发送的消息及模型回复
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+    turns: int = 0
+    prompt_tokens_total: int = 0
+    prompt_tokens_reused_total: int = 0
+    # 从构造本轮消息到记录回复期间持有，保证同一会话的轮次串行
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False, compare=False)
+
+
+class ChatSessionStore:
+    """进程内会话存储，按最近使用淘汰，超过TTL未使用的会话自动过期"""
+
+    def __init__(self, max_sessions: int = 1000, max_history_tokens: int = 3000, ttl: float = 3600):
+        self.max_sessions = max_sessions
+        self.max_history_tokens = max_history_tokens
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # 会话ID -> ChatSession
+
+    def create(self, system: str = None, model: str = None) -> ChatSession:
+        session = ChatSession(id=uuid.uuid4().hex, system=system or DEFAULT_SYSTEM_PROMPT, model=model)
+        self._sessions[session.id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if session.updated + self.ttl < time.time():
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def build_messages(self, session: ChatSession, user_message: str) -> List[Dict[str, str]]:
+        """构造本轮请求的消息：固定的system前缀 + 历史 + 新的用户消息"""
+        self._trim(session)
+        return (
+            [{"role": "system", "content": session.system}]
+            + session.history
+            + [{"role": "user", "content": user_message}]
+        )
+
+    def record_turn(self, session: ChatSession, messages: List[Dict[str, str]], reply: str,
+                    usage: Dict[str, Any]) -> int:
+        """
+        记录一轮对话，并在usage中写入prompt_tokens_reused
+
+        Returns:
+            本轮复用的prompt token数
+        """
+        prompt_tokens = usage.get("prompt_tokens")
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached is not None:
+            reused = cached
+        else:
+            reused = self._common_prefix_tokens(session.last_sent, messages)
+            # 公共前缀是本地估算的token数，按比例换算成上游prompt_tokens的单位
+            estimated = sum(message_tokens(m) for m in messages)
+            if prompt_tokens and estimated:
+                reused = round(reused * prompt_tokens / estimated)
+        if prompt_tokens is not None:
+            reused = min(reused, prompt_tokens)
+        usage["prompt_tokens_reused"] = reused
+
+        assistant_message = {"role": "assistant", "content": reply}
+        session.history.extend([messages[-1], assistant_message])
+        session.last_sent = messages + [assistant_message]
+        session.turns += 1
+        session.prompt_tokens_total += usage.get("prompt_tokens", 0)
+        session.prompt_tokens_reused_total += reused
+        session.updated = time.time()
+        return reused
+
+    def _trim(self, session: ChatSession):
+        """历史超过上限时从最早的一轮开始裁剪，直到不超过上限的一半"""
+        total = sum(message_tokens(m) for m in session.history)
+        if total <= self.max_history_tokens:
+            return
+        target = self.max_history_tokens // 2
+        while session.history and total > target:
+            # 按轮（用户+助手）成对裁剪，保证历史以用户消息开头
+            for message in session.history[:2]:
+                total -= message_tokens(message)
+            del session.history[:2]
+
+    @staticmethod
+    def _common_prefix_tokens(previous: List[Dict[str, str]], current: List[Dict[str, str]]) -> int:
+        """上一轮请求（含回复）与本轮请求的公共前缀token数，即上游KV缓存可复用的部分"""
+        total = 0
+        for old, new in zip(previous, current):
+            if old != new:
+                break
+            total += message_tokens(new)
+        return total
+
+    def describe(self, session: ChatSession, include_history: bool = False) -> Dict[str, Any]:
+        data = {
+            "session_id": session.id,
+            "model": session.model,
+            "system": session.system,
+            "turns": session.turns,
+            "history_messages": len(session.history),
+            "history_tokens": sum(message_tokens(m) for m in session.history),
+            "prompt_tokens_total": session.prompt_tokens_total,
+            "prompt_tokens_reused_total": session.prompt_tokens_reused_total,
+            "created": session.created,
+            "updated": session.updated
+        }
+        if include_history:
+            data["history"] = session.history
+        return data
@@ -0,0 +1,157 @@
+"""
+稠密向量索引 - 用NumPy矩阵运算做向量检索
+
+- 嵌入器可替换：实现 dim 属性和 embed(texts) -> float32矩阵 即可；
+  默认的 HashingEmbedder 用哈希技巧把词和汉字二元组映射到固定维度，不需要联网
+- 向量在插入时做L2归一化，连续存放在一个float32矩阵中（容量按倍数扩展），
+  内积即余弦相似度
+- 单个查询：一次矩阵-向量乘法 + argpartition 选前k个；多个查询：一次矩阵乘法（GEMM）
+"""
+
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+import math
+import re
+import zlib
+
+import numpy as np
+
+from tokenizer import WORD_PATTERN
+
+_CJK_PATTERN = re.compile(r"[\u4e00-\u9fff\u3400-\u4dbf]")
+
+
+def hashing_features(text: str) -> List[str]:
+    """英文/数字按词切分，中文取单字和相邻二元组"""
+    features = []
+    for piece in WORD_PATTERN.findall(text.lower()):
+        if _CJK_PATTERN.match(piece):
+            features.extend(piece)
+            features.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+        else:
+            features.append(piece)
+    return features
+
+
+class HashingEmbedder:
+    """哈希技巧嵌入器：特征哈希到dim维，另取一位哈希决定符号以减少冲突带来的偏差"""
+
+    def __init__(self, dim: int = 256, features: Callable[[str], List[str]] = hashing_features):
+        self.dim = dim
+        self.features = features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in self.features(text):
+                counts[feature] = counts.get(feature, 0) + 1
+            columns, weights = [], []
+            for feature, count in counts.items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                # 次线性词频，避免高频词主导向量
+                weight = 1.0 + math.log(count)
+                columns.append(h % self.dim)
+                weights.append(weight if (h >> 31) & 1 else -weight)
+            np.add.at(matrix[row], columns, weights)
+        return matrix
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class DenseIndex:
+    """基于NumPy矩阵的精确向量检索"""
+
+    def __init__(self, embedder=None, initial_capacity: int = 1024):
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self._matrix = np.empty((initial_capacity, self.dim), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """已插入的向量（连续内存的视图，不复制）"""
+        return self._matrix[:self._size]
+
+    def _reserve(self, count: int):
+        needed = self._size + count
+        if needed <= len(self._matrix):
+            return
+        capacity = max(needed, len(self._matrix) * 2)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def add_vectors(self, vectors: np.ndarray) -> List[int]:
+        """插入已经嵌入好的向量（插入时归一化），返回文档ID"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self._reserve(len(vectors))
+        start = self._size
+        self._matrix[start:start + len(vectors)] = _normalize(vectors)
+        self._size += len(vectors)
+        return list(range(start, self._size))
+
+    def add(self, text: str) -> int:
+        return self.add_vectors(self.embedder.embed([text]))[0]
+
+    def add_batch(self, texts: Sequence[str]) -> List[int]:
+        return self.add_vectors(self.embedder.embed(texts))
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        if top_k <= 0 or len(scores) == 0:
+            return []
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in candidates if scores[i] > 0]
+
+    def search_vectors(self, queries: np.ndarray, top_k: int = 3,
+                       allowed: Optional[Set[int]] = None) -> List[List[Tuple[int, float]]]:
+        """
+        用已嵌入的查询向量检索，所有查询一次矩阵乘法完成
+
+        指定 allowed（元数据过滤得到的候选文档ID集合）时只取出这些文档的向量计算内积
+        """
+        queries = _normalize(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        if allowed is None:
+            scores = queries @ self.vectors.T
+            return [self._top_k(row, top_k) for row in scores]
+        candidates = np.fromiter(sorted(i for i in allowed if i < self._size), dtype=np.int64)
+        scores = queries @ self.vectors[candidates].T
+        return [
+            [(int(candidates[i]), score) for i, score in self._top_k(row, top_k)]
+            for row in scores
+        ]
+
+    def search(self, query: str, top_k: int = 3, allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        检索与查询最相似的文档
+
+        Returns:
+            [(文档ID, 余弦相似度)]，按相似度从高到低排列，只包含相似度大于0的文档
+        """
+        if allowed is not None:
+            return self.search_vectors(self.embedder.embed([query]), top_k, allowed)[0]
+        query_vector = _normalize(self.embedder.embed([query]))[0]
+        return self._top_k(self.vectors @ query_vector, top_k)
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 3,
+                     allowed: Optional[Set[int]] = None) -> List[List[Tuple[int, float]]]:
+        return self.search_vectors(self.embedder.embed(queries), top_k, allowed)
+
+    def stats(self):
+        return {
+            "documents": self._size,
+            "dim": self.dim,
+            "capacity": len(self._matrix),
+            "bytes": self._size * self.dim * 4
+        }
@@ -0,0 +1,523 @@
+"""
+磁盘持久化的RAG索引 - 进程退出后索引仍然保留，多个智能体进程通过页缓存共享同一份索引
+
+目录结构：
+- docs.db：SQLite（WAL模式）。documents 表保存文档原文和元数据；segments 表是当前生效的段列表；
+  terms 表是每个段的词典（词 -> 倒排表在段文件中的起点和长度）
+- seg-<段号>.ids / .tfs / .lens：段文件，分别是 uint32 文档ID、float32 词频、uint32 文档长度，
+  按词连续存放，打开时只做内存映射（np.memmap），不需要解析
+
+写入：
+- 新文档先写入 documents 表，分词结果放在内存缓冲区中，达到 flush_threshold 篇时写成一个新段
+- documents 表是唯一的事实来源：进程在写段之前退出时，下次打开会把尚未写入段的文档重新分词放回缓冲区
+- 段数超过 max_segments 时在后台线程中合并相邻的小段，合并完成后在一个事务中替换段列表
+
+读取：
+- 打开索引是O(1)的：只读取段列表，词典按查询词从SQLite中按需查找
+- 其他进程写入新段或合并后，generation 会增加，下一次查询时重新映射段文件
+
+写入进程：
+- 同一时间只有一个写入者：写入者持有目录下 writer.lock 的文件锁，第一次写入或写段时获取，close 时释放；
+  进程退出（包括崩溃）时操作系统自动释放
+- 其他实例（同一进程或其他进程）在锁被占用时调用 add_documents / compact 会抛出 RuntimeError；
+  flush / close 不写段，尚未写入段的文档只在内存中参与打分，由持有锁的写入者负责写入
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import heapq
+import json
+import math
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from metadata_index import Filters, filter_values
+from tokenizer import Tokenizer, default_tokenizer
+
+
+class _Segment:
+    """一个只读段：文档ID范围 [base, base + count) 的倒排表"""
+
+    def __init__(self, directory: str, segment_id: int, base: int, count: int, postings: int, total_length: int):
+        self.id = segment_id
+        self.base = base
+        self.count = count
+        self.postings = postings
+        self.total_length = total_length
+        prefix = os.path.join(directory, f"seg-{segment_id:08d}")
+        self.ids = self._map(prefix + ".ids", np.uint32, postings)
+        self.tfs = self._map(prefix + ".tfs", np.float32, postings)
+        self.lengths = self._map(prefix + ".lens", np.uint32, count)
+
+    @staticmethod
+    def _map(path: str, dtype, length: int) -> np.ndarray:
+        # 空文件无法映射
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(length,))
+
+
+def _segment_files(directory: str, segment_id: int) -> List[str]:
+    prefix = os.path.join(directory, f"seg-{segment_id:08d}")
+    return [prefix + ".ids", prefix + ".tfs", prefix + ".lens"]
+
+
+def _write_array(path: str, array: np.ndarray):
+    """先写临时文件再改名，避免读取进程看到写了一半的文件"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        array.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _try_lock(f) -> bool:
+    """对打开的文件加非阻塞的排他锁，已被其他打开的文件持有时返回 False"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+class DiskIndex:
+    """磁盘持久化的BM25倒排索引"""
+
+    def __init__(self, path: str, tokenizer: Tokenizer = None, k1: float = 1.2, b: float = 0.75,
+                 flush_threshold: int = 1000, max_segments: int = 8, merge_factor: int = 4,
+                 background_compaction: bool = True):
+        """
+        Args:
+            path: 索引目录
+            flush_threshold: 缓冲区达到多少篇文档时写成一个新段
+            max_segments: 段数超过该值时触发合并
+            merge_factor: 每次合并的相邻段数
+            background_compaction: 是否在后台线程中合并段（否则在写入线程中同步合并）
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.tokenizer = tokenizer or default_tokenizer
+        self.k1 = k1
+        self.b = b
+        self.flush_threshold = flush_threshold
+        self.max_segments = max_segments
+        self.merge_factor = max(2, merge_factor)
+        self.background_compaction = background_compaction
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "docs.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "  id INTEGER PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "  id INTEGER PRIMARY KEY, base INTEGER NOT NULL, count INTEGER NOT NULL,"
+            "  postings INTEGER NOT NULL, total_length INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS terms ("
+            "  term TEXT NOT NULL, segment INTEGER NOT NULL, start INTEGER NOT NULL, df INTEGER NOT NULL,"
+            "  PRIMARY KEY (term, segment)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS terms_segment ON terms (segment);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0), ('next_segment', 1);"
+        )
+        self._conn.commit()
+
+        self._segments = []  # 按base排序的 _Segment
+        self._generation = None
+        self._buffer = []  # [(文档ID, 词频, 文档长度)]，尚未写入段的文档
+        self._buffer_df = {}
+        self._compaction = None  # 正在运行的后台合并线程
+        self._writer_lock = None  # 持有写入锁时为打开的 writer.lock 文件
+        self._refresh()
+
+    # ---------- 段列表 ----------
+
+    def _meta(self, key: str) -> int:
+        return self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def _refresh(self):
+        """generation变化时（本进程或其他进程写入了新段/完成了合并）重新映射段文件"""
+        generation = self._meta("generation")
+        if generation == self._generation:
+            return
+        rows = self._conn.execute(
+            "SELECT id, base, count, postings, total_length FROM segments ORDER BY base"
+        ).fetchall()
+        existing = {segment.id: segment for segment in self._segments}
+        self._segments = [existing.get(row[0]) or _Segment(self.path, *row) for row in rows]
+        self._generation = generation
+        # 缓冲区中已经被写入段的文档丢弃；尚未写入段的文档重新分词放回缓冲区
+        end = self._segments[-1].base + self._segments[-1].count if self._segments else 0
+        known = {doc_id for doc_id, _, _ in self._buffer}
+        self._buffer = [item for item in self._buffer if item[0] >= end]
+        missing = self._conn.execute(
+            "SELECT id, content FROM documents WHERE id >= ? ORDER BY id", (end,)
+        ).fetchall()
+        for doc_id, content in missing:
+            if doc_id not in known:
+                counts = self.tokenizer.counts_batch([content])[0]
+                self._buffer.append((doc_id, counts, sum(counts.values())))
+        self._buffer.sort(key=lambda item: item[0])
+        self._buffer_df = {}
+        for _, counts, _ in self._buffer:
+            for term in counts:
+                self._buffer_df[term] = self._buffer_df.get(term, 0) + 1
+
+    def _try_acquire_writer(self) -> bool:
+        """获取写入锁（已持有时直接返回 True），被其他实例持有时返回 False"""
+        with self._lock:
+            if self._writer_lock is not None:
+                return True
+            f = open(os.path.join(self.path, "writer.lock"), "a+b")
+            if not _try_lock(f):
+                f.close()
+                return False
+            self._writer_lock = f
+            # 之前的写入者可能在退出前添加了文档而没有写段，下一次 _refresh 从 documents 表重新加载缓冲区
+            self._generation = None
+            return True
+
+    def _acquire_writer(self):
+        if not self._try_acquire_writer():
+            raise RuntimeError(f"索引正在被其他实例写入：{self.path}")
+
+    @property
+    def is_writer(self) -> bool:
+        """本实例是否持有写入锁"""
+        return self._writer_lock is not None
+
+    def _bump_generation(self):
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+
+    @property
+    def generation(self) -> int:
+        """持久化的索引版本，本进程或其他进程写入新段/完成合并后增加"""
+        with self._lock:
+            return self._meta("generation")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(segment.count for segment in self._segments) + len(self._buffer)
+
+    # ---------- 写入 ----------
+
+    def add_documents(self, documents: Iterable[Dict[str, Any]],
+                      counts_list: Optional[List[Dict[str, int]]] = None) -> List[int]:
+        """添加文档（每项包含 content 和可选的 metadata），返回文档ID；counts_list 为已经分好词的词频"""
+        documents = list(documents)
+        if counts_list is None:
+            counts_list = self.tokenizer.counts_batch(doc["content"] for doc in documents)
+        with self._lock:
+            self._acquire_writer()
+            self._refresh()
+            with self._conn:
+                start = self._conn.execute("SELECT COALESCE(MAX(id), -1) + 1 FROM documents").fetchone()[0]
+                self._conn.executemany(
+                    "INSERT INTO documents (id, content, metadata) VALUES (?, ?, ?)",
+                    [
+                        (start + i, doc["content"], json.dumps(doc.get("metadata") or {}, ensure_ascii=False))
+                        for i, doc in enumerate(documents)
+                    ]
+                )
+            ids = list(range(start, start + len(documents)))
+            for doc_id, counts in zip(ids, counts_list):
+                self._buffer.append((doc_id, counts, sum(counts.values())))
+                for term in counts:
+                    self._buffer_df[term] = self._buffer_df.get(term, 0) + 1
+            if len(self._buffer) >= self.flush_threshold:
+                self.flush()
+        return ids
+
+    def flush(self):
+        """
+        把缓冲区中的文档写成一个新段
+
+        写入锁被其他实例持有时不写段（缓冲区中的文档由持有锁的写入者负责写入）；
+        写段之前先刷新段列表，已经被写入段的文档不会重复写入
+        """
+        with self._lock:
+            if not self._buffer or not self._try_acquire_writer():
+                return
+            self._refresh()
+            if not self._buffer:
+                return
+            postings = {}
+            for doc_id, counts, _ in self._buffer:
+                for term, tf in counts.items():
+                    postings.setdefault(term, []).append((doc_id, tf))
+            base = self._buffer[0][0]
+            lengths = np.array([length for _, _, length in self._buffer], dtype=np.uint32)
+            self._write_segment(base, len(self._buffer), lengths, sorted(postings.items()), replaces=())
+            self._buffer = []
+            self._buffer_df = {}
+        self._maybe_compact()
+
+    def _write_segment(self, base: int, count: int, lengths: np.ndarray, postings, replaces: Tuple[int, ...]):
+        """写段文件并在一个事务中更新段列表；replaces 为被合并替换掉的段"""
+        with self._lock:
+            segment_id = self._meta("next_segment")
+            with self._conn:
+                self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'next_segment'")
+
+        ids, tfs, rows, offset = [], [], [], 0
+        for term, items in postings:
+            if isinstance(items, tuple):  # 合并时直接传入 (文档ID数组, 词频数组)
+                term_ids, term_tfs = items
+            else:
+                term_ids = np.fromiter((doc_id for doc_id, _ in items), dtype=np.uint32, count=len(items))
+                term_tfs = np.fromiter((tf for _, tf in items), dtype=np.float32, count=len(items))
+            ids.append(term_ids)
+            tfs.append(term_tfs)
+            rows.append((term, segment_id, offset, len(term_ids)))
+            offset += len(term_ids)
+        ids_path, tfs_path, lengths_path = _segment_files(self.path, segment_id)
+        _write_array(ids_path, np.concatenate(ids).astype(np.uint32) if ids else np.empty(0, np.uint32))
+        _write_array(tfs_path, np.concatenate(tfs).astype(np.float32) if tfs else np.empty(0, np.float32))
+        _write_array(lengths_path, lengths)
+
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("INSERT INTO terms (term, segment, start, df) VALUES (?, ?, ?, ?)", rows)
+                self._conn.execute(
+                    "INSERT INTO segments (id, base, count, postings, total_length) VALUES (?, ?, ?, ?, ?)",
+                    (segment_id, base, count, offset, int(lengths.sum()))
+                )
+                for old in replaces:
+                    self._conn.execute("DELETE FROM terms WHERE segment = ?", (old,))
+                    self._conn.execute("DELETE FROM segments WHERE id = ?", (old,))
+                self._bump_generation()
+            self._refresh()
+        for old in replaces:
+            for file_path in _segment_files(self.path, old):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    # Windows下其他进程仍在映射的文件无法删除，留给下次合并后清理
+                    pass
+
+    # ---------- 合并 ----------
+
+    def _pick_merge(self, segments: List[_Segment]) -> Optional[List[_Segment]]:
+        """段数超过上限时，选出总大小最小的 merge_factor 个相邻段"""
+        if len(segments) <= self.max_segments:
+            return None
+        width = min(self.merge_factor, len(segments))
+        start = min(
+            range(len(segments) - width + 1),
+            key=lambda i: sum(segment.count for segment in segments[i:i + width])
+        )
+        return segments[start:start + width]
+
+    def _maybe_compact(self):
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            if self._pick_merge(self._segments) is None:
+                return
+            if not self.background_compaction:
+                self._run_compaction()
+                return
+            self._compaction = threading.Thread(target=self._run_compaction, name="disk-index-compaction", daemon=True)
+            self._compaction.start()
+
+    def _run_compaction(self):
+        while True:
+            with self._lock:
+                group = self._pick_merge(self._segments)
+            if group is None:
+                return
+            self._merge(group)
+
+    def compact(self):
+        """把所有段（和缓冲区）合并成一个段"""
+        self._acquire_writer()
+        self.flush()
+        self.wait_for_compaction()
+        with self._lock:
+            segments = list(self._segments)
+        if len(segments) > 1:
+            self._merge(segments)
+
+    def wait_for_compaction(self):
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+
+    def _merge(self, group: List[_Segment]):
+        """合并相邻的段：段文件只读，合并过程中不阻塞查询和写入"""
+        segment_ids = [segment.id for segment in group]
+        placeholders = ",".join("?" * len(segment_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT term, segment, start, df FROM terms WHERE segment IN ({placeholders}) ORDER BY term",
+                segment_ids
+            ).fetchall()
+        by_id = {segment.id: segment for segment in group}
+        order = {segment.id: position for position, segment in enumerate(group)}
+
+        def merged_postings():
+            i = 0
+            while i < len(rows):
+                term = rows[i][0]
+                parts = []
+                while i < len(rows) and rows[i][0] == term:
+                    parts.append(rows[i][1:])
+                    i += 1
+                # 按段的先后顺序拼接，文档ID保持递增
+                parts.sort(key=lambda part: order[part[0]])
+                ids = [by_id[seg].ids[start:start + df] for seg, start, df in parts]
+                tfs = [by_id[seg].tfs[start:start + df] for seg, start, df in parts]
+                yield term, (np.concatenate(ids), np.concatenate(tfs))
+
+        lengths = np.concatenate([np.asarray(segment.lengths) for segment in group]).astype(np.uint32)
+        self._write_segment(
+            group[0].base, sum(segment.count for segment in group), lengths,
+            merged_postings(), replaces=tuple(segment_ids)
+        )
+
+    # ---------- 查询 ----------
+
+    def search(self, query_counts: Dict[str, int], top_k: int = 3,
+               allowed: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        BM25检索，返回 [(文档ID, 分数)]，按分数从高到低排列，只包含分数大于0的文档
+
+        allowed 为元数据过滤得到的候选文档ID集合（见 filter_ids），倒排表在打分前按它裁剪
+        """
+        terms = list(query_counts)
+        if not terms or top_k <= 0:
+            return []
+        with self._lock:
+            self._refresh()
+            segments = list(self._segments)
+            buffer = list(self._buffer)
+            buffer_df = dict(self._buffer_df)
+            placeholders = ",".join("?" * len(terms))
+            rows = self._conn.execute(
+                f"SELECT term, segment, start, df FROM terms WHERE term IN ({placeholders})", terms
+            ).fetchall()
+
+        n = sum(segment.count for segment in segments) + len(buffer)
+        if n == 0:
+            return []
+        total_length = sum(segment.total_length for segment in segments) + sum(item[2] for item in buffer)
+        avgdl = total_length / n or 1.0
+        df = dict(buffer_df)
+        by_segment = {}
+        for term, segment_id, start, term_df in rows:
+            df[term] = df.get(term, 0) + term_df
+            by_segment.setdefault(segment_id, []).append((term, start, term_df))
+        idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+        k1, b = self.k1, self.b
+        allowed_ids = None if allowed is None else np.fromiter(sorted(allowed), dtype=np.int64)
+
+        candidates = []
+        for segment in segments:
+            entries = by_segment.get(segment.id)
+            if not entries:
+                continue
+            mask = None
+            if allowed_ids is not None:
+                lo, hi = np.searchsorted(allowed_ids, [segment.base, segment.base + segment.count])
+                if lo == hi:
+                    continue
+                mask = np.zeros(segment.count, dtype=bool)
+                mask[allowed_ids[lo:hi] - segment.base] = True
+            scores = np.zeros(segment.count, dtype=np.float32)
+            for term, start, term_df in entries:
+                local = segment.ids[start:start + term_df] - np.uint32(segment.base)
+                tfs = segment.tfs[start:start + term_df]
+                if mask is not None:
+                    keep = mask[local]
+                    local, tfs = local[keep], tfs[keep]
+                norms = k1 * (1 - b + b * segment.lengths[local] / avgdl)
+                # 同一个词的倒排表中文档不重复，可以直接用花式索引累加
+                scores[local] += idf[term] * tfs * (k1 + 1) / (tfs + norms)
+            if top_k < segment.count:
+                top = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                top = np.arange(segment.count)
+            candidates.extend((segment.base + int(i), float(scores[i])) for i in top if scores[i] > 0)
+
+        for doc_id, counts, length in buffer:
+            if allowed is not None and doc_id not in allowed:
+                continue
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term)
+                if tf:
+                    score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+            if score > 0:
+                candidates.append((doc_id, score))
+
+        return heapq.nlargest(top_k, candidates, key=lambda item: item[1])
+
+    def get_documents(self, doc_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """按文档ID读取原文和元数据"""
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" * len(doc_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, content, metadata FROM documents WHERE id IN ({placeholders})", list(doc_ids)
+            ).fetchall()
+        return {
+            doc_id: {"id": doc_id, "content": content, "metadata": json.loads(metadata)}
+            for doc_id, content, metadata in rows
+        }
+
+    def filter_ids(self, filters: Filters) -> Set[int]:
+        """
+        满足元数据过滤条件的文档ID集合（语义同 MetadataIndex.matching）
+
+        用SQLite的JSON函数在 documents 表上求出，列表类型的元数据按其中每个值匹配
+        """
+        if not filters:
+            return set()
+        clauses, params = [], []
+        for field, value in filters.items():
+            values = filter_values(value)
+            clauses.append(
+                f"EXISTS (SELECT 1 FROM json_each(metadata, ?) WHERE value IN ({','.join('?' * len(values))}))"
+            )
+            params.append('$."' + str(field).replace('"', '\\"') + '"')
+            params.extend(values)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id FROM documents WHERE {' AND '.join(clauses)}", params).fetchall()
+        return {doc_id for doc_id, in rows}
+
+    def close(self):
+        """写入缓冲区（持有写入锁时）、等待合并完成、关闭数据库连接并释放写入锁"""
+        self.flush()
+        self.wait_for_compaction()
+        with self._lock:
+            self._conn.close()
+            if self._writer_lock is not None:
+                self._writer_lock.close()
+                self._writer_lock = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "documents": len(self),
+                "segments": len(self._segments),
+                "segment_sizes": [segment.count for segment in self._segments],
+                "buffered": len(self._buffer),
+                "postings": sum(segment.postings for segment in self._segments),
+                "generation": self._generation,
+                "writer": self.is_writer
+            }
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟Ollama服务（OpenAI兼容接口）
+
+用于压测和基准测试：按可配置的首字延迟和逐token间隔生成确定性的回复，
+不依赖真实模型，也不占用CPU做推理。
+
+用法：
+    python fake_ollama.py --port 11500 --tokens 64 --token-delay 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI, Body
+from fastapi.responses import StreamingResponse
+
+
+def create_app(tokens: int = 32, token_delay: float = 0.01, first_token_latency: float = 0.05) -> FastAPI:
+    """
+    创建模拟服务应用
+
+    Args:
+        tokens: 每次回复的默认token数（不超过请求中的max_tokens）
+        token_delay: 相邻两个token之间的间隔（秒）
+        first_token_latency: 首个token之前的延迟（秒），模拟prompt处理时间
+    """
+    app = FastAPI(title="Fake Ollama")
+
+    def reply_tokens(messages, max_tokens):
+        """根据prompt生成确定性的回复token序列"""
+        prompt = messages[-1]["content"] if messages else ""
+        count = min(tokens, max_tokens or tokens)
+        seed = sum(map(ord, prompt)) % 997
+        return [f"tok{(seed + i) % 997} " for i in range(count)]
+
+    def usage(messages, completion_tokens):
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "qwen:0.5b-chat", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(payload: dict = Body(...)):
+        model = payload.get("model", "qwen:0.5b-chat")
+        messages = payload.get("messages", [])
+        pieces = reply_tokens(messages, payload.get("max_tokens"))
+        created = int(time.time())
+
+        if not payload.get("stream"):
+            await asyncio.sleep(first_token_latency + token_delay * len(pieces))
+            return {
+                "id": f"chatcmpl-fake-{created}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage(messages, len(pieces))
+            }
+
+        include_usage = (payload.get("stream_options") or {}).get("include_usage", False)
+
+        async def event_stream():
+            await asyncio.sleep(first_token_latency)
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(token_delay)
+                chunk = {
+                    "id": f"chatcmpl-fake-{created}",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": f"chatcmpl-fake-{created}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            if include_usage:
+                yield f"data: {json.dumps({'choices': [], 'usage': usage(messages, len(pieces))})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟Ollama服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--tokens", type=int, default=32, help="每次回复的token数")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="token间隔（秒）")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="首token延迟（秒）")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(
+        create_app(args.tokens, args.token_delay, args.first_token_latency),
+        host=args.host,
+        port=args.port,
+        log_level="warning"
+    )
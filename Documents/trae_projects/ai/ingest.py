@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RAG文档导入流水线 - 把课程资料目录一次性导入 SimpleVectorDB
+
+- 逐个文件惰性读取目录下的 .txt / .md / .json / .jsonl 文件（生成器，不一次性载入整个目录）
+- 按token数做滑动窗口切块（窗口大小和重叠可配置），每块带上来源文件和块序号
+- 切块按批次交给进程池分词/嵌入，主进程批量写入索引；同时在途的批次数有上限，
+  内存占用与语料总大小无关
+- 用tqdm显示进度
+
+用法：
+    python ingest.py ../.. --backend disk --path data/rag_index
+    python ingest.py ../.. --backend disk --path data/rag_index --chunk-tokens 200 --overlap 40 --query "Python 是什么时候创建的"
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import argparse
+import collections
+import itertools
+import json
+import os
+
+from tqdm import tqdm
+
+from rag_demo import SimpleVectorDB
+from tokenizer import UNIT_PATTERN
+
+DEFAULT_EXTENSIONS = (".txt", ".md", ".json", ".jsonl")
+
+
+def iter_files(root: str, extensions: Iterable[str] = DEFAULT_EXTENSIONS) -> Iterator[str]:
+    """递归遍历目录下指定扩展名的文件（跳过隐藏目录），按路径排序保证导入顺序稳定"""
+    extensions = tuple(extensions)
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(d for d in subdirectories if not d.startswith("."))
+        for name in sorted(files):
+            if name.endswith(extensions):
+                yield os.path.join(directory, name)
+
+
+def _record_content(item: Any) -> Optional[str]:
+    """JSON记录中的正文：字符串本身，或对象的 content / text 字段，否则整个对象序列化"""
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        content = item.get("content") or item.get("text")
+        if isinstance(content, str):
+            return content
+    return json.dumps(item, ensure_ascii=False)
+
+
+def read_documents(path: str, root: str = None) -> Iterator[Dict[str, Any]]:
+    """读取单个文件中的文档：文本/Markdown为一篇，JSON数组每项一篇，JSONL每行一篇"""
+    source = os.path.relpath(path, root) if root else path
+    try:
+        if path.endswith(".jsonl"):
+            with open(path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if line:
+                        yield {"content": _record_content(json.loads(line)),
+                               "metadata": {"source": source, "record": line_number}}
+        elif path.endswith(".json"):
+            # JSON文件需要整体解析，只适合单个文件不太大的情况；大数据集请使用JSONL
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            records = data if isinstance(data, list) else [data]
+            for index, item in enumerate(records):
+                yield {"content": _record_content(item), "metadata": {"source": source, "record": index}}
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                yield {"content": f.read(), "metadata": {"source": source}}
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        print(f"跳过无法解析的文件 {source}：{e}")
+
+
+def chunk_text(text: str, max_tokens: int = 256, overlap: int = 32) -> List[str]:
+    """
+    按token数切块，相邻块之间重叠 overlap 个token
+
+    Returns:
+        原文的切片列表（保留原始的空白和标点）
+    """
+    if overlap >= max_tokens:
+        raise ValueError("overlap 必须小于 max_tokens")
+    spans = [match.span() for match in UNIT_PATTERN.finditer(text)]
+    if not spans:
+        return []
+    chunks = []
+    step = max_tokens - overlap
+    for start in range(0, len(spans), step):
+        end = min(start + max_tokens, len(spans))
+        chunks.append(text[spans[start][0]:spans[end - 1][1]])
+        if end == len(spans):
+            break
+    return chunks
+
+
+def iter_chunks(root: str, max_tokens: int = 256, overlap: int = 32,
+                extensions: Iterable[str] = DEFAULT_EXTENSIONS) -> Iterator[Dict[str, Any]]:
+    """遍历目录，逐块产出 {"content", "metadata"}"""
+    for path in iter_files(root, extensions):
+        for document in read_documents(path, root):
+            for index, chunk in enumerate(chunk_text(document["content"], max_tokens, overlap)):
+                yield {"content": chunk, "metadata": {**document["metadata"], "chunk": index}}
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# 进程池中的工作进程各持有一个只用于计算的 SimpleVectorDB 副本（不存文档）
+_worker_db = None
+
+
+def _init_worker(backend: str, embedder, tokenizer, hybrid: bool = False):
+    global _worker_db
+    _worker_db = SimpleVectorDB("bm25" if backend == "disk" else backend, embedder=embedder, tokenizer=tokenizer,
+                                hybrid=hybrid)
+
+
+def _prepare(contents: List[str]):
+    return _worker_db.prepare(contents)
+
+
+def ingest(db: SimpleVectorDB, chunks: Iterable[Dict[str, Any]], batch_size: int = 256,
+           workers: int = None, progress: bool = True) -> int:
+    """
+    把切块批量写入向量库
+
+    Args:
+        db: 目标向量库
+        chunks: 切块（生成器）
+        batch_size: 每批的切块数
+        workers: 分词/嵌入的进程数，默认为CPU核数；为1时在当前进程中计算
+
+    Returns:
+        导入的切块数
+    """
+    workers = workers or os.cpu_count() or 1
+    total = 0
+    bar = tqdm(unit="块", disable=not progress)
+    try:
+        if workers <= 1:
+            for batch in batched(chunks, batch_size):
+                db.add_documents(batch)
+                total += len(batch)
+                bar.update(len(batch))
+            return total
+
+        embedder = db.dense_index.embedder if db.dense_index is not None else None
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(db.backend, embedder, db.tokenizer, db.hybrid)) as pool:
+            # 最多 2*workers 个批次在途，保证内存占用有上限，同时按提交顺序写入
+            pending = collections.deque()
+            for batch in batched(chunks, batch_size):
+                pending.append((batch, pool.submit(_prepare, [chunk["content"] for chunk in batch])))
+                while len(pending) >= workers * 2:
+                    total += _write(db, *pending.popleft(), bar)
+            while pending:
+                total += _write(db, *pending.popleft(), bar)
+        return total
+    finally:
+        bar.close()
+
+
+def _write(db: SimpleVectorDB, batch: List[Dict[str, Any]], future, bar) -> int:
+    db.add_documents(batch, future.result())
+    bar.update(len(batch))
+    return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把目录下的文档切块后导入RAG索引")
+    parser.add_argument("root", help="文档目录")
+    parser.add_argument("--backend", default="disk", choices=SimpleVectorDB.BACKENDS)
+    parser.add_argument("--path", default=os.getenv("RAG_INDEX_PATH", "data/rag_index"), help="disk 后端的索引目录")
+    parser.add_argument("--chunk-tokens", type=int, default=256, help="每块的token数")
+    parser.add_argument("--overlap", type=int, default=32, help="相邻块重叠的token数")
+    parser.add_argument("--extensions", default=",".join(DEFAULT_EXTENSIONS), help="逗号分隔的文件扩展名")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认CPU核数")
+    parser.add_argument("--query", help="导入完成后执行一次检索")
+    args = parser.parse_args()
+
+    options = {"path": args.path} if args.backend == "disk" else {}
+    db = SimpleVectorDB(args.backend, **options)
+    chunks = iter_chunks(args.root, args.chunk_tokens, args.overlap, args.extensions.split(","))
+    count = ingest(db, chunks, args.batch_size, args.workers)
+    print(f"导入完成：{count} 块，索引共 {len(db)} 块")
+    if args.query:
+        for result in db.search(args.query, top_k=5):
+            metadata = result["document"]["metadata"]
+            print(f"{result['similarity']:.4f}  {metadata.get('source')}#{metadata.get('chunk')}  "
+                  f"{result['document']['content'][:80]!r}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from model_router import model_router
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from model_router import model_router, ollama_client, health_prober
+
+# 应用生命周期：启动后台健康探测（不阻塞启动），退出时关闭Ollama连接池
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    health_prober.start()
+    yield
+    await health_prober.stop()
+    await ollama_client.aclose()
 
 # 创建FastAPI应用
 app = FastAPI(
     title="本地Ollama模型API",
     description="提供本地Ollama大语言模型的API接口",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -23,17 +35,38 @@ app.include_router(model_router)
 
 # 根路由
 @app.get("/")
-def read_root():
+async def read_root():
     return {
         "message": "本地Ollama模型API服务已启动",
         "docs": "/docs",
         "redoc": "/redoc"
     }
 
-# 健康检查路由
+# 健康检查路由：Ollama不可用时报告degraded而不是失败
 @app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+async def health_check():
+    return {
+        "status": "healthy" if health_prober.ready else "degraded",
+        "ollama": health_prober.status()
+    }
+
+# 存活探针：进程能响应即存活
+@app.get("/health/live")
+async def liveness_check():
+    return {"status": "alive"}
+
+# 就绪探针：Ollama可用时才就绪，否则返回503
+@app.get("/health/ready")
+async def readiness_check():
+    status = health_prober.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "not_ready", "ollama": status})
+    return {"status": "ready", "ollama": status}
+
+# Prometheus指标（token数、生成速度、首token延迟、排队时间）
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,81 @@
+"""
+元数据过滤与结果融合
+
+- MetadataIndex：按元数据字段建立 值 -> 文档ID集合 的索引，过滤条件在打分之前求出候选文档集合
+- reciprocal_rank_fusion：用倒数排名融合（RRF）合并多路检索（如稀疏 + 稠密）的结果
+"""
+
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+# 过滤条件：{字段: 值} 或 {字段: [值1, 值2]}；同一字段的多个值为“或”，不同字段之间为“且”
+Filters = Dict[str, Any]
+
+
+def filter_values(value: Any) -> List[Any]:
+    """过滤条件中一个字段的取值（列表/元组/集合表示任意一个）"""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
+
+class MetadataIndex:
+    """元数据字段的ID集合索引"""
+
+    def __init__(self):
+        self._fields = {}  # 字段 -> 值 -> 文档ID集合
+
+    def add(self, doc_id: int, metadata: Dict[str, Any]):
+        for field, value in (metadata or {}).items():
+            # 列表类型的元数据（例如标签）按其中每个值建立索引；不可哈希的值（字典）不建索引
+            for item in filter_values(value):
+                try:
+                    self._fields.setdefault(field, {}).setdefault(item, set()).add(doc_id)
+                except TypeError:
+                    continue
+
+    def matching(self, filters: Filters) -> Set[int]:
+        """满足所有过滤条件的文档ID集合"""
+        groups = []
+        for field, value in filters.items():
+            values = self._fields.get(field, {})
+            ids = set()
+            for item in filter_values(value):
+                ids |= values.get(item, set())
+            if not ids:
+                return set()
+            groups.append(ids)
+        if not groups:
+            return set()
+        # 从最小的集合开始求交集
+        groups.sort(key=len)
+        result = set(groups[0])
+        for ids in groups[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def values(self, field: str) -> Dict[Any, int]:
+        """某个字段的所有取值及对应的文档数"""
+        return {value: len(ids) for value, ids in self._fields.get(field, {}).items()}
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[Tuple[int, float]]], top_k: int,
+                           k: int = 60) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合：每个文档的得分为 sum(1 / (k + 排名))，排名从1开始
+
+    Args:
+        rankings: 多路检索结果，每路为按得分从高到低排列的 [(文档ID, 得分)]
+        top_k: 返回的结果数
+        k: 平滑常数，通常取60
+
+    Returns:
+        [(文档ID, 融合得分)]，按融合得分从高到低排列
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
@@ -0,0 +1,101 @@
+"""
+模型调用指标 - token计数与Prometheus指标
+
+token数优先取上游返回的usage字段；上游未返回时使用本地分词器估算。
+"""
+
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Counter, Histogram
+
+from tokenizer import UNIT_PATTERN
+
+# 按模型统计的token数（kind: prompt / completion）
+TOKENS = Counter(
+    "model_tokens_total",
+    "模型调用消耗的token数",
+    ["model", "kind"]
+)
+
+# 按模型统计的请求数（mode: chat / stream，status: ok / error / cached / coalesced）
+REQUESTS = Counter(
+    "model_requests_total",
+    "模型调用请求数",
+    ["model", "mode", "status"]
+)
+
+# 生成速度（completion token数 / 生成耗时）
+TOKENS_PER_SECOND = Histogram(
+    "model_tokens_per_second",
+    "每秒生成的completion token数",
+    ["model"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500)
+)
+
+# 首token延迟：从向上游发出请求到收到第一个内容分块（不含排队时间）
+TIME_TO_FIRST_TOKEN = Histogram(
+    "model_time_to_first_token_seconds",
+    "流式调用的首token延迟（不含排队）",
+    ["model"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+)
+
+# 排队时间：等待模型并发槽位的时间
+QUEUE_WAIT = Histogram(
+    "model_queue_wait_seconds",
+    "等待模型并发槽位的时间",
+    ["model"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+)
+
+# 后端失败次数（连接错误或5xx）
+BACKEND_FAILURES = Counter(
+    "model_backend_failures_total",
+    "模型后端调用失败次数",
+    ["backend"]
+)
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的token数（上游未返回usage时使用）
+
+    按 tokenizer.UNIT_PATTERN 切分：每个汉字、每段数字、每个标点单独计数，英文单词按约4个字符一个token估算
+    """
+    count = 0
+    for piece in UNIT_PATTERN.findall(text or ""):
+        if len(piece) > 1 and not piece.isdigit():
+            count += (len(piece) + 3) // 4
+        else:
+            count += 1
+    return count
+
+
+def build_usage(upstream_usage: Optional[Dict[str, Any]], messages: List[Dict[str, str]], completion: str) -> Dict[str, Any]:
+    """
+    生成usage字段：优先使用上游返回的token数，缺失的部分用本地分词器补齐
+    """
+    upstream_usage = upstream_usage or {}
+    prompt_tokens = upstream_usage.get("prompt_tokens")
+    completion_tokens = upstream_usage.get("completion_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(completion)
+    usage = {
+        "completion_tokens": completion_tokens,
+        "prompt_tokens": prompt_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+    # 上游报告的KV缓存命中（cached_tokens）原样保留
+    if upstream_usage.get("prompt_tokens_details"):
+        usage["prompt_tokens_details"] = upstream_usage["prompt_tokens_details"]
+    return usage
+
+
+def record_usage(model: str, mode: str, usage: Dict[str, int], generation_seconds: float):
+    """记录一次成功调用的token数和生成速度"""
+    REQUESTS.labels(model, mode, "ok").inc()
+    TOKENS.labels(model, "prompt").inc(usage["prompt_tokens"])
+    TOKENS.labels(model, "completion").inc(usage["completion_tokens"])
+    if generation_seconds > 0 and usage["completion_tokens"]:
+        TOKENS_PER_SECOND.labels(model).observe(usage["completion_tokens"] / generation_seconds)
@@ -1,54 +1,223 @@
-from fastapi import APIRouter, HTTPException, Body
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, HTTPException, Body, Request
 from fastapi.responses import StreamingResponse
-from openai import OpenAI
-import json
+from sse_starlette import EventSourceResponse
 import asyncio
+import json
+import os
 import time
 
+from backend_router import BackendRouter, backends_from_env
+from batch_jobs import BatchStore, parse_jsonl_prompts, run_batch
+from chat_sessions import ChatSessionStore
+from response_cache import create_response_cache
+from model_metrics import QUEUE_WAIT, REQUESTS, TIME_TO_FIRST_TOKEN, build_usage, record_usage
+
 # 路由配置
 model_router = APIRouter(prefix="/api/model", tags=["本地模型"])
 
-# 全局Ollama客户端（使用OpenAI兼容接口）
-class OllamaClient:
-    def __init__(self, host="http://localhost:11434", default_model="qwen:7b"):
-        self.host = host
+# SSE发送超时（秒）：客户端长时间不读取时断开并取消上游生成
+SSE_SEND_TIMEOUT = float(os.getenv("MODEL_SSE_SEND_TIMEOUT", "30"))
+
+# 流式分块外壳：每个流只序列化一次公共字段，逐token只需序列化content字符串
+class ChunkEnvelope:
+    def __init__(self, model: str, terminator: str = "\n"):
+        self.model = model
+        self.terminator = terminator
+        self.created = int(time.time())
+        self.id = f"chatcmpl-{str(time.time())}-stream"
+        common = json.dumps({
+            "created": self.created,
+            "id": self.id,
+            "model": model,
+            "object": "chat.completion.chunk"
+        }, ensure_ascii=False)
+        self._delta_prefix = '{"choices": [{"delta": {"content": '
+        self._delta_suffix = '}, "finish_reason": null, "index": 0}], ' + common[1:] + terminator
+
+    def delta(self, content: str) -> str:
+        """内容分块"""
+        return self._delta_prefix + json.dumps(content, ensure_ascii=False) + self._delta_suffix
+
+    def finish(self, usage: dict) -> str:
+        """结束分块（附带usage）"""
+        return json.dumps({
+            "choices": [{
+                "delta": {},
+                "finish_reason": "stop",
+                "index": 0
+            }],
+            "created": self.created,
+            "id": self.id,
+            "model": self.model,
+            "object": "chat.completion.chunk",
+            "usage": usage
+        }, ensure_ascii=False) + self.terminator
+
+    def error(self, message: str) -> str:
+        """错误分块"""
+        return json.dumps({
+            "error": {
+                "message": message,
+                "type": "server_error"
+            },
+            "object": "error"
+        }, ensure_ascii=False) + self.terminator
+
+# 请求调度器：合并相同的在途请求，并按模型限制并发
+class RequestScheduler:
+    def __init__(self, max_concurrency_per_model=4, capacity=None):
+        self.max_concurrency_per_model = max_concurrency_per_model
+        self.capacity = capacity  # 模型名 -> 可处理该模型的后端数量，并发上限随之放大
+        self._semaphores = {}  # 模型名 -> 信号量
+        self._inflight = {}    # 请求键 -> [上游任务, 等待者数量]
+        self.coalesced = 0     # 被合并到已有请求上的次数
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            backends = self.capacity(model) if self.capacity else 1
+            self._semaphores[model] = asyncio.Semaphore(self.max_concurrency_per_model * backends)
+        return self._semaphores[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        """占用模型的一个并发槽位，槽位不足时排队等待"""
+        queued_at = time.perf_counter()
+        async with self._semaphore(model):
+            QUEUE_WAIT.labels(model).observe(time.perf_counter() - queued_at)
+            yield
+
+    async def _run_in_slot(self, model: str, factory):
+        async with self.slot(model):
+            return await factory()
+
+    async def submit(self, key, model: str, factory):
+        """
+        提交请求：相同key的在途请求只调用一次上游，结果分发给所有等待者
+
+        Args:
+            key: 请求去重键，例如 (model, prompt, max_tokens, temp)
+            model: 模型名，用于按模型排队
+            factory: 无参协程函数，真正发起上游调用
+        """
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(self._run_in_slot(model, factory))
+            entry = [task, 0]
+            self._inflight[key] = entry
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+            REQUESTS.labels(model, "chat", "coalesced").inc()
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            # 所有等待者都已离开时取消上游请求，避免空跑
+            if not entry[0].done() and entry[1] == 1:
+                entry[0].cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+# 全局Ollama客户端（使用OpenAI兼容接口，请求经由多后端路由分发到各个Ollama实例）
+class AsyncOllamaClient:
+    def __init__(self, host=None, default_model="qwen:7b", max_concurrency_per_model=None, backends=None):
         self.default_model = default_model
-        self.client = OpenAI(
-            base_url=f"{self.host}/v1",
-            api_key="xx"  # Ollama兼容接口不需要真实API密钥，任意字符串即可
+        # 每个后端一个长连接池，连接在第一次使用时才建立，导入模块不会访问Ollama
+        self.router = BackendRouter(
+            backends or backends_from_env(host),
+            max_failures=int(os.getenv("MODEL_BACKEND_MAX_FAILURES", "3")),
+            eject_seconds=float(os.getenv("MODEL_BACKEND_EJECT_SECONDS", "30"))
         )
-        if not self._check_service():
-            raise RuntimeError("Ollama服务未启动，请检查11434端口")
+        # 单个Ollama实例并行生成能力有限，超出的请求按模型排队
+        self.scheduler = RequestScheduler(
+            max_concurrency_per_model or int(os.getenv("OLLAMA_MAX_CONCURRENCY_PER_MODEL", "4")),
+            capacity=self.router.capacity
+        )
+        # 确定性调用（temp=0或显式要求）的响应缓存
+        self.cache = create_response_cache()
 
-    def _check_service(self) -> bool:
-        """检查服务可用性"""
-        try:
-            # 使用OpenAI兼容接口的models端点检查服务状态
-            self.client.models.list(timeout=5)
-            return True
-        except:
-            return False
-
-    def chat(self, prompt: str, model=None, max_tokens=1024, temp=0.7):
-        """普通调用（非流式） - 返回与OpenAI API兼容的格式"""
+    async def check_service(self) -> bool:
+        """检查服务可用性（探测所有后端），全部不可用时抛出异常"""
+        if not await self.router.probe_all():
+            raise RuntimeError("没有可用的Ollama后端")
+        return True
+
+    async def aclose(self):
+        """关闭所有后端的连接池（应用退出时调用）"""
+        await self.router.aclose()
+
+    def _build_payload(self, messages: list, model: str, max_tokens: int, temp: float, stream: bool) -> dict:
+        """构造OpenAI兼容的chat/completions请求体"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temp,
+            "stream": stream
+        }
+        if stream:
+            # 让上游在最后一个分块中返回真实的token数
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    async def chat(self, prompt: str, model=None, max_tokens=1024, temp=0.7, cache=None,
+                   messages=None, affinity=None):
+        """
+        普通调用（非流式） - 返回与OpenAI API兼容的格式
+
+        temp=0 或 cache=True 时优先从响应缓存返回；相同的在途请求会被合并
+
+        Args:
+            messages: 完整的多轮消息（会话接口使用），未提供时只发送prompt一条用户消息
+            affinity: 后端亲和键，相同键的请求尽量发往同一个后端以复用KV缓存
+        """
         model = model or self.default_model
+        if messages is None:
+            messages = [{"role": "user", "content": prompt}]
+            request_key = prompt
+        else:
+            request_key = json.dumps(messages, ensure_ascii=False)
+        use_cache = temp == 0 if cache is None else cache
+        cache_key = None
+        if use_cache:
+            cache_key = self.cache.make_key(model, request_key, max_tokens=max_tokens, temp=temp)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                REQUESTS.labels(model, "chat", "cached").inc()
+                return cached
+        result = await self.scheduler.submit(
+            (model, request_key, max_tokens, temp),
+            model,
+            lambda: self._request_chat(messages, model, max_tokens, temp, affinity)
+        )
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        return result
+
+    async def _request_chat(self, messages: list, model: str, max_tokens: int, temp: float, affinity=None):
+        """向上游发起一次非流式调用"""
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=temp,
-                stream=False
+            started_at = time.perf_counter()
+            response = await self.router.post(
+                "/chat/completions",
+                model,
+                json=self._build_payload(messages, model, max_tokens, temp, stream=False),
+                affinity=affinity
             )
+            body = response.json()
+            content = body["choices"][0]["message"]["content"].strip()
+            # token数优先取上游usage，缺失时本地估算
+            usage = build_usage(body.get("usage"), messages, content)
+            record_usage(model, "chat", usage, time.perf_counter() - started_at)
             # 返回与OpenAI API兼容的格式
             current_time = int(time.time())
             return {
                 "choices": [
                     {
                         "message": {
-                            "content": response.choices[0].message.content.strip(),
+                            "content": content,
                             "role": "assistant"
                         },
                         "finish_reason": "stop",
@@ -59,76 +228,343 @@ class OllamaClient:
                 "id": f"chatcmpl-{str(current_time)}",
                 "model": model,
                 "object": "chat.completion",
-                "usage": {
-                    "completion_tokens": len(response.choices[0].message.content),
-                    "prompt_tokens": len(prompt),
-                    "total_tokens": len(prompt) + len(response.choices[0].message.content)
-                }
+                "usage": usage
             }
         except Exception as e:
+            REQUESTS.labels(model, "chat", "error").inc()
             raise HTTPException(status_code=500, detail=f"调用失败：{str(e)}")
 
-    def chat_stream(self, prompt: str, model=None, max_tokens=1024, temp=0.7):
-        """流式调用（同步）"""
+    async def chat_stream(self, prompt: str, model=None, max_tokens=1024, temp=0.7, terminator="\n",
+                          messages=None, affinity=None, on_complete=None):
+        """
+        流式调用（异步生成器，默认逐块输出NDJSON，最后一块附带usage）
+
+        生成器只在消费方取走上一块后才继续读取上游，慢客户端会通过TCP反压传导到Ollama；
+        生成器被取消或关闭时会立即断开上游连接，Ollama随之停止生成。
+
+        Args:
+            terminator: 每块的结尾，NDJSON为换行，SSE由框架负责分隔时传空字符串
+            messages: 完整的多轮消息（会话接口使用），未提供时只发送prompt一条用户消息
+            affinity: 后端亲和键，相同键的请求尽量发往同一个后端以复用KV缓存
+            on_complete: 生成完成后以 (完整回复, usage) 调用，可以在usage中补充字段
+        """
         model = model or self.default_model
+        if messages is None:
+            messages = [{"role": "user", "content": prompt}]
+        envelope = ChunkEnvelope(model, terminator)
+        pieces = []
+        upstream_usage = None
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=temp,
-                stream=True
-            )
-            for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    yield json.dumps({
-                        "choices": [{
-                            "delta": {
-                                "content": chunk.choices[0].delta.content
-                            },
-                            "finish_reason": None,
-                            "index": 0
-                        }],
-                        "created": int(time.time()),
-                        "id": f"chatcmpl-{str(time.time())}-stream",
-                        "model": model,
-                        "object": "chat.completion.chunk"
-                    }, ensure_ascii=False) + "\n"
-            yield json.dumps({
-                "choices": [{
-                    "delta": {},
-                    "finish_reason": "stop",
-                    "index": 0
-                }],
-                "created": int(time.time()),
-                "id": f"chatcmpl-{str(time.time())}-stream",
-                "model": model,
-                "object": "chat.completion.chunk"
-            }, ensure_ascii=False) + "\n"
+            async with self.scheduler.slot(model):
+                started_at = time.perf_counter()
+                first_token_at = None
+                # 收到第一行之前失败时，路由会换一个后端重试
+                lines = self.router.stream_lines(
+                    "/chat/completions",
+                    model,
+                    json=self._build_payload(messages, model, max_tokens, temp, stream=True),
+                    affinity=affinity
+                )
+                try:
+                    # 上游以SSE格式返回：每行 "data: {...}"，以 "data: [DONE]" 结束
+                    async for line in lines:
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if chunk.get("usage"):
+                            upstream_usage = chunk["usage"]
+                        if not chunk.get("choices"):
+                            continue
+                        content = chunk["choices"][0].get("delta", {}).get("content")
+                        if content is not None:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                TIME_TO_FIRST_TOKEN.labels(model).observe(first_token_at - started_at)
+                            pieces.append(content)
+                            yield envelope.delta(content)
+                finally:
+                    # 立即关闭上游连接，而不是等垃圾回收
+                    await lines.aclose()
+            reply = "".join(pieces)
+            usage = build_usage(upstream_usage, messages, reply)
+            record_usage(model, "stream", usage, time.perf_counter() - (first_token_at or started_at))
+            if on_complete is not None:
+                on_complete(reply, usage)
+            yield envelope.finish(usage)
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：上面的finally中已关闭上游连接
+            REQUESTS.labels(model, "stream", "cancelled").inc()
+            raise
         except Exception as e:
-            yield json.dumps({
-                "error": {
-                    "message": str(e),
-                    "type": "server_error"
-                },
-                "object": "error"
-            }, ensure_ascii=False) + "\n"
+            REQUESTS.labels(model, "stream", "error").inc()
+            yield envelope.error(str(e))
+
+# 后台健康探测：定期检查Ollama是否可用，维护就绪状态
+class HealthProber:
+    def __init__(self, client: AsyncOllamaClient, interval: float = 10.0):
+        self.client = client
+        self.interval = interval
+        self.ready = False
+        self.last_checked = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        self._task = None
+
+    async def probe(self) -> bool:
+        """执行一次探测并更新状态"""
+        try:
+            await self.client.check_service()
+            self.ready = True
+            self.last_error = None
+            self.consecutive_failures = 0
+        except Exception as e:
+            self.ready = False
+            self.last_error = str(e) or type(e).__name__
+            self.consecutive_failures += 1
+        self.last_checked = time.time()
+        return self.ready
+
+    async def _run(self):
+        while True:
+            await self.probe()
+            # 未就绪时缩短探测间隔，Ollama启动后尽快恢复
+            await asyncio.sleep(self.interval if self.ready else min(self.interval, 2.0))
+
+    def start(self):
+        """启动后台探测任务（需在事件循环中调用）"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "backends": self.client.router.status(),
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+            "consecutive_failures": self.consecutive_failures
+        }
 
 # 初始化（替换为你的本地模型名）
-ollama_client = OllamaClient(default_model="qwen:0.5b-chat")
+ollama_client = AsyncOllamaClient(default_model="qwen:0.5b-chat")
+BATCH_MAX_CONCURRENCY = int(os.getenv("MODEL_BATCH_MAX_CONCURRENCY", "32"))
+chat_sessions = ChatSessionStore(
+    max_sessions=int(os.getenv("MODEL_SESSION_MAX", "1000")),
+    max_history_tokens=int(os.getenv("MODEL_SESSION_MAX_HISTORY_TOKENS", "3000")),
+    ttl=float(os.getenv("MODEL_SESSION_TTL", "3600"))
+)
+health_prober = HealthProber(ollama_client, interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10")))
+
+_batch_store = None
+
+def get_batch_store() -> BatchStore:
+    """批次状态数据库在第一次使用时打开（导入本模块不创建文件），相对路径相对于本文件所在目录"""
+    global _batch_store
+    if _batch_store is None:
+        path = os.getenv("MODEL_BATCH_DB", "data/batches.db")
+        _batch_store = BatchStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), path))
+    return _batch_store
 
-# 接口定义
+# 接口定义（async端点直接运行在事件循环上，不占用线程池）
 @model_router.post("/chat")
-def model_chat(
+async def model_chat(
     prompt: str = Body(..., description="用户输入"),
     model: str = Body(None),
     max_tokens: int = Body(1024, ge=1),
-    temp: float = Body(0.7, ge=0.0, le=1.0)
+    temp: float = Body(0.7, ge=0.0, le=1.0),
+    cache: bool = Body(None, description="是否使用响应缓存，默认仅temp=0时使用")
 ):
-    return ollama_client.chat(prompt, model, max_tokens, temp)
+    return await ollama_client.chat(prompt, model, max_tokens, temp, cache)
+
+@model_router.get("/cache/stats")
+async def model_cache_stats():
+    return ollama_client.cache.stats()
+
+@model_router.get("/backends")
+async def model_backends():
+    return ollama_client.router.status()
 
 @model_router.post("/chat/stream")
-def model_chat_stream(prompt: str = Body(...), model: str = Body(None)):
-    return StreamingResponse(ollama_client.chat_stream(prompt, model), media_type="application/x-ndjson")
\ No newline at end of file
+async def model_chat_stream(prompt: str = Body(...), model: str = Body(None)):
+    return StreamingResponse(ollama_client.chat_stream(prompt, model), media_type="application/x-ndjson")
+
+@model_router.post("/chat/sse")
+async def model_chat_sse(
+    prompt: str = Body(..., description="用户输入"),
+    model: str = Body(None),
+    max_tokens: int = Body(1024, ge=1),
+    temp: float = Body(0.7, ge=0.0, le=1.0)
+):
+    """SSE流式接口：客户端断开或长时间不读取时取消上游生成"""
+    async def events():
+        stream = ollama_client.chat_stream(prompt, model, max_tokens, temp, terminator="")
+        try:
+            async for chunk in stream:
+                yield chunk
+            yield "[DONE]"
+        finally:
+            await stream.aclose()
+
+    return EventSourceResponse(events(), ping=15, send_timeout=SSE_SEND_TIMEOUT)
+
+def _get_session(session_id: str):
+    session = chat_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return session
+
+@model_router.post("/sessions")
+async def create_session(
+    system: str = Body(None, description="固定的system提示，不传则使用默认辅导提示"),
+    model: str = Body(None)
+):
+    return chat_sessions.describe(chat_sessions.create(system, model))
+
+@model_router.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    return chat_sessions.describe(_get_session(session_id), include_history=True)
+
+@model_router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not chat_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return {"deleted": True, "session_id": session_id}
+
+@model_router.post("/sessions/{session_id}/chat")
+async def session_chat(
+    session_id: str,
+    message: str = Body(..., description="用户输入"),
+    max_tokens: int = Body(1024, ge=1),
+    temp: float = Body(0.7, ge=0.0, le=1.0)
+):
+    """会话内对话：历史保存在服务端，usage中的prompt_tokens_reused为复用的prompt token数
+
+    同一会话的并发请求按到达顺序串行执行，每一轮都基于上一轮完成后的历史"""
+    session = _get_session(session_id)
+    async with session.lock:
+        messages = chat_sessions.build_messages(session, message)
+        result = await ollama_client.chat(
+            message, session.model, max_tokens, temp, cache=False, messages=messages, affinity=session.id
+        )
+        usage = dict(result["usage"])
+        chat_sessions.record_turn(session, messages, result["choices"][0]["message"]["content"], usage)
+    return {**result, "usage": usage, "session_id": session.id}
+
+@model_router.post("/sessions/{session_id}/chat/stream")
+async def session_chat_stream(
+    session_id: str,
+    message: str = Body(..., description="用户输入"),
+    max_tokens: int = Body(1024, ge=1),
+    temp: float = Body(0.7, ge=0.0, le=1.0)
+):
+    session = _get_session(session_id)
+
+    async def turn():
+        # 锁在生成器内获取和释放：流结束、出错或客户端断开时都会释放，响应没有开始发送时不会占用锁
+        async with session.lock:
+            messages = chat_sessions.build_messages(session, message)
+
+            def on_complete(reply, usage):
+                chat_sessions.record_turn(session, messages, reply, usage)
+
+            stream = ollama_client.chat_stream(
+                message, session.model, max_tokens, temp,
+                messages=messages, affinity=session.id, on_complete=on_complete
+            )
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+    return StreamingResponse(turn(), media_type="application/x-ndjson")
+
+def _batch_options(options) -> dict:
+    """解析批量任务参数（JSON请求体或multipart表单字段）"""
+    try:
+        result = {
+            "model": options.get("model") or None,
+            "max_tokens": int(options.get("max_tokens", 1024)),
+            "temp": float(options.get("temp", 0.7)),
+            "concurrency": int(options.get("concurrency", 4))
+        }
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"参数错误：{str(e)}")
+    if result["max_tokens"] < 1 or not 0.0 <= result["temp"] <= 1.0 or result["concurrency"] < 1:
+        raise HTTPException(status_code=400, detail="参数错误：max_tokens>=1，0<=temp<=1，concurrency>=1")
+    result["concurrency"] = min(result["concurrency"], BATCH_MAX_CONCURRENCY)
+    return result
+
+@model_router.post("/batch")
+async def model_batch(request: Request):
+    """
+    批量生成：JSON请求体 {"prompts": [...], "model", "max_tokens", "temp", "concurrency"}，
+    或multipart上传JSONL文件（字段file，每行 {"prompt": ...}）。
+
+    结果按完成顺序以NDJSON返回，第一行包含batch_id，中断后可通过 /batch/{batch_id}/resume 继续
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        options = await request.form()
+        upload = options.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="缺少JSONL文件（字段名file）")
+        try:
+            prompts = parse_jsonl_prompts(await upload.read())
+        except (UnicodeDecodeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"JSONL解析失败：{str(e)}")
+    else:
+        try:
+            options = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="请求体不是合法的JSON")
+        prompts = options.get("prompts") if isinstance(options, dict) else None
+    if not prompts or not isinstance(prompts, list) or not all(isinstance(p, str) for p in prompts):
+        raise HTTPException(status_code=400, detail="prompts必须是非空的字符串列表")
+
+    params = _batch_options(options)
+    batch_store = get_batch_store()
+    batch_id = batch_store.create(prompts, params["model"], params["max_tokens"], params["temp"])
+    return StreamingResponse(
+        run_batch(ollama_client, batch_store, batch_id, params["concurrency"]),
+        media_type="application/x-ndjson"
+    )
+
+@model_router.get("/batch/{batch_id}")
+async def model_batch_status(batch_id: str):
+    batch = get_batch_store().get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return batch
+
+@model_router.post("/batch/{batch_id}/resume")
+async def model_batch_resume(
+    batch_id: str,
+    concurrency: int = 4,
+    include_finished: bool = False,
+    retry_failed: bool = False
+):
+    """继续执行批次中未完成的条目（例如网关重启之后）"""
+    batch_store = get_batch_store()
+    if batch_store.get(batch_id) is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    if retry_failed:
+        batch_store.retry_failed(batch_id)
+    return StreamingResponse(
+        run_batch(
+            ollama_client, batch_store, batch_id,
+            min(max(concurrency, 1), BATCH_MAX_CONCURRENCY),
+            include_finished=include_finished
+        ),
+        media_type="application/x-ndjson"
+    )
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+知识图谱基准测试 - 在合成的大规模课程体系上测量 KnowledgeGraphMod 的索引化存储
+
+合成课程：若干学科，每个学科是一棵按分支数展开的知识点树（默认共约10万个知识点），测量：
+- 逐个 add_knowledge_point 建库的耗时（含子节点、学科、祖先链索引的增量维护）
+- get_knowledge_points_by_subject / get_related_knowledge_points / 掌握程度概览 / analyze_learning_data 的延迟
+- extract_knowledge_gaps 在大规模模拟考试上的单次遍历聚合与列式聚合
+- generate_knowledge_map 的全量构建与一个知识点掌握程度变化后的增量构建（含JSON序列化）
+- 与原来的全表扫描实现（按学科过滤全部知识点、逐层扫描全部知识点找子节点）对比
+
+用法：
+    python benchmark_knowledge_graph.py
+    python benchmark_knowledge_graph.py --nodes 200000 --subjects 8 --branching 6
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import time
+from typing import List
+
+MOD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "mods", "openagents.mods.education.knowledge_graph", "__init__.py")
+
+
+def load_mod():
+    # 基准测试使用自己创建的实例，模块级实例不使用持久化存储
+    os.environ["KG_MASTERY_DB"] = ""
+    spec = importlib.util.spec_from_file_location("knowledge_graph_mod", MOD_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_curriculum(module, nodes: int, subjects: int, branching: int, seed: int) -> List:
+    """按广度优先生成每个学科的知识点树，返回知识点列表（父节点总在子节点之前）"""
+    rng = random.Random(seed)
+    per_subject = nodes // subjects
+    points = []
+    for s in range(subjects):
+        subject = f"subject{s}"
+        queue = [None]
+        count = 0
+        while queue and count < per_subject:
+            parent = queue.pop(0)
+            for _ in range(branching if parent else 1):
+                if count >= per_subject:
+                    break
+                kp_id = f"{subject}_{count}"
+                points.append(module.KnowledgePoint(kp_id, kp_id, subject, subject, parent,
+                                                    importance=rng.randint(1, 5)))
+                queue.append(kp_id)
+                count += 1
+    return points
+
+
+def legacy_by_subject(knowledge_base: dict, subject: str) -> list:
+    """原来的实现：遍历全部知识点按学科过滤"""
+    return [kp for kp in knowledge_base.values() if kp.subject == subject]
+
+
+def legacy_related(knowledge_base: dict, kp_id: str, depth: int) -> list:
+    """原来的实现：每访问一个节点就扫描全部知识点找子节点"""
+    related = {kp_id}
+    current = knowledge_base[kp_id]
+    parent = current
+    for _ in range(depth):
+        if parent.parent_id and parent.parent_id in knowledge_base:
+            parent = knowledge_base[parent.parent_id]
+            related.add(parent.id)
+        else:
+            break
+
+    def get_children(kp, current_depth):
+        if current_depth >= depth:
+            return
+        for child in knowledge_base.values():
+            if child.parent_id == kp.id:
+                related.add(child.id)
+                get_children(child, current_depth + 1)
+
+    get_children(current, 0)
+    return [knowledge_base[i] for i in related]
+
+
+def best_of(func, repeat: int) -> float:
+    """多次运行取最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识图谱索引化存储基准测试")
+    parser.add_argument("--nodes", type=int, default=100000, help="知识点总数")
+    parser.add_argument("--subjects", type=int, default=10)
+    parser.add_argument("--branching", type=int, default=8, help="每个知识点的子知识点数")
+    parser.add_argument("--questions", type=int, default=200, help="analyze_learning_data 的题目数")
+    parser.add_argument("--exam-questions", type=int, default=2000, help="extract_knowledge_gaps 的题目数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果JSON的输出文件，默认只打印")
+    args = parser.parse_args()
+
+    module = load_mod()
+    mod = module.KnowledgeGraphMod()
+    points = build_curriculum(module, args.nodes, args.subjects, args.branching, args.seed)
+
+    start = time.perf_counter()
+    for kp in points:
+        mod.add_knowledge_point(kp)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    subject = "subject0"
+    subject_ids = [kp.id for kp in mod.get_knowledge_points_by_subject(subject)]
+    root = subject_ids[0]
+    inner = subject_ids[1]  # 有子节点也有父节点的知识点
+    knowledge_base = mod.knowledge_base
+
+    student_id = "student_bench"
+    mod.update_student_mastery(student_id, subject, {kp_id: rng.random() for kp_id in rng.sample(subject_ids, min(1000, len(subject_ids)))})
+    questions = [
+        {
+            "id": f"q{i}",
+            "knowledge_points": [rng.choice(subject_ids)],
+            "is_correct": rng.random() < 0.6,
+            "error_type": rng.choice(["concept_error", "calculation_error", None]),
+            "answer_time": rng.randint(10, 300)
+        }
+        for i in range(args.questions)
+    ]
+    learning_data = {"student_id": student_id, "subject": subject, "questions": questions}
+    # 模拟考试：--exam-questions 道题，每题1~3个知识点
+    exam = [
+        {
+            "id": f"exam{i}",
+            "knowledge_points": rng.sample(subject_ids, rng.randint(1, 3)),
+            "is_correct": rng.random() < 0.6,
+            "error_type": rng.choice(["concept_error", "calculation_error", "application_error"]),
+            "answer_time": rng.randint(10, 300)
+        }
+        for i in range(args.exam_questions)
+    ]
+
+    knowledge_gaps = mod.extract_knowledge_gaps(questions)
+
+    def full_map():
+        """清空知识树缓存后全量构建并序列化"""
+        mod._tree_caches.clear()
+        mod.generate_knowledge_map(knowledge_gaps, subject, student_id)
+        return mod.knowledge_tree_json(student_id, subject)
+
+    def incremental_map():
+        """修改一个叶子知识点的掌握程度后增量构建并序列化"""
+        mod.update_student_mastery(student_id, subject, {subject_ids[-1]: rng.random()})
+        mod.generate_knowledge_map(knowledge_gaps, subject, student_id)
+        return mod.knowledge_tree_json(student_id, subject)
+
+    results = {
+        "config": vars(args),
+        "knowledge_points": len(knowledge_base),
+        "subject_size": len(subject_ids),
+        "build_seconds": round(build_seconds, 3),
+        "add_knowledge_point_us": round(build_seconds / len(points) * 1e6, 3),
+        "by_subject_ms": {
+            "indexed": best_of(lambda: mod.get_knowledge_points_by_subject(subject), args.repeat),
+            "legacy_scan": best_of(lambda: legacy_by_subject(knowledge_base, subject), args.repeat)
+        },
+        "related_root_depth2_ms": {
+            "indexed": best_of(lambda: mod.get_related_knowledge_points(root, 2), args.repeat),
+            "legacy_scan": best_of(lambda: legacy_related(knowledge_base, root, 2), 1)
+        },
+        "related_inner_depth2_ms": {
+            "indexed": best_of(lambda: mod.get_related_knowledge_points(inner, 2), args.repeat),
+            "legacy_scan": best_of(lambda: legacy_related(knowledge_base, inner, 2), 1)
+        },
+        "extract_knowledge_gaps_ms": {
+            "single_pass": best_of(lambda: mod.extract_knowledge_gaps(exam, columnar=False), args.repeat),
+            "columnar": best_of(lambda: mod.extract_knowledge_gaps(exam, columnar=True), args.repeat)
+        },
+        "knowledge_map_ms": {
+            "full_rebuild": best_of(full_map, args.repeat),
+            "incremental": best_of(incremental_map, args.repeat)
+        },
+        "mastery_overview_ms": best_of(lambda: mod._calculate_mastery_overview(student_id, subject), args.repeat),
+        "analyze_learning_data_ms": best_of(lambda: mod.analyze_learning_data(learning_data), args.repeat)
+    }
+
+    # 增量更新：把根节点下的一棵子树移动到它的兄弟节点下，整棵子树的祖先链随之更新
+    kp = knowledge_base[subject_ids[2]]
+    subtree_size = 1 + len(mod.graph.descendants(kp.id, args.nodes))
+    start = time.perf_counter()
+    mod.update_knowledge_point(module.KnowledgePoint(kp.id, kp.name, kp.category, kp.subject, inner,
+                                                     importance=kp.importance))
+    results["reparent_subtree"] = {
+        "nodes": subtree_size,
+        "ms": round((time.perf_counter() - start) * 1000, 3)
+    }
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
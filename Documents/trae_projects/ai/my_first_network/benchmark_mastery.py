@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+掌握程度存储基准测试 - 对比 MasteryStore（按行压缩的数组）与原来的 dict-of-dicts
+
+合成数据：一个学科若干知识点，每个学生随机接触其中一部分知识点，测量：
+- 每个学生占用的内存（tracemalloc 统计写入全部学生前后的内存差）
+- 学科掌握率 + 分档统计的延迟（向量化 vs 原来的逐个知识点循环）
+- 写入一次答题更新的延迟
+- 指定 --db 时：持久化写入全部学生的吞吐（批量提交）和重启后第一次访问学生的延迟（按学生延迟加载）
+
+用法：
+    python benchmark_mastery.py
+    python benchmark_mastery.py --students 50000 --knowledge-points 5000 --per-student 300
+    python benchmark_mastery.py --db /tmp/mastery_bench.db
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import time
+import tracemalloc
+
+MOD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "mods", "openagents.mods.education.knowledge_graph", "__init__.py")
+
+
+def load_mod():
+    # 基准测试使用自己创建的实例，模块级实例不使用持久化存储
+    os.environ["KG_MASTERY_DB"] = ""
+    spec = importlib.util.spec_from_file_location("knowledge_graph_mod", MOD_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_overview(student_mastery: dict, subject_kps: list) -> dict:
+    """原来的实现：逐个知识点查字典并分档"""
+    total = excellent = good = average = poor = 0
+    rate = 0.0
+    for kp in subject_kps:
+        level = student_mastery.get(kp.id, kp.mastery_level)
+        rate += level
+        total += 1
+        if level >= 0.8:
+            excellent += 1
+        elif level >= 0.6:
+            good += 1
+        elif level >= 0.4:
+            average += 1
+        else:
+            poor += 1
+    return {"mastery_rate": rate / total if total else 0.0, "excellent_count": excellent,
+            "good_count": good, "average_count": average, "poor_count": poor, "total_count": total}
+
+
+def measure_memory(build) -> int:
+    """build() 构建的数据结构占用的字节数"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    data = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del data
+    return after - before
+
+
+def best_of(func, repeat: int) -> float:
+    """多次运行取最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 4)
+
+
+def benchmark_persistent(module, path: str, records: list, repeat: int) -> dict:
+    """写入全部学生后关闭，再用新的存储模拟重启后的按学生延迟加载"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    store = module.MasteryStore(module.SQLiteMasteryBackend(path))
+    start = time.perf_counter()
+    for i, record in enumerate(records):
+        store.set(f"student{i}", record)
+    store.close()
+    write_seconds = time.perf_counter() - start
+    commits = store.backend.commits
+
+    start = time.perf_counter()
+    store = module.MasteryStore(module.SQLiteMasteryBackend(path))
+    open_ms = round((time.perf_counter() - start) * 1000, 3)
+    rng = random.Random(0)
+    students = [f"student{i}" for i in rng.sample(range(len(records)), min(repeat, len(records)))]
+    latencies = []
+    for student_id in students:
+        start = time.perf_counter()
+        store.get(student_id)
+        latencies.append(time.perf_counter() - start)
+    store.close()
+    return {
+        "cells_written": sum(len(record) for record in records),
+        "write_cells_per_second": round(sum(len(record) for record in records) / write_seconds, 1),
+        "commits": commits,
+        "open_ms": open_ms,
+        "first_access_p50_ms": round(sorted(latencies)[len(latencies) // 2] * 1000, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="学生掌握程度存储基准测试")
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--knowledge-points", type=int, default=5000, help="学科的知识点数")
+    parser.add_argument("--per-student", type=int, default=200, help="每个学生有记录的知识点数")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="测试持久化存储时使用的数据库文件（会被覆盖）")
+    parser.add_argument("--output", help="结果JSON的输出文件，默认只打印")
+    args = parser.parse_args()
+
+    module = load_mod()
+    mod = module.KnowledgeGraphMod()
+    subject = "subject0"
+    for i in range(args.knowledge_points):
+        mod.add_knowledge_point(module.KnowledgePoint(f"kp{i}", f"kp{i}", subject, subject))
+    subject_kps = mod.get_knowledge_points_by_subject(subject)
+    kp_ids = [kp.id for kp in subject_kps]
+
+    rng = random.Random(args.seed)
+    records = [
+        {kp_id: round(rng.random(), 3) for kp_id in rng.sample(kp_ids, min(args.per_student, len(kp_ids)))}
+        for _ in range(args.students)
+    ]
+
+    def build_store():
+        store = module.MasteryStore()
+        for i, record in enumerate(records):
+            store.set(f"student{i}", record)
+        return store
+
+    def build_legacy():
+        # 每个值复制成新的float对象，与原来逐个写入时一样各自占用内存
+        return {f"student{i}": {kp_id: level + 0.0 for kp_id, level in record.items()}
+                for i, record in enumerate(records)}
+
+    store_bytes = measure_memory(build_store)
+    legacy_bytes = measure_memory(build_legacy)
+
+    for i, record in enumerate(records):
+        mod.update_student_mastery(f"student{i}", subject, record)
+    legacy = build_legacy()
+    student_id = "student0"
+    questions = [
+        {"id": f"q{i}", "knowledge_points": [rng.choice(kp_ids)], "is_correct": rng.random() < 0.6}
+        for i in range(20)
+    ]
+
+    results = {
+        "config": vars(args),
+        "memory_bytes_per_student": {
+            "mastery_store": round(store_bytes / args.students, 1),
+            "dict_of_dicts": round(legacy_bytes / args.students, 1)
+        },
+        "subject_overview_ms": {
+            # 掌握率和分档统计：新实现各一次NumPy调用，旧实现一次循环同时算出两者
+            "vectorized": best_of(lambda: (mod._calculate_mastery_rate(student_id, subject),
+                                           mod._calculate_mastery_overview(student_id, subject)), args.repeat),
+            "legacy_loop": best_of(lambda: legacy_overview(legacy[student_id], subject_kps), args.repeat)
+        },
+        "answer_update_ms": best_of(lambda: mod._update_student_mastery(student_id, subject, questions), args.repeat),
+        "store": mod.mastery.stats()
+    }
+    if args.db:
+        results["persistent"] = benchmark_persistent(module, args.db, records, args.repeat)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
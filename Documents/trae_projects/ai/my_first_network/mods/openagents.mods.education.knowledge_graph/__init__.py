@@ -2,11 +2,36 @@
 知识图谱Mod - 提供知识点管理、知识图谱生成和掌握程度评估功能
 """
 
-from typing import Dict, List, Set, Any, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Any, Tuple
+import atexit
+import bisect
 import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
 from datetime import datetime
 
+import numpy as np
+
+# 题目数达到该值时，extract_knowledge_gaps 默认使用NumPy列式聚合
+COLUMNAR_THRESHOLD = 5000
+
+# 掌握程度分档的边界：较差 < 0.4 <= 一般 < 0.6 <= 良好 < 0.8 <= 优秀
+MASTERY_BUCKETS = np.array([0.4, 0.6, 0.8])
+
+# 错误类型 -> 盲点原因
+GAP_REASONS = {
+    "concept_error": "概念理解错误",
+    "calculation_error": "计算错误",
+    "application_error": "应用错误",
+    "incomplete_solution": "答案不完整",
+    "misinterpretation": "题意理解错误",
+    "unknown": "未知原因"
+}
+
 
 @dataclass
 class KnowledgePoint:
@@ -30,12 +55,451 @@ class KnowledgeGap:
     related_questions: List[str] = None  # 相关题目ID列表
 
 
+class KnowledgeGraphStore:
+    """
+    带索引的知识点存储
+
+    在知识点字典之外维护三个索引，添加/更新知识点时增量更新：
+    - 子节点邻接表：父ID -> 子ID列表（父知识点还没有添加时也先记录）
+    - 学科索引：学科 -> 知识点ID列表
+    - 祖先链：知识点ID -> (父ID, 祖父ID, ...)，只包含已存在的知识点，遇到不存在的父ID即停止
+    两个列表索引都按知识点的添加顺序排列，与按添加顺序遍历 nodes 的结果一致
+    """
+
+    def __init__(self):
+        self.nodes = {}  # 知识点ID -> 知识点
+        self._order = {}  # 知识点ID -> 添加序号
+        self._children = {}  # 父ID -> 子ID列表
+        self._subjects = {}  # 学科 -> 知识点ID列表
+        self._ancestors = {}  # 知识点ID -> 祖先ID元组（由近到远）
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, kp_id: str) -> bool:
+        return kp_id in self.nodes
+
+    def _insert(self, ids: List[str], kp_id: str):
+        """按添加序号插入（新知识点的序号最大，直接追加）"""
+        order = self._order[kp_id]
+        if not ids or self._order[ids[-1]] < order:
+            ids.append(kp_id)
+        else:
+            keys = [self._order[i] for i in ids]
+            ids.insert(bisect.bisect(keys, order), kp_id)
+
+    def _refresh_ancestors(self, kp_id: str):
+        """重新计算一个知识点及其所有后代的祖先链"""
+        stack = [kp_id]
+        visited = set()
+        while stack:
+            current = stack.pop()
+            if current in visited:
+                continue
+            visited.add(current)
+            parent_id = self.nodes[current].parent_id
+            if parent_id and parent_id in self.nodes:
+                self._ancestors[current] = (parent_id,) + self._ancestors[parent_id]
+            else:
+                self._ancestors[current] = ()
+            stack.extend(self._children.get(current, ()))
+
+    def _creates_cycle(self, kp_id: str, parent_id: Optional[str]) -> bool:
+        """把 kp_id 的父节点设为 parent_id 是否会形成环"""
+        if not parent_id:
+            return False
+        if parent_id == kp_id or kp_id in self._ancestors.get(parent_id, ()):
+            return True
+        # 祖先链在第一个不存在的父ID处中断：先添加的子知识点以 kp_id 为父节点时，链的顶端指向 kp_id
+        if parent_id in self.nodes and kp_id not in self.nodes:
+            chain = self._ancestors[parent_id]
+            top = self.nodes[chain[-1] if chain else parent_id]
+            return top.parent_id == kp_id
+        return False
+
+    def add(self, kp: KnowledgePoint) -> bool:
+        """添加知识点；知识点已存在或父节点会形成环（包括父节点是自身）时返回 False"""
+        if kp.id in self.nodes or self._creates_cycle(kp.id, kp.parent_id):
+            return False
+        self.nodes[kp.id] = kp
+        self._order[kp.id] = len(self._order)
+        if kp.parent_id:
+            self._children.setdefault(kp.parent_id, []).append(kp.id)
+        self._subjects.setdefault(kp.subject, []).append(kp.id)
+        # 先添加的子知识点（父知识点当时还不存在）的祖先链也需要更新
+        self._refresh_ancestors(kp.id)
+        return True
+
+    def update(self, kp: KnowledgePoint) -> bool:
+        """更新知识点；知识点不存在或新的父节点会形成环时返回 False"""
+        old = self.nodes.get(kp.id)
+        if old is None:
+            return False
+        if self._creates_cycle(kp.id, kp.parent_id):
+            return False
+        self.nodes[kp.id] = kp
+        if kp.subject != old.subject:
+            self._subjects[old.subject].remove(kp.id)
+            self._insert(self._subjects.setdefault(kp.subject, []), kp.id)
+        if kp.parent_id != old.parent_id:
+            if old.parent_id:
+                self._children[old.parent_id].remove(kp.id)
+            if kp.parent_id:
+                self._insert(self._children.setdefault(kp.parent_id, []), kp.id)
+            self._refresh_ancestors(kp.id)
+        return True
+
+    def get(self, kp_id: str) -> Optional[KnowledgePoint]:
+        return self.nodes.get(kp_id)
+
+    def by_subject(self, subject: str) -> List[KnowledgePoint]:
+        return [self.nodes[kp_id] for kp_id in self._subjects.get(subject, ())]
+
+    def subject_ids(self, subject: str) -> List[str]:
+        """学科的知识点ID（按添加顺序）"""
+        return self._subjects.get(subject, [])
+
+    def children(self, kp_id: str) -> List[str]:
+        """直接子知识点的ID（按添加顺序）"""
+        return self._children.get(kp_id, [])
+
+    def ancestors(self, kp_id: str) -> Tuple[str, ...]:
+        """祖先知识点的ID，由近到远"""
+        return self._ancestors.get(kp_id, ())
+
+    def descendants(self, kp_id: str, depth: int) -> List[str]:
+        """depth 层以内的后代知识点ID（广度优先）"""
+        result = []
+        level = [kp_id]
+        for _ in range(depth):
+            level = [child for parent in level for child in self._children.get(parent, ())]
+            if not level:
+                break
+            result.extend(level)
+        return result
+
+    def ordered(self, kp_ids: Iterable[str]) -> List[str]:
+        """按添加顺序排列知识点ID（忽略不存在的ID）"""
+        return sorted((kp_id for kp_id in kp_ids if kp_id in self.nodes), key=self._order.__getitem__)
+
+
+class SQLiteMasteryBackend:
+    """
+    掌握程度的持久化存储（SQLite，WAL模式）
+
+    - 写入先放进内存中的待提交队列（同一个格子多次写入只保留最后一次），
+      攒够 batch_size 个格子时，或后台线程每隔 flush_interval 秒，在一个事务中批量提交
+    - 进程正常退出时提交剩余的写入；
+      进程崩溃时最多丢失最近 flush_interval 秒内未提交的写入，已提交的数据不会损坏
+    - 按学生读取（主键为 (学生ID, 知识点ID)），启动时不读取全部历史
+    - 第一次读写时才打开数据库、启动后台线程，创建对象本身没有副作用
+    """
+
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 1.0):
+        """
+        Args:
+            path: 数据库文件路径
+            batch_size: 待提交的格子数达到该值时立即提交
+            flush_interval: 后台定时提交的间隔（秒），即未提交写入的最长停留时间；为0时每次写入都立即提交
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.commits = 0
+
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pending = {}  # (学生ID, 知识点ID) -> (掌握程度, 写入时间)
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """打开数据库（只在第一次调用时），并启动后台提交线程"""
+        if self._conn is None:
+            if self._closed.is_set():
+                raise RuntimeError(f"掌握程度数据库已关闭：{self.path}")
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS mastery ("
+                "  student_id TEXT NOT NULL, kp_id TEXT NOT NULL, level REAL NOT NULL, updated_at REAL NOT NULL,"
+                "  PRIMARY KEY (student_id, kp_id)) WITHOUT ROWID"
+            )
+            conn.commit()
+            self._conn = conn
+            if self.flush_interval > 0:
+                self._flusher = threading.Thread(target=self._run_flusher, name="mastery-flusher", daemon=True)
+                self._flusher.start()
+            atexit.register(self.close)
+        return self._conn
+
+    def load(self, student_id: str) -> Dict[str, float]:
+        """读取一个学生的全部掌握程度（包括尚未提交的写入）"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT kp_id, level FROM mastery WHERE student_id = ?", (student_id,)
+            ).fetchall()
+            mastery = dict(rows)
+            for (pending_student, kp_id), (level, _) in self._pending.items():
+                if pending_student == student_id:
+                    mastery[kp_id] = level
+        return mastery
+
+    def write(self, student_id: str, mastery: Dict[str, float]):
+        """写入一个学生的掌握程度（放入待提交队列，按批量大小和时间间隔提交）"""
+        if not mastery:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection()
+            for kp_id, level in mastery.items():
+                self._pending[(student_id, kp_id)] = (float(level), now)
+            if len(self._pending) >= self.batch_size or self.flush_interval <= 0:
+                self.flush()
+
+    def flush(self):
+        """在一个事务中提交全部待提交的写入"""
+        with self._lock:
+            if not self._pending or self._conn is None:
+                return
+            rows = [(student_id, kp_id, level, updated_at)
+                    for (student_id, kp_id), (level, updated_at) in self._pending.items()]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO mastery (student_id, kp_id, level, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (student_id, kp_id) DO UPDATE SET level = excluded.level, updated_at = excluded.updated_at",
+                    rows
+                )
+            self._pending = {}
+            self.commits += 1
+
+    def _run_flusher(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """提交剩余的写入并关闭数据库连接（之后不能再读写）"""
+        self._closed.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        with self._lock:
+            if self._conn is None:
+                return
+            self.flush()
+            self._conn.close()
+            self._conn = None
+        atexit.unregister(self.close)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": self.path,
+                "pending": len(self._pending),
+                "commits": self.commits
+            }
+
+
+class MasteryStore:
+    """
+    学生知识点掌握程度的紧凑存储
+
+    学生ID和知识点ID分别映射为整数下标；每个学生一行，按行压缩存放（类似CSR）：
+    升序的知识点列下标（int32）+ 掌握程度（float32）。大多数学生只接触少量知识点，
+    只存有记录的格子，每个格子8字节，而不是dict中的装箱浮点数。
+    float32约有7位有效数字，读出时统一保留6位小数。
+
+    指定 backend（SQLiteMasteryBackend）时写入同时持久化，学生第一次被访问时才从 backend 加载。
+    """
+
+    def __init__(self, backend: SQLiteMasteryBackend = None):
+        self.backend = backend
+        self._students = {}  # 学生ID -> 行号
+        self._rows = []  # 行号 -> (列下标数组, 掌握程度数组)
+        self._kps = {}  # 知识点ID -> 列下标
+        self._kp_ids = []  # 列下标 -> 知识点ID
+
+    def __contains__(self, student_id: str) -> bool:
+        """学生是否有掌握程度记录"""
+        row = self._row(student_id)
+        return row is not None and len(self._rows[row][0]) > 0
+
+    def __len__(self) -> int:
+        return len(self._students)
+
+    def columns(self, kp_ids: Iterable[str]) -> np.ndarray:
+        """知识点ID对应的列下标（第一次出现的知识点分配新的列）"""
+        columns = []
+        for kp_id in kp_ids:
+            column = self._kps.get(kp_id)
+            if column is None:
+                column = self._kps[kp_id] = len(self._kp_ids)
+                self._kp_ids.append(kp_id)
+            columns.append(column)
+        return np.array(columns, dtype=np.int32)
+
+    @staticmethod
+    def _decode(values: np.ndarray) -> np.ndarray:
+        return np.round(values.astype(np.float64), 6)
+
+    def _row(self, student_id: str) -> Optional[int]:
+        """学生的行号；不在内存中时从 backend 加载（有记录的学生只加载一次），没有记录时返回 None
+
+        backend 中也没有记录的学生不分配行，第一次写入时才分配，避免读取未知学生占用内存"""
+        row = self._students.get(student_id)
+        if row is None and self.backend is not None:
+            mastery = self.backend.load(student_id)
+            if mastery:
+                row = self._insert(student_id, mastery)
+        return row
+
+    def _insert(self, student_id: str, mastery: Dict[str, float]) -> int:
+        row = self._students.get(student_id)
+        if row is None:
+            row = self._students[student_id] = len(self._rows)
+            self._rows.append((np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)))
+        if not mastery:
+            return row
+        new_columns = self.columns(mastery)
+        new_values = np.array(list(mastery.values()), dtype=np.float32)
+        columns, values = self._rows[row]
+        merged_columns = np.concatenate([columns, new_columns])
+        merged_values = np.concatenate([values, new_values])
+        # 同一列保留最后写入的值：稳定排序后取每列的最后一个
+        order = np.argsort(merged_columns, kind="stable")
+        merged_columns, merged_values = merged_columns[order], merged_values[order]
+        last = np.append(merged_columns[1:] != merged_columns[:-1], True)
+        self._rows[row] = (merged_columns[last], merged_values[last])
+        return row
+
+    def get(self, student_id: str) -> Dict[str, float]:
+        """学生的全部掌握程度 {知识点ID: 掌握程度}"""
+        row = self._row(student_id)
+        if row is None:
+            return {}
+        columns, values = self._rows[row]
+        kp_ids = self._kp_ids
+        return dict(zip([kp_ids[c] for c in columns.tolist()], self._decode(values).tolist()))
+
+    def set(self, student_id: str, mastery: Dict[str, float]):
+        """写入学生的掌握程度（已有的知识点覆盖，新的知识点插入）"""
+        # 先加载已有记录，再合并新写入
+        self._row(student_id)
+        self._insert(student_id, mastery)
+        if self.backend is not None:
+            self.backend.write(student_id, mastery)
+
+    def lookup(self, student_id: str, columns: np.ndarray, defaults: np.ndarray,
+               order: np.ndarray = None) -> np.ndarray:
+        """
+        按列下标批量读取掌握程度，没有记录的知识点取 defaults 中的默认值
+
+        Args:
+            order: columns 的升序排列下标（np.argsort(columns)），可以预先算好重复使用
+        """
+        result = np.array(defaults, dtype=np.float64)
+        row = self._row(student_id)
+        if row is None or not len(columns):
+            return result
+        row_columns, row_values = self._rows[row]
+        if order is None:
+            order = np.argsort(columns, kind="stable")
+        sorted_columns = columns[order]
+        positions = np.searchsorted(sorted_columns, row_columns)
+        positions[positions == len(sorted_columns)] = 0
+        found = sorted_columns[positions] == row_columns
+        result[order[positions[found]]] = self._decode(row_values[found])
+        return result
+
+    def flush(self):
+        if self.backend is not None:
+            self.backend.flush()
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        cells = sum(len(columns) for columns, _ in self._rows)
+        stats = {
+            "students": len(self._students),
+            "knowledge_points": len(self._kp_ids),
+            "cells": cells,
+            "bytes": sum(columns.nbytes + values.nbytes for columns, values in self._rows)
+        }
+        if self.backend is not None:
+            stats["backend"] = self.backend.stats()
+        return stats
+
+
+class KnowledgeTreeCache:
+    """
+    一个 (学生, 学科) 的知识树缓存
+
+    保存上一次构建的每个树节点（包含子树）和序列化后的JSON片段。掌握程度变化、
+    盲点变化或相关知识点集合变化时，把变化的知识点及其祖先链标记为脏；
+    下一次构建只重建脏节点，其余子树直接复用缓存的节点和JSON片段。
+    """
+
+    def __init__(self, subject_roots: List[str]):
+        self.subject_roots = subject_roots  # 学科内的根知识点ID（按添加顺序）
+        self.roots = []  # 上一次构建的根节点ID
+        self.extra = None  # 上一次构建时学科之外的相关知识点（盲点及其祖先）
+        self.gaps = set()
+        self.nodes = {}  # 知识点ID -> 树节点
+        self.fragments = {}  # 知识点ID -> 子树的JSON片段
+        self.dirty = set()
+        self.rebuilt = 0  # 累计重建的节点数
+
+    def mark_dirty(self, kp_ids: Iterable[str], graph: KnowledgeGraphStore):
+        """把知识点及其祖先链标记为脏（遇到已经是脏的祖先即停止，其上的祖先已被标记过）"""
+        dirty = self.dirty
+        for kp_id in kp_ids:
+            if kp_id in dirty:
+                continue
+            dirty.add(kp_id)
+            for ancestor_id in graph.ancestors(kp_id):
+                if ancestor_id in dirty:
+                    break
+                dirty.add(ancestor_id)
+
+    def fragment(self, kp_id: str) -> str:
+        """子树的JSON片段（子节点的片段直接拼接）"""
+        fragment = self.fragments.get(kp_id)
+        if fragment is None:
+            node = self.nodes[kp_id]
+            head = json.dumps({key: value for key, value in node.items() if key != "children"}, ensure_ascii=False)
+            children = ", ".join(self.fragment(child["id"]) for child in node["children"])
+            fragment = self.fragments[kp_id] = f'{head[:-1]}, "children": [{children}]}}'
+        return fragment
+
+    def to_json(self) -> str:
+        return "[" + ", ".join(self.fragment(kp_id) for kp_id in self.roots) + "]"
+
+
 class KnowledgeGraphMod:
     """知识图谱Mod的核心实现"""
     
-    def __init__(self):
-        self.knowledge_base = {}  # 存储所有知识点
-        self.student_mastery = {}  # 存储学生知识点掌握程度
+    def __init__(self, mastery_db: str = None):
+        """
+        Args:
+            mastery_db: 掌握程度数据库文件路径，不指定时掌握程度只保存在内存中
+        """
+        self.graph = KnowledgeGraphStore()
+        self.knowledge_base = self.graph.nodes  # 存储所有知识点（只读视图，修改请通过 add/update_knowledge_point）
+        backend = None
+        if mastery_db:
+            backend = SQLiteMasteryBackend(
+                mastery_db,
+                batch_size=int(os.getenv("KG_MASTERY_BATCH_SIZE", "256")),
+                flush_interval=float(os.getenv("KG_MASTERY_FLUSH_INTERVAL", "1.0"))
+            )
+        self.mastery = MasteryStore(backend)  # 存储学生知识点掌握程度
+        self._subject_columns = {}  # 学科 -> (列下标, 升序排列下标, 默认掌握程度)，知识点变化时清空
+        self._tree_caches = OrderedDict()  # (学生ID, 学科) -> KnowledgeTreeCache，按最近使用排序，知识点变化时清空
+        self._tree_subjects = {}  # 学生ID -> 有知识树缓存的学科集合
+        self.tree_cache_size = int(os.getenv("KG_TREE_CACHE_SIZE", "1024"))
         self._load_default_knowledge_base()
     
     def _load_default_knowledge_base(self):
@@ -79,29 +543,33 @@ class KnowledgeGraphMod:
         # 添加所有知识点到知识库
         all_knowledge = math_knowledge + physics_knowledge + english_knowledge
         for kp in all_knowledge:
-            self.knowledge_base[kp.id] = kp
+            self.graph.add(kp)
     
     def add_knowledge_point(self, kp: KnowledgePoint) -> bool:
         """添加知识点到知识库"""
-        if kp.id in self.knowledge_base:
+        if not self.graph.add(kp):
             return False
-        self.knowledge_base[kp.id] = kp
+        self._subject_columns.pop(kp.subject, None)
+        self._tree_caches.clear()
+        self._tree_subjects.clear()
         return True
     
     def update_knowledge_point(self, kp: KnowledgePoint) -> bool:
-        """更新知识点"""
-        if kp.id not in self.knowledge_base:
+        """更新知识点（父节点不能是自身或自己的后代）"""
+        if not self.graph.update(kp):
             return False
-        self.knowledge_base[kp.id] = kp
+        self._subject_columns.clear()
+        self._tree_caches.clear()
+        self._tree_subjects.clear()
         return True
     
     def get_knowledge_point(self, kp_id: str) -> KnowledgePoint:
         """获取知识点"""
-        return self.knowledge_base.get(kp_id)
+        return self.graph.get(kp_id)
     
     def get_knowledge_points_by_subject(self, subject: str) -> List[KnowledgePoint]:
         """获取指定学科的所有知识点"""
-        return [kp for kp in self.knowledge_base.values() if kp.subject == subject]
+        return self.graph.by_subject(subject)
     
     def analyze_learning_data(self, learning_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -174,38 +642,30 @@ class KnowledgeGraphMod:
             "analysis_time": datetime.now().isoformat()
         }
     
-    def extract_knowledge_gaps(self, questions: List[Dict[str, Any]]) -> List[KnowledgeGap]:
+    def extract_knowledge_gaps(self, questions: List[Dict[str, Any]], columnar: bool = None) -> List[KnowledgeGap]:
         """
         从题目列表中提取知识盲点
         
         Args:
             questions: 题目列表，包含每个题目的知识点和答题情况
+            columnar: 是否使用NumPy列式聚合，默认在题目数不少于 COLUMNAR_THRESHOLD 时使用；
+                两种方式的结果完全相同
         
         Returns:
             知识盲点列表
         """
+        if columnar is None:
+            columnar = len(questions) >= COLUMNAR_THRESHOLD
+        aggregate = self._aggregate_errors_columnar if columnar else self._aggregate_errors
         knowledge_gaps = []
-        error_count_by_kp = {}
-        related_questions_by_kp = {}
-        
-        # 统计每个知识点的错误次数和相关题目
-        for question in questions:
-            if not question.get("is_correct", False):
-                for kp_id in question.get("knowledge_points", []):
-                    if kp_id in error_count_by_kp:
-                        error_count_by_kp[kp_id] += 1
-                        related_questions_by_kp[kp_id].append(question.get("id", "unknown"))
-                    else:
-                        error_count_by_kp[kp_id] = 1
-                        related_questions_by_kp[kp_id] = [question.get("id", "unknown")]
         
         # 生成知识盲点
-        for kp_id, error_count in error_count_by_kp.items():
+        for kp_id, error_count, related_questions, most_common_error, avg_answer_time in aggregate(questions):
             if kp_id in self.knowledge_base:
                 knowledge_point = self.knowledge_base[kp_id]
                 
                 # 确定盲点原因
-                gap_reason = self._determine_gap_reason(questions, kp_id)
+                gap_reason = self._gap_reason(most_common_error, avg_answer_time)
                 
                 # 计算优先级（基于错误次数、知识点重要性和掌握程度）
                 priority = min(5, error_count + (5 - int(knowledge_point.mastery_level * 5)) + (knowledge_point.importance // 2))
@@ -216,7 +676,7 @@ class KnowledgeGraphMod:
                     gap_reason=gap_reason,
                     error_count=error_count,
                     priority=priority,
-                    related_questions=related_questions_by_kp[kp_id]
+                    related_questions=related_questions
                 ))
         
         # 按优先级排序，优先级高的排在前面
@@ -224,43 +684,109 @@ class KnowledgeGraphMod:
         
         return knowledge_gaps
     
-    def _determine_gap_reason(self, questions: List[Dict[str, Any]], kp_id: str) -> str:
+    @staticmethod
+    def _aggregate_errors(questions: List[Dict[str, Any]]) -> List[Tuple[str, int, List[str], Any, float]]:
         """
-        确定产生知识盲点的原因
-        """
-        error_types = []
-        answer_times = []
+        一次遍历统计每个知识点的错题
         
+        Returns:
+            [(知识点ID, 错误次数, 相关题目ID, 最常见的错误类型, 平均答题时间)]，按知识点第一次出错的顺序排列。
+            题目中重复列出的知识点计入错误次数和相关题目，但错误类型和答题时间每道题只计一次
+        """
+        stats = {}  # 知识点ID -> [错误次数, 相关题目, 错误类型计数, 答题时间之和, 计入的题目数]
         for question in questions:
-            if not question.get("is_correct", False) and kp_id in question.get("knowledge_points", []):
-                error_type = question.get("error_type", "unknown")
-                error_types.append(error_type)
-                answer_time = question.get("answer_time", 0)
-                answer_times.append(answer_time)
-        
-        # 根据错误类型确定原因
-        if not error_types:
-            return "未知原因"
-        
-        # 统计最常见的错误类型
-        from collections import Counter
-        error_counter = Counter(error_types)
-        most_common_error = error_counter.most_common(1)[0][0]
-        
-        # 计算平均答题时间
-        avg_answer_time = sum(answer_times) / len(answer_times) if answer_times else 0
-        
-        # 综合错误类型和答题时间确定原因
-        reason_map = {
-            "concept_error": "概念理解错误",
-            "calculation_error": "计算错误",
-            "application_error": "应用错误",
-            "incomplete_solution": "答案不完整",
-            "misinterpretation": "题意理解错误",
-            "unknown": "未知原因"
-        }
+            if question.get("is_correct", False):
+                continue
+            kp_ids = question.get("knowledge_points", [])
+            question_id = question.get("id", "unknown")
+            for kp_id in kp_ids:
+                entry = stats.get(kp_id)
+                if entry is None:
+                    entry = stats[kp_id] = [0, [], Counter(), 0, 0]
+                entry[0] += 1
+                entry[1].append(question_id)
+            error_type = question.get("error_type", "unknown")
+            answer_time = question.get("answer_time", 0)
+            for kp_id in (dict.fromkeys(kp_ids) if len(kp_ids) > 1 else kp_ids):
+                entry = stats[kp_id]
+                entry[2][error_type] += 1
+                entry[3] += answer_time
+                entry[4] += 1
+        return [
+            (kp_id, count, related, errors.most_common(1)[0][0], total_time / timed)
+            for kp_id, (count, related, errors, total_time, timed) in stats.items()
+        ]
+    
+    @staticmethod
+    def _aggregate_errors_columnar(questions: List[Dict[str, Any]]) -> List[Tuple[str, int, List[str], Any, float]]:
+        """
+        与 _aggregate_errors 结果相同的列式实现：先把错题展开成 (知识点, 题目, 错误类型, 答题时间) 列，
+        再用 bincount / 排序一次完成所有知识点的聚合，适合题目很多的提交
+        """
+        kp_index, type_index = {}, {}
+        kp_column, question_column, type_column, time_column, first_column = [], [], [], [], []
+        question_ids, kp_ids = [], []
+        for question in questions:
+            if question.get("is_correct", False):
+                continue
+            question_kps = question.get("knowledge_points", [])
+            if not question_kps:
+                continue
+            position = len(question_ids)
+            question_ids.append(question.get("id", "unknown"))
+            error_type = question.get("error_type", "unknown")
+            type_id = type_index.setdefault(error_type, len(type_index))
+            answer_time = question.get("answer_time", 0)
+            seen = set()
+            for kp_id in question_kps:
+                kp = kp_index.get(kp_id)
+                if kp is None:
+                    kp = kp_index[kp_id] = len(kp_ids)
+                    kp_ids.append(kp_id)
+                kp_column.append(kp)
+                question_column.append(position)
+                type_column.append(type_id)
+                time_column.append(answer_time)
+                # 每道题的每个知识点只计一次错误类型和答题时间
+                first_column.append(kp not in seen)
+                seen.add(kp)
+        if not kp_ids:
+            return []
+        
+        kps = np.array(kp_column, dtype=np.int64)
+        counts = np.bincount(kps, minlength=len(kp_ids))
+        first = np.array(first_column, dtype=bool)
+        unique_kps = kps[first]
+        types = np.array(type_column, dtype=np.int64)[first]
+        timed = np.bincount(unique_kps, minlength=len(kp_ids))
+        total_times = np.bincount(unique_kps, weights=np.array(time_column, dtype=np.float64)[first],
+                                  minlength=len(kp_ids))
+        
+        # 最常见的错误类型：次数最多的类型中取在该知识点的错题里最先出现的一个（与Counter.most_common一致）
+        pairs = unique_kps * len(type_index) + types
+        type_counts = np.bincount(pairs, minlength=len(kp_ids) * len(type_index)).reshape(len(kp_ids), -1)
+        first_seen = np.full(len(kp_ids) * len(type_index), len(pairs), dtype=np.int64)
+        np.minimum.at(first_seen, pairs, np.arange(len(pairs)))
+        scores = type_counts * (len(pairs) + 1) - first_seen.reshape(len(kp_ids), -1)
+        most_common = np.argmax(scores, axis=1)
         
-        base_reason = reason_map.get(most_common_error, "未知原因")
+        # 相关题目：按知识点稳定排序后切分，保持题目顺序
+        order = np.argsort(kps, kind="stable")
+        ids = np.array(question_ids, dtype=object)[np.array(question_column, dtype=np.int64)[order]]
+        related = np.split(ids, np.cumsum(counts)[:-1])
+        
+        error_types = list(type_index)
+        return [
+            (kp_id, int(counts[i]), related[i].tolist(), error_types[most_common[i]], float(total_times[i]) / int(timed[i]))
+            for i, kp_id in enumerate(kp_ids)
+        ]
+    
+    @staticmethod
+    def _gap_reason(most_common_error: Any, avg_answer_time: float) -> str:
+        """
+        根据最常见的错误类型和平均答题时间确定产生知识盲点的原因
+        """
+        base_reason = GAP_REASONS.get(most_common_error, "未知原因")
         
         # 如果答题时间过长，可能是知识不熟练
         if avg_answer_time > 180:  # 超过3分钟
@@ -282,78 +808,74 @@ class KnowledgeGraphMod:
         Returns:
             知识图谱数据
         """
-        # 收集所有相关知识点
-        all_kps = set()
+        # 收集学科之外的相关知识点：盲点及其父知识点（学科知识点都包含在知识图谱中）
         gap_kps = set()
+        extra_kps = set()
         
         for gap in knowledge_gaps:
             kp = gap.knowledge_point
             gap_kps.add(kp.id)
-            all_kps.add(kp.id)
+            extra_kps.add(kp.id)
             
             # 添加父知识点
-            current_kp = kp
-            while current_kp.parent_id:
-                if current_kp.parent_id in self.knowledge_base:
-                    parent_kp = self.knowledge_base[current_kp.parent_id]
-                    all_kps.add(parent_kp.id)
-                    current_kp = parent_kp
-                else:
-                    break
-        
-        # 确保所有学科知识点都包含
-        subject_kps = self.get_knowledge_points_by_subject(subject)
-        for kp in subject_kps:
-            all_kps.add(kp.id)
+            extra_kps.update(self.graph.ancestors(kp.id))
+        extra_kps = {kp_id for kp_id in extra_kps if self.knowledge_base[kp_id].subject != subject}
         
         # 构建知识图谱结构
         knowledge_map = {
             "subject": subject,
-            "total_topics": len(all_kps),
+            "total_topics": len(self.graph.subject_ids(subject)) + len(extra_kps),
             "gaps_count": len(gap_kps),
             "mastery_rate": self._calculate_mastery_rate(student_id, subject),
             "priority_gaps": [
                 gap.knowledge_point.name for gap in knowledge_gaps if gap.priority >= 4
             ],
-            "knowledge_tree": self._build_knowledge_tree(list(all_kps), gap_kps, student_id)
+            "knowledge_tree": self._build_knowledge_tree(subject, extra_kps, gap_kps, student_id)
         }
         
         return knowledge_map
     
-    def _build_knowledge_tree(self, all_kp_ids: List[str], gap_kp_ids: Set[str], student_id: str) -> List[Dict[str, Any]]:
+    def _build_knowledge_tree(self, subject: str, extra_kp_ids: Set[str], gap_kp_ids: Set[str],
+                              student_id: str) -> List[Dict[str, Any]]:
         """
-        构建知识树结构
+        构建知识树结构（增量：只重建上一次构建之后变化过的节点及其祖先）
         
         Args:
-            all_kp_ids: 所有相关知识点ID
+            subject: 学科，学科的全部知识点都在树中
+            extra_kp_ids: 学科之外的相关知识点ID
             gap_kp_ids: 知识盲点ID集合
             student_id: 学生ID
         
         Returns:
-            知识树结构
+            知识树结构；未变化的子树在多次调用之间共享同一个节点对象，调用方不应修改
         """
-        # 构建知识点ID到知识点对象的映射
-        kp_map = {kp_id: self.knowledge_base[kp_id] for kp_id in all_kp_ids if kp_id in self.knowledge_base}
-        
-        # 构建父ID到子知识点的映射
-        parent_map = {}
-        for kp_id, kp in kp_map.items():
-            if kp.parent_id:
-                if kp.parent_id not in parent_map:
-                    parent_map[kp.parent_id] = []
-                parent_map[kp.parent_id].append(kp)
+        cache = self._tree_cache(student_id, subject)
+        graph = self.graph
         
-        # 找到根节点
-        root_kps = [kp for kp in kp_map.values() if not kp.parent_id]
+        # 相关知识点集合或盲点变化的节点：自身和父节点（子节点列表变化）都需要重建
+        if cache.extra != extra_kp_ids:
+            if cache.extra is not None:
+                cache.mark_dirty(cache.extra ^ extra_kp_ids, graph)
+            cache.roots = graph.ordered(cache.subject_roots + [
+                kp_id for kp_id in extra_kp_ids if not self.knowledge_base[kp_id].parent_id
+            ])
+            cache.extra = extra_kp_ids
+        cache.mark_dirty(cache.gaps ^ gap_kp_ids, graph)
+        cache.gaps = gap_kp_ids
         
-        # 获取学生对各个知识点的掌握程度
-        student_mastery = self.student_mastery.get(student_id, {})
+        student_mastery = None
+        rebuilt = set()
         
         # 递归构建树
-        def build_tree_node(kp: KnowledgePoint) -> Dict[str, Any]:
-            """构建单个树节点"""
-            # 获取学生掌握程度
-            mastery_level = student_mastery.get(kp.id, kp.mastery_level)
+        def build_tree_node(kp_id: str) -> Dict[str, Any]:
+            """构建单个树节点（未变化的节点直接复用）"""
+            nonlocal student_mastery
+            node = cache.nodes.get(kp_id)
+            if node is not None and kp_id not in cache.dirty:
+                return node
+            if student_mastery is None:
+                student_mastery = self.mastery.get(student_id)
+            kp = self.knowledge_base[kp_id]
             
             node = {
                 "id": kp.id,
@@ -361,19 +883,67 @@ class KnowledgeGraphMod:
                 "category": kp.category,
                 "subject": kp.subject,
                 "is_gap": kp.id in gap_kp_ids,
-                "mastery_level": mastery_level,
+                "mastery_level": student_mastery.get(kp.id, kp.mastery_level),
                 "importance": kp.importance,
                 "children": []
             }
             
-            # 添加子节点
-            if kp.id in parent_map:
-                for child_kp in parent_map[kp.id]:
-                    node["children"].append(build_tree_node(child_kp))
+            # 添加子节点（只包含相关知识点）
+            for child_id in graph.children(kp_id):
+                if self.knowledge_base[child_id].subject == subject or child_id in extra_kp_ids:
+                    node["children"].append(build_tree_node(child_id))
             
+            cache.nodes[kp_id] = node
+            cache.fragments.pop(kp_id, None)
+            rebuilt.add(kp_id)
             return node
         
-        return [build_tree_node(kp) for kp in root_kps]
+        tree = [build_tree_node(kp_id) for kp_id in cache.roots]
+        
+        # 不在本次树中的脏节点直接丢弃，下次出现时重新构建
+        for kp_id in cache.dirty - rebuilt:
+            cache.nodes.pop(kp_id, None)
+            cache.fragments.pop(kp_id, None)
+        cache.dirty.clear()
+        cache.rebuilt += len(rebuilt)
+        return tree
+    
+    def _tree_cache(self, student_id: str, subject: str) -> KnowledgeTreeCache:
+        key = (student_id, subject)
+        cache = self._tree_caches.get(key)
+        if cache is None:
+            subject_roots = [kp_id for kp_id in self.graph.subject_ids(subject)
+                             if not self.knowledge_base[kp_id].parent_id]
+            cache = self._tree_caches[key] = KnowledgeTreeCache(subject_roots)
+            self._tree_subjects.setdefault(student_id, set()).add(subject)
+            while len(self._tree_caches) > self.tree_cache_size:
+                (evicted_student, evicted_subject), _ = self._tree_caches.popitem(last=False)
+                subjects = self._tree_subjects[evicted_student]
+                subjects.discard(evicted_subject)
+                if not subjects:
+                    del self._tree_subjects[evicted_student]
+        else:
+            self._tree_caches.move_to_end(key)
+        return cache
+    
+    def _mark_mastery_changed(self, student_id: str, kp_ids: Iterable[str]):
+        """掌握程度变化后，把该学生各学科知识树中的这些知识点及其祖先标记为脏"""
+        kp_ids = [kp_id for kp_id in kp_ids if kp_id in self.knowledge_base]
+        # 知识树的学科不一定有自己的知识点（例如默认的 "general"），按缓存过的学科逐个标记
+        for subject in self._tree_subjects.get(student_id, ()):
+            self._tree_caches[(student_id, subject)].mark_dirty(kp_ids, self.graph)
+    
+    def knowledge_tree_json(self, student_id: str, subject: str) -> Optional[str]:
+        """
+        最近一次为该学生和学科生成的知识树的JSON（由各子树缓存的JSON片段拼接，未变化的子树不重新序列化）
+
+        Returns:
+            JSON字符串；还没有生成过或缓存已失效时返回 None
+        """
+        cache = self._tree_caches.get((student_id, subject))
+        if cache is None or cache.extra is None:
+            return None
+        return cache.to_json()
     
     def update_student_mastery(self, student_id: str, subject: str, mastery_data: Dict[str, float]):
         """
@@ -384,77 +954,54 @@ class KnowledgeGraphMod:
             subject: 学科
             mastery_data: 知识点掌握程度数据，格式为 {"知识点ID": 掌握程度(0.0-1.0)}
         """
-        if student_id not in self.student_mastery:
-            self.student_mastery[student_id] = {}
-        
-        for kp_id, mastery_level in mastery_data.items():
-            # 确保掌握程度在0.0-1.0之间
-            clamped_mastery = max(0.0, min(1.0, mastery_level))
-            self.student_mastery[student_id][kp_id] = clamped_mastery
+        # 确保掌握程度在0.0-1.0之间
+        self.mastery.set(student_id, {
+            kp_id: max(0.0, min(1.0, mastery_level)) for kp_id, mastery_level in mastery_data.items()
+        })
+        self._mark_mastery_changed(student_id, mastery_data)
+    
+    def _subject_mastery(self, student_id: str, subject: str) -> np.ndarray:
+        """学生对某一学科每个知识点的掌握程度（没有记录的知识点取知识点的默认掌握程度）"""
+        cached = self._subject_columns.get(subject)
+        if cached is None:
+            subject_kps = self.get_knowledge_points_by_subject(subject)
+            columns = self.mastery.columns(kp.id for kp in subject_kps)
+            defaults = np.array([kp.mastery_level for kp in subject_kps], dtype=np.float64)
+            cached = self._subject_columns[subject] = (columns, np.argsort(columns, kind="stable"), defaults)
+        columns, order, defaults = cached
+        return self.mastery.lookup(student_id, columns, defaults, order)
     
     def _calculate_mastery_rate(self, student_id: str, subject: str) -> float:
         """
         计算学生对某一学科的总体掌握率
         """
-        student_mastery = self.student_mastery.get(student_id, {})
-        subject_kps = self.get_knowledge_points_by_subject(subject)
-        
-        if not subject_kps:
+        mastery = self._subject_mastery(student_id, subject)
+        if not len(mastery):
             return 0.0
-        
-        total_mastery = 0.0
-        for kp in subject_kps:
-            total_mastery += student_mastery.get(kp.id, kp.mastery_level)
-        
-        return total_mastery / len(subject_kps)
+        return float(mastery.mean())
     
     def _calculate_mastery_overview(self, student_id: str, subject: str) -> Dict[str, Any]:
         """
         计算掌握程度概览
         """
-        student_mastery = self.student_mastery.get(student_id, {})
-        subject_kps = self.get_knowledge_points_by_subject(subject)
-        
-        if not subject_kps:
-            return {
-                "excellent_count": 0,
-                "good_count": 0,
-                "average_count": 0,
-                "poor_count": 0,
-                "total_count": 0
-            }
-        
-        excellent_count = 0  # 掌握程度 >= 0.8
-        good_count = 0       # 0.6 <= 掌握程度 < 0.8
-        average_count = 0    # 0.4 <= 掌握程度 < 0.6
-        poor_count = 0       # 掌握程度 < 0.4
-        
-        for kp in subject_kps:
-            mastery = student_mastery.get(kp.id, kp.mastery_level)
-            if mastery >= 0.8:
-                excellent_count += 1
-            elif mastery >= 0.6:
-                good_count += 1
-            elif mastery >= 0.4:
-                average_count += 1
-            else:
-                poor_count += 1
+        mastery = self._subject_mastery(student_id, subject)
+        # 一次分档计数：0 较差(<0.4)、1 一般(<0.6)、2 良好(<0.8)、3 优秀(>=0.8)
+        poor_count, average_count, good_count, excellent_count = np.bincount(
+            np.searchsorted(MASTERY_BUCKETS, mastery, side="right"), minlength=4
+        ).tolist()
         
         return {
             "excellent_count": excellent_count,
             "good_count": good_count,
             "average_count": average_count,
             "poor_count": poor_count,
-            "total_count": len(subject_kps)
+            "total_count": len(mastery)
         }
     
     def _update_student_mastery(self, student_id: str, subject: str, questions: List[Dict[str, Any]]):
         """
         根据答题情况更新学生掌握程度
         """
-        if student_id not in self.student_mastery:
-            self.student_mastery[student_id] = {}
-        
         # 计算每个知识点的掌握程度变化
         mastery_changes = {}
         for question in questions:
@@ -465,18 +1012,21 @@ class KnowledgeGraphMod:
                 mastery_changes[kp_id].append(1.0 if is_correct else 0.0)
         
         # 更新掌握程度
+        student_mastery = self.mastery.get(student_id)
+        updates = {}
         for kp_id, scores in mastery_changes.items():
             if kp_id in self.knowledge_base:
                 # 计算平均得分
                 avg_score = sum(scores) / len(scores)
                 
                 # 计算新的掌握程度（使用加权平均，当前掌握程度占70%，新得分占30%）
-                current_mastery = self.student_mastery[student_id].get(kp_id, 0.5)
+                current_mastery = student_mastery.get(kp_id, 0.5)
                 new_mastery = current_mastery * 0.7 + avg_score * 0.3
                 
                 # 确保在0.0-1.0之间
-                clamped_mastery = max(0.0, min(1.0, new_mastery))
-                self.student_mastery[student_id][kp_id] = clamped_mastery
+                updates[kp_id] = max(0.0, min(1.0, new_mastery))
+        self.mastery.set(student_id, updates)
+        self._mark_mastery_changed(student_id, updates)
     
     def get_related_knowledge_points(self, kp_id: str, depth: int = 2) -> List[KnowledgePoint]:
         """
@@ -499,31 +1049,21 @@ class KnowledgeGraphMod:
         related_kp_ids.add(current_kp.id)
         
         # 获取父节点链
-        parent_kp = current_kp
-        for _ in range(depth):
-            if parent_kp.parent_id and parent_kp.parent_id in self.knowledge_base:
-                parent_kp = self.knowledge_base[parent_kp.parent_id]
-                related_kp_ids.add(parent_kp.id)
-            else:
-                break
+        related_kp_ids.update(self.graph.ancestors(kp_id)[:depth])
         
         # 获取子节点树
-        def get_children(kp, current_depth):
-            if current_depth >= depth:
-                return
-            for child_kp in self.knowledge_base.values():
-                if child_kp.parent_id == kp.id:
-                    related_kp_ids.add(child_kp.id)
-                    get_children(child_kp, current_depth + 1)
-        
-        get_children(current_kp, 0)
+        related_kp_ids.update(self.graph.descendants(kp_id, depth))
         
         # 将ID转换为知识点对象
         return [self.knowledge_base[kp_id] for kp_id in related_kp_ids]
 
 
-# 创建Mod实例供外部使用
-knowledge_graph_mod = KnowledgeGraphMod()
+# 创建Mod实例供外部使用（掌握程度保存到 KG_MASTERY_DB，相对路径相对于本文件所在目录，
+# 设为空字符串时只保存在内存中）
+_mastery_db = os.getenv("KG_MASTERY_DB", "data/knowledge_mastery.db")
+knowledge_graph_mod = KnowledgeGraphMod(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), _mastery_db) if _mastery_db else None
+)
 
 
 # 导出Mod的主要功能
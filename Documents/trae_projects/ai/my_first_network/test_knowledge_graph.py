@@ -0,0 +1,102 @@
+# 知识图谱Mod测试脚本（python -m pytest test_knowledge_graph.py）
+
+import importlib.util
+import os
+
+import pytest
+
+MOD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "mods", "openagents.mods.education.knowledge_graph", "__init__.py")
+
+
+@pytest.fixture(scope="module")
+def module():
+    # 测试不使用持久化存储：只在加载模块时清空 KG_MASTERY_DB，之后恢复原来的环境变量
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("KG_MASTERY_DB", "")
+        spec = importlib.util.spec_from_file_location("knowledge_graph_mod", MOD_PATH)
+        loaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+    return loaded
+
+
+def find_node(tree, kp_id):
+    for node in tree:
+        if node["id"] == kp_id:
+            return node
+        found = find_node(node["children"], kp_id)
+        if found:
+            return found
+    return None
+
+
+def test_mastery_update_refreshes_tree_of_subject_without_knowledge_points(module):
+    """学科本身没有知识点（默认的 "general"）时，掌握程度变化后知识树也要更新"""
+    mod = module.KnowledgeGraphMod()
+    learning_data = {
+        "student_id": "s",
+        "questions": [{"id": "q1", "knowledge_points": ["math_algebra"], "is_correct": False,
+                       "error_type": "concept_error"}]
+    }
+    first = mod.analyze_learning_data(learning_data)
+    assert first["subject"] == "general"
+    assert find_node(first["knowledge_map"]["knowledge_tree"], "math_algebra")["mastery_level"] == 0.0
+
+    mod.update_student_mastery("s", "数学", {"math_algebra": 1.0})
+    second = mod.analyze_learning_data(learning_data)
+    assert find_node(second["knowledge_map"]["knowledge_tree"], "math_algebra")["mastery_level"] == 1.0
+
+
+def test_incremental_tree_matches_fresh_build(module):
+    """增量构建的知识树与清空缓存后重新构建的结果一致"""
+    mod = module.KnowledgeGraphMod()
+    questions = [{"id": "q1", "knowledge_points": ["math_algebra_eq"], "is_correct": False,
+                  "error_type": "calculation_error"}]
+    gaps = mod.extract_knowledge_gaps(questions)
+    mod.generate_knowledge_map(gaps, "数学", "s")
+    mod.update_student_mastery("s", "数学", {"math_algebra_eq": 0.7})
+    incremental = mod.generate_knowledge_map(gaps, "数学", "s")
+    fresh = module.KnowledgeGraphMod()
+    fresh.update_student_mastery("s", "数学", {"math_algebra_eq": 0.7})
+    assert incremental == fresh.generate_knowledge_map(gaps, "数学", "s")
+
+
+def test_add_rejects_parent_cycles(module):
+    """添加知识点时父节点形成环（包括父节点是自身）的知识点被拒绝，不会死循环"""
+    mod = module.KnowledgeGraphMod()
+    KnowledgePoint = module.KnowledgePoint
+    assert not mod.add_knowledge_point(KnowledgePoint("self", "self", "c", "x", "self"))
+    assert mod.add_knowledge_point(KnowledgePoint("a", "a", "c", "x", "b"))
+    assert not mod.add_knowledge_point(KnowledgePoint("b", "b", "c", "x", "a"))
+    assert mod.add_knowledge_point(KnowledgePoint("c", "c", "c", "x", "a"))
+    assert mod.get_knowledge_points_by_subject("x")[0].id == "a"
+
+
+def test_reading_unknown_student_does_not_allocate_row(module, tmp_path):
+    """backend 中没有记录的学生读取时不分配行，第一次写入时才分配"""
+    path = str(tmp_path / "mastery.db")
+    store = module.MasteryStore(module.SQLiteMasteryBackend(path))
+    assert store.get("nobody") == {}
+    assert "nobody" not in store
+    assert len(store) == 0
+    store.set("s", {"a": 0.5})
+    assert len(store) == 1
+    store.close()
+
+    store = module.MasteryStore(module.SQLiteMasteryBackend(path))
+    assert store.get("s") == {"a": 0.5}
+    assert len(store) == 1
+    store.close()
+
+
+
+def test_default_mastery_db_is_relative_to_module(monkeypatch, tmp_path):
+    """默认的掌握程度数据库相对于 Mod 所在目录，与当前工作目录无关（导入时不创建文件）"""
+    monkeypatch.delenv("KG_MASTERY_DB", raising=False)
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location("knowledge_graph_mod_default", MOD_PATH)
+    loaded = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(loaded)
+    path = loaded.knowledge_graph_mod.mastery.backend.path
+    assert path == os.path.join(os.path.dirname(MOD_PATH), "data", "knowledge_mastery.db")
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,241 @@
+"""
+RAG查询缓存 - 学生反复提问的几百个问题不必每次都重新检索和生成回答
+
+两级缓存：
+- QueryResultCache：精确缓存，(查询, top_k, 过滤条件, 检索方式) -> 检索结果；
+  每个条目记录写入时的索引版本（SimpleVectorDB.generation），索引有新文档后自动失效
+- SemanticAnswerCache：语义缓存，新问题的嵌入向量与某个已缓存问题的余弦相似度不低于阈值时，
+  直接返回该问题的回答；缓存的问题向量放在一个NumPy矩阵中，一次矩阵-向量乘法完成查找。
+  哈希嵌入对句式相同、只差实体的问题（"Java/Go 是什么时候创建的？"）相似度也很高，
+  所以 RAGCache 只在新问题检索到的文档与缓存回答使用的文档相同时才采用缓存的回答
+
+两者都有条目数上限（LRU淘汰），并统计命中、未命中、淘汰和失效次数。
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import json
+import os
+
+import numpy as np
+
+from dense_index import HashingEmbedder, _normalize
+
+
+class QueryResultCache:
+    """精确的 查询 -> 检索结果 LRU缓存，按索引版本失效"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (索引版本, 检索结果)
+
+    @staticmethod
+    def make_key(query: str, top_k: int, filters: Optional[Dict[str, Any]] = None, mode: Optional[str] = None) -> str:
+        return json.dumps([query, top_k, filters, mode], ensure_ascii=False, sort_keys=True, default=str)
+
+    def get(self, key: str, generation: Hashable) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] != generation:
+            del self._entries[key]
+            self.invalidations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, generation: Hashable, results: List[Dict[str, Any]]):
+        self._entries[key] = (generation, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class SemanticAnswerCache:
+    """
+    语义回答缓存：按问题的嵌入向量查找相似的已回答问题
+
+    条目存放在固定容量的槽位中，满了之后覆盖最久未使用的槽位；索引版本变化时整体清空
+    """
+
+    def __init__(self, embedder=None, threshold: float = 0.97, max_entries: int = 512):
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejections = 0
+        self._vectors = np.zeros((max_entries, self.embedder.dim), dtype=np.float32)
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._entries = []  # 槽位 -> (问题, 回答)
+        self._clock = 0
+        self._generation = None
+
+    def _embed(self, query: str) -> np.ndarray:
+        return _normalize(self.embedder.embed([query]))[0]
+
+    def _check_generation(self, generation: Hashable):
+        if generation != self._generation:
+            self.invalidations += len(self._entries)
+            self._entries = []
+            self._generation = generation
+
+    def get(self, query: str, generation: Hashable,
+            verify: Optional[Callable[[Any], bool]] = None) -> Optional[Tuple[str, Any, float]]:
+        """
+        查找相似问题的回答
+
+        Args:
+            verify: 可选的校验函数，参数为缓存的回答，返回 False 时不采用该条目（计为未命中）
+
+        Returns:
+            (缓存的问题, 回答, 相似度)，没有相似度不低于阈值的问题时返回 None
+        """
+        self._check_generation(generation)
+        if self._entries:
+            scores = self._vectors[:len(self._entries)] @ self._embed(query)
+            slot = int(np.argmax(scores))
+            if scores[slot] >= self.threshold:
+                cached_query, answer = self._entries[slot]
+                if verify is None or verify(answer):
+                    self._clock += 1
+                    self._last_used[slot] = self._clock
+                    self.hits += 1
+                    return cached_query, answer, float(scores[slot])
+                self.rejections += 1
+        self.misses += 1
+        return None
+
+    def set(self, query: str, generation: Hashable, answer: Any):
+        self._check_generation(generation)
+        if len(self._entries) < self.max_entries:
+            slot = len(self._entries)
+            self._entries.append((query, answer))
+        else:
+            slot = int(np.argmin(self._last_used))
+            self._entries[slot] = (query, answer)
+            self.evictions += 1
+        self._vectors[slot] = self._embed(query)
+        self._clock += 1
+        self._last_used[slot] = self._clock
+
+    def clear(self):
+        self._entries = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "rejections": self.rejections,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+def _document_ids(retrieved_docs: List[Dict[str, Any]]) -> List[Any]:
+    return [doc["document"].get("id") for doc in retrieved_docs]
+
+
+class RAGCache:
+    """
+    放在 SimpleVectorDB 检索和回答生成之前的两级缓存
+
+    用法：
+        cache = RAGCache(vector_db)
+        answer, retrieved_docs = cache.answer(query, generate_answer)
+    """
+
+    def __init__(self, db, query_cache: QueryResultCache = None, semantic_cache: SemanticAnswerCache = None):
+        self.db = db
+        self.query_cache = query_cache if query_cache is not None else QueryResultCache()
+        self.semantic_cache = semantic_cache if semantic_cache is not None else SemanticAnswerCache()
+
+    def search(self, query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None,
+               mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """检索（精确缓存）"""
+        generation = self.db.generation
+        key = self.query_cache.make_key(query, top_k, filters, mode)
+        results = self.query_cache.get(key, generation)
+        if results is None:
+            results = self.db.search(query, top_k, filters, mode)
+            self.query_cache.set(key, generation, results)
+        return results
+
+    def answer(self, query: str, generate: Callable[[str, List[Dict[str, Any]]], Any], top_k: int = 3,
+               filters: Optional[Dict[str, Any]] = None, mode: Optional[str] = None) -> Tuple[Any, List[Dict[str, Any]]]:
+        """
+        检索并生成回答；相似问题的回答直接从语义缓存返回
+
+        语义缓存命中时仍然先检索（相同的问题由精确缓存返回），检索到的文档与缓存回答使用的文档
+        相同才采用缓存的回答，避免把一个问题的回答返回给只是句式相似的另一个问题。
+        带过滤条件或非默认检索方式的查询只使用精确缓存，因为相同的问题在不同条件下回答不同；
+        语义缓存不区分 top_k，同一个缓存应使用固定的 top_k
+
+        Returns:
+            (回答, 检索结果)；语义缓存命中时检索结果为该回答生成时使用的文档
+        """
+        generation = self.db.generation
+        semantic = not filters and mode is None
+        retrieved_docs = self.search(query, top_k, filters, mode)
+        if semantic:
+            document_ids = _document_ids(retrieved_docs)
+            cached = self.semantic_cache.get(
+                query, generation, verify=lambda entry: _document_ids(entry[1]) == document_ids
+            )
+            if cached is not None:
+                return cached[1]
+        answer = generate(query, retrieved_docs)
+        if semantic:
+            self.semantic_cache.set(query, generation, (answer, retrieved_docs))
+        return answer, retrieved_docs
+
+    def stats(self) -> Dict[str, Any]:
+        return {"query": self.query_cache.stats(), "semantic": self.semantic_cache.stats()}
+
+
+def create_rag_cache(db) -> RAGCache:
+    """根据环境变量创建RAG缓存"""
+    return RAGCache(
+        db,
+        QueryResultCache(int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))),
+        SemanticAnswerCache(
+            embedder=db.dense_index.embedder if db.dense_index is not None else None,
+            threshold=float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.97")),
+            max_entries=int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "512"))
+        )
+    )
@@ -10,69 +10,132 @@
 """
 
 import json
-import re
-from typing import List, Dict, Any
+import os
+from typing import Callable, List, Dict, Any, Optional, Set
+import threading
 import requests
-from openai import OpenAI
 
-# 配置 OpenAI 客户端
-client = OpenAI()
+from ann_index import IVFIndex
+from dense_index import DenseIndex
+from disk_index import DiskIndex
+from metadata_index import Filters, MetadataIndex, reciprocal_rank_fusion
+from rag_cache import create_rag_cache
+from rag_generation import create_llm, stream_answer
+from sparse_index import InvertedIndex
+from tokenizer import Tokenizer, default_tokenizer
 
 class SimpleVectorDB:
-    """简单的向量数据库实现，使用基于词频的相似度匹配"""
-    
-    def __init__(self):
+    """
+    简单的向量数据库实现，使用基于词频的相似度匹配
+
+    backend 可选：
+    - "bm25"（默认）/ "tfidf"：倒排索引，只对包含查询词的文档打分
+    - "dense"：稠密向量索引（NumPy矩阵检索），可通过 embedder 参数替换嵌入器，默认使用哈希嵌入
+    - "ivf"：近似最近邻索引（IVF），适合百万级语料；nprobe 等参数通过 index_options 传入
+    - "disk"：磁盘持久化的BM25索引（需要 path 参数），进程退出后保留，多个进程可以共享
+    - "linear"：逐篇文档计算词频向量的余弦相似度（原始实现，用于对比）
+
+    词频向量由 tokenizer 生成（默认：英文按词、中文按二元组切分），可传入带词典的 Tokenizer。
+
+    hybrid=True 时额外建立互补的索引（稀疏后端配稠密索引，稠密后端配BM25倒排索引），
+    search(mode="hybrid") 用倒数排名融合（RRF）合并两路结果；disk 后端暂不支持。
+    search 的 filters 参数按元数据过滤，候选文档在打分之前求出。
+    """
+
+    BACKENDS = ("linear",) + InvertedIndex.SCORINGS + ("dense", "ivf", "disk")
+    DENSE_BACKENDS = ("dense", "ivf")
+    MODES = ("sparse", "dense", "hybrid")
+
+    def __init__(self, backend: str = "bm25", embedder=None, tokenizer: Tokenizer = None,
+                 hybrid: bool = False, **index_options):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"不支持的检索后端：{backend}，可选：{', '.join(self.BACKENDS)}")
+        if hybrid and backend == "disk":
+            raise ValueError("disk 后端暂不支持混合检索")
+        self.backend = backend
+        self.hybrid = hybrid
+        self.tokenizer = tokenizer or default_tokenizer
         self.documents = []
-        self.vector_store = []
+        self.vector_store = []  # 仅 linear 后端使用
+        self._version = 0  # 本进程写入文档的次数，用于使查询缓存失效
+        self.metadata = MetadataIndex() if backend != "disk" else None  # disk 后端的元数据在SQLite中过滤
+        if backend == "dense":
+            self.index = DenseIndex(embedder, **index_options)
+        elif backend == "ivf":
+            self.index = IVFIndex(embedder, **index_options)
+        elif backend == "disk":
+            if "path" not in index_options:
+                raise ValueError("disk 后端需要指定索引目录 path")
+            self.index = DiskIndex(tokenizer=self.tokenizer, **index_options)
+        elif backend != "linear":
+            self.index = InvertedIndex(scoring=backend)
+        else:
+            self.index = None
+        # 稀疏（词频）和稠密（向量）两路索引，未建立的一路为 None；linear 后端的稀疏检索为线性扫描
+        if backend in self.DENSE_BACKENDS:
+            self.dense_index = self.index
+            self.sparse_index = InvertedIndex("bm25") if hybrid else None
+        else:
+            self.sparse_index = self.index
+            self.dense_index = DenseIndex(embedder) if hybrid else None
     
     def add_document(self, content: str, metadata: Dict[str, Any] = None):
         """添加文档到向量库"""
-        if metadata is None:
-            metadata = {}
-        
-        # 简单的词频向量生成
-        vector = self._generate_vector(content)
+        self.add_documents([{"content": content, "metadata": metadata}])
+    
+    def add_documents(self, documents: List[Dict[str, Any]], prepared=None):
+        """
+        批量添加文档（每项包含 content 和可选的 metadata），稠密后端（dense / ivf）一次嵌入整批文档
+
+        Args:
+            prepared: 可选，已经由 prepare() 算好的词频或向量（例如在进程池中计算），提供时不再重复计算
+        """
+        if prepared is None:
+            prepared = self.prepare([doc["content"] for doc in documents])
+        self._version += 1
+        if self.backend == "disk":
+            # 文档保存在索引目录的数据库中，不在内存中保留
+            self.index.add_documents(documents, prepared)
+            return
+        for doc in documents:
+            doc_id = len(self.documents)
+            metadata = doc.get("metadata") or {}
+            self.documents.append({
+                "id": doc_id,
+                "content": doc["content"],
+                "metadata": metadata
+            })
+            self.metadata.add(doc_id, metadata)
         
-        doc_id = len(self.documents)
-        self.documents.append({
-            "id": doc_id,
-            "content": content,
-            "metadata": metadata
-        })
-        self.vector_store.append(vector)
+        if self.hybrid:
+            counts_list, vectors = prepared
+        elif self.backend in self.DENSE_BACKENDS:
+            counts_list, vectors = None, prepared
+        else:
+            counts_list, vectors = prepared, None
+        if vectors is not None:
+            self.dense_index.add_vectors(vectors)
+        for vector in counts_list or ():
+            if self.sparse_index is not None:
+                self.sparse_index.add(vector)
+            else:
+                self.vector_store.append(vector)
+    
+    def prepare(self, contents: List[str]):
+        """
+        计算文档入库所需的数据（批量分词，不占用查询缓存）
+
+        稠密后端为嵌入向量矩阵，其他后端为词频列表；hybrid 时为 (词频列表, 嵌入向量矩阵)
+        """
+        vectors = self.dense_index.embedder.embed(contents) if self.dense_index is not None else None
+        if self.backend in self.DENSE_BACKENDS and not self.hybrid:
+            return vectors
+        counts_list = self.tokenizer.counts_batch(contents)
+        return (counts_list, vectors) if self.hybrid else counts_list
     
     def _generate_vector(self, text: str) -> Dict[str, int]:
-        """生成简单的词频向量"""
-        # 文本预处理 - 处理中文
-        text = text.lower()
-        # 只保留中英文和数字，去除其他字符
-        text = re.sub(r'[^a-zA-Z0-9\u4e00-\u9fa5\s]', '', text)
-        # 简单分词 - 按空格和中文词分割
-        words = []
-        current_word = ""
-        for char in text:
-            if char.isspace():
-                if current_word:
-                    words.append(current_word)
-                    current_word = ""
-            elif char.isalpha() or char.isdigit():
-                current_word += char
-            else:  # 中文字符
-                if current_word:
-                    words.append(current_word)
-                    current_word = ""
-                words.append(char)
-        if current_word:
-            words.append(current_word)
-        
-        # 生成词频向量
-        vector = {}
-        for word in words:
-            if word not in vector:
-                vector[word] = 0
-            vector[word] += 1
-        
-        return vector
+        """生成查询的词频向量（重复的查询直接使用分词器的缓存结果）"""
+        return self.tokenizer.counts(text)
     
     def _calculate_similarity(self, vec1: Dict[str, int], vec2: Dict[str, int]) -> float:
         """计算两个向量的余弦相似度"""
@@ -91,29 +154,101 @@ class SimpleVectorDB:
         
         return dot_product / (norm1 * norm2)
     
-    def search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
-        """搜索相关文档"""
+    def search(self, query: str, top_k: int = 3, filters: Optional[Filters] = None,
+               mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        搜索相关文档
+
+        Args:
+            query: 查询文本
+            top_k: 返回的结果数
+            filters: 元数据过滤条件，例如 {"category": "programming_language"}；
+                同一字段给出列表表示任意一个值，不同字段之间为“且”
+            mode: "sparse" / "dense" / "hybrid"，默认为后端本身的检索方式；
+                hybrid 的 similarity 为RRF融合得分
+        """
+        mode = self._mode(mode)
+        allowed = self._allowed(filters)
+        if allowed is not None and not allowed:
+            return []
+        if mode == "dense":
+            return self._results(self.dense_index.search(query, top_k, allowed))
+        if mode == "sparse":
+            return self._results(self._sparse_search(query, top_k, allowed))
+        # 两路各多取一些候选再融合，避免只在一路中排名靠前的文档被截断
+        depth = max(top_k * 4, 20)
+        rankings = [self._sparse_search(query, depth, allowed), self.dense_index.search(query, depth, allowed)]
+        return self._results(reciprocal_rank_fusion(rankings, top_k))
+    
+    def _mode(self, mode: Optional[str]) -> str:
+        if mode is None:
+            return "dense" if self.backend in self.DENSE_BACKENDS else "sparse"
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的检索方式：{mode}，可选：{', '.join(self.MODES)}")
+        # 稠密后端没有稀疏索引、稀疏后端没有稠密索引时，只能使用后端本身的检索方式
+        missing_dense = mode != "sparse" and self.dense_index is None
+        missing_sparse = mode != "dense" and self.backend in self.DENSE_BACKENDS and self.sparse_index is None
+        if missing_dense or missing_sparse:
+            raise ValueError(f"{self.backend} 后端需要 hybrid=True 才能使用 {mode} 检索")
+        return mode
+    
+    def _allowed(self, filters: Optional[Filters]) -> Optional[Set[int]]:
+        """满足过滤条件的候选文档ID集合，没有过滤条件时为 None"""
+        if not filters:
+            return None
+        if self.backend == "disk":
+            return self.index.filter_ids(filters)
+        return self.metadata.matching(filters)
+    
+    def _sparse_search(self, query: str, top_k: int, allowed: Optional[Set[int]] = None):
         # 生成查询向量
         query_vector = self._generate_vector(query)
         
+        if self.sparse_index is not None:
+            return self.sparse_index.search(query_vector, top_k, allowed)
+        
         # 计算相似度
         similarities = []
-        for i, doc_vector in enumerate(self.vector_store):
-            similarity = self._calculate_similarity(query_vector, doc_vector)
+        doc_ids = range(len(self.vector_store)) if allowed is None else sorted(allowed)
+        for i in doc_ids:
+            similarity = self._calculate_similarity(query_vector, self.vector_store[i])
             similarities.append((i, similarity))
         
         # 排序并返回前 k 个结果
         similarities.sort(key=lambda x: x[1], reverse=True)
-        results = []
-        
-        for doc_id, similarity in similarities[:top_k]:
-            doc = self.documents[doc_id]
-            results.append({
-                "document": doc,
-                "similarity": similarity
-            })
-        
-        return results
+        return similarities[:top_k]
+    
+    def search_batch(self, queries: List[str], top_k: int = 3, filters: Optional[Filters] = None,
+                     mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """批量搜索，稠密检索时所有查询通过一次矩阵乘法完成"""
+        if self._mode(mode) == "dense":
+            allowed = self._allowed(filters)
+            if allowed is not None and not allowed:
+                return [[] for _ in queries]
+            return [self._results(hits) for hits in self.dense_index.search_batch(queries, top_k, allowed)]
+        return [self.search(query, top_k, filters, mode) for query in queries]
+    
+    def _results(self, hits) -> List[Dict[str, Any]]:
+        if self.backend == "disk":
+            documents = self.index.get_documents([doc_id for doc_id, _ in hits])
+        else:
+            documents = self.documents
+        return [{"document": documents[doc_id], "similarity": score} for doc_id, score in hits]
+    
+    @property
+    def generation(self):
+        """索引版本：写入文档后改变（disk 后端还包括其他进程写入的新段），只用于判断缓存是否失效"""
+        if self.backend == "disk":
+            return self._version, self.index.generation
+        return self._version
+    
+    def __len__(self) -> int:
+        return len(self.index) if self.backend == "disk" else len(self.documents)
+    
+    def close(self):
+        """关闭磁盘索引（写入缓冲区中的文档）"""
+        if self.backend == "disk":
+            self.index.close()
 
 def load_documents() -> List[Dict[str, Any]]:
     """加载示例文档"""
@@ -141,46 +276,27 @@ def load_documents() -> List[Dict[str, Any]]:
     ]
     return documents
 
-def generate_answer(query: str, retrieved_docs: List[Dict[str, Any]]) -> str:
-    """基于检索到的文档生成回答"""
-    # 构建上下文
-    context = "\n".join([doc["document"]["content"] for doc in retrieved_docs])
-    
+def generate_answer(query: str, retrieved_docs: List[Dict[str, Any]], llm=None,
+                    on_token: Optional[Callable[[str], None]] = None,
+                    cancel: Optional[threading.Event] = None) -> str:
+    """
+    基于检索到的文档生成回答
+
+    检索结果按相似度打包进上下文token预算（去掉重复和重叠的块），通过OpenAI兼容接口流式生成；
+    未配置API密钥或设置 RAG_LLM_BACKEND=fake 时使用本地模拟模型（见 rag_generation）
+
+    Args:
+        llm: 生成模型，默认由 rag_generation.create_llm() 创建
+        on_token: 每收到一段回答文本时调用（例如边生成边打印）
+        cancel: 设置后停止生成，返回已生成的部分
+    """
+    pieces = []
     try:
-        # 从上下文中提取关键信息 - 简单的关键词匹配方法
-        # 这是一个简化的实现，实际 RAG 系统会使用更复杂的方法
-        answer = ""
-        
-        # 针对不同问题的简单提取逻辑
-        if "python" in query.lower() and "创建" in query.lower():
-            # 查找 Python 创建时间
-            import re
-            match = re.search(r'Python.*?创建于\s*(\d{4})', context)
-            if match:
-                answer = f"Python 是在 {match.group(1)} 年创建的。"
-            else:
-                answer = "无法从上下文信息中找到 Python 创建的具体时间。"
-        elif "javascript" in query.lower() and "用于" in query.lower():
-            # 查找 JavaScript 用途
-            if "Web 前端开发" in context:
-                answer = "JavaScript 主要用于 Web 前端开发。"
-            else:
-                answer = "无法从上下文信息中找到 JavaScript 的主要用途。"
-        elif "java" in query.lower() and "设计目标" in query.lower():
-            # 查找 Java 设计目标
-            import re
-            match = re.search(r'Java.*?设计目标是(.*?)。', context, re.DOTALL)
-            if match:
-                answer = f"Java 的设计目标是：{match.group(1)}。"
-            else:
-                answer = "无法从上下文信息中找到 Java 的设计目标。"
-        else:
-            # 通用回答
-            answer = "根据检索到的文档信息：\n"
-            for i, doc in enumerate(retrieved_docs[:2], 1):
-                answer += f"{i}. {doc['document']['content'][:150]}...\n"
-        
-        return answer
+        for piece in stream_answer(query, retrieved_docs, llm, cancel=cancel):
+            pieces.append(piece)
+            if on_token is not None:
+                on_token(piece)
+        return "".join(pieces)
     except Exception as e:
         return f"生成回答时出错：{str(e)}"
 
@@ -193,40 +309,58 @@ def main():
     documents = load_documents()
     print(f"   成功加载 {len(documents)} 篇文档")
     
-    # 2. 创建向量数据库并添加文档
+    # 2. 创建向量数据库并添加文档（设置 RAG_INDEX_PATH 时使用磁盘索引，已有的索引直接打开）
     print("\n2. 构建向量数据库...")
-    vector_db = SimpleVectorDB()
-    for doc in documents:
-        vector_db.add_document(doc["content"], doc["metadata"])
-    print("   向量数据库构建完成")
+    index_path = os.getenv("RAG_INDEX_PATH")
+    if index_path:
+        vector_db = SimpleVectorDB("disk", path=index_path)
+    else:
+        vector_db = SimpleVectorDB()
+    if len(vector_db) == 0:
+        vector_db.add_documents(documents)
+        print("   向量数据库构建完成")
+    else:
+        print(f"   已打开磁盘索引 {index_path}（{len(vector_db)} 篇文档）")
     
-    # 3. 预设演示查询
+    # 3. 预设演示查询（最后一个与第一个只差标点，由语义缓存直接返回回答）
     demo_queries = [
         "Python 是什么时候创建的？",
         "JavaScript 主要用于什么开发？",
-        "Java 的设计目标是什么？"
+        "Java 的设计目标是什么？",
+        "Python是什么时候创建的"
     ]
+    cache = create_rag_cache(vector_db)
+    llm = create_llm()
     
-    # 4. 执行演示查询
-    for i, query in enumerate(demo_queries, 1):
-        print(f"\n=== 演示查询 {i}/{len(demo_queries)} ===")
-        print(f"\n3. 用户问题：{query}")
-        
-        # 5. 检索相关文档
-        print("\n4. 检索相关文档...")
-        retrieved_docs = vector_db.search(query, top_k=3)
-        
+    def show_documents(retrieved_docs):
         print(f"   找到 {len(retrieved_docs)} 篇相关文档：")
         for j, doc in enumerate(retrieved_docs, 1):
             print(f"   {j}. 相似度：{doc['similarity']:.4f}")
             print(f"      内容：{doc['document']['content'][:100]}...")
-        
-        # 6. 生成回答
+    
+    def generate(query, retrieved_docs):
+        # 未命中缓存时才会调用：先展示检索结果，再边生成边打印回答
+        show_documents(retrieved_docs)
         print("\n5. 生成回答...")
-        answer = generate_answer(query, retrieved_docs)
-        
         print("\n=== 回答 ===")
-        print(answer)
+        answer = generate_answer(query, retrieved_docs, llm, on_token=lambda piece: print(piece, end="", flush=True))
+        print()
+        return answer
+    
+    # 4. 执行演示查询
+    for i, query in enumerate(demo_queries, 1):
+        print(f"\n=== 演示查询 {i}/{len(demo_queries)} ===")
+        print(f"\n3. 用户问题：{query}")
+        
+        # 5. 检索相关文档并生成回答（相同或相似的问题直接从缓存返回）
+        print("\n4. 检索相关文档...")
+        hits = cache.semantic_cache.hits
+        answer, retrieved_docs = cache.answer(query, generate, top_k=3)
+        if cache.semantic_cache.hits > hits:
+            show_documents(retrieved_docs)
+            print("\n5. 生成回答...（相似问题的回答来自缓存）")
+            print("\n=== 回答 ===")
+            print(answer)
         print("=============")
     
     print("\n=== RAG 演示完成 ===")
@@ -235,6 +369,8 @@ def main():
     print("2. 向量数据库构建")
     print("3. 查询处理与相似文档检索")
     print("4. 结合上下文生成准确回答")
+    print(f"\n缓存统计：{json.dumps(cache.stats(), ensure_ascii=False)}")
+    vector_db.close()
 
 if __name__ == "__main__":
     main()
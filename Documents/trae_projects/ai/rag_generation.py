@@ -0,0 +1,227 @@
+"""
+RAG回答生成 - 把检索结果打包成上下文，通过OpenAI兼容接口流式生成回答
+
+- 上下文打包：按相似度从高到低放入检索到的文档块，直到用完token预算；
+  重复的块、被已选块包含的块跳过，与已选块首尾重叠的部分（切块时的overlap）去掉
+- 流式生成：逐段产出回答文本，cancel（threading.Event）被设置时关闭上游连接并停止
+- FakeLLM：不联网的本地模式，从上下文中抽取与问题最相关的句子作为回答，用于测试和离线演示
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+import os
+import re
+import threading
+import time
+
+from openai import OpenAI
+
+from tokenizer import UNIT_PATTERN, count_units, default_tokenizer
+
+SYSTEM_PROMPT = (
+    "你是学习助手。请只根据提供的参考资料回答学生的问题，回答简洁准确；"
+    "资料中没有相关信息时，直接说明无法从资料中找到答案。"
+)
+
+_SENTENCE_PATTERN = re.compile(r"[^。！？!?\n]+[。！？!?]?")
+
+# OpenAI 客户端在第一次使用时创建（未配置API密钥时也可以导入本模块，例如在基准测试中）
+_client = None
+
+
+def get_client() -> OpenAI:
+    """获取 OpenAI 客户端（LLM_API_BASE / LLM_API_KEY 未设置时使用 OPENAI_BASE_URL / OPENAI_API_KEY）"""
+    global _client
+    if _client is None:
+        _client = OpenAI(base_url=os.getenv("LLM_API_BASE") or None, api_key=os.getenv("LLM_API_KEY") or None)
+    return _client
+
+
+def _overlap(first: str, second: str, min_chars: int = 8) -> int:
+    """first 的结尾与 second 的开头重叠的字符数（不足 min_chars 时视为不重叠）"""
+    probe = second[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    position = first.find(probe)
+    while position != -1:
+        length = len(first) - position
+        if second.startswith(first[position:]):
+            return length
+        position = first.find(probe, position + 1)
+    return 0
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    for count, match in enumerate(UNIT_PATTERN.finditer(text), 1):
+        if count == max_tokens:
+            return text[:match.end()]
+    return text
+
+
+def pack_context(retrieved_docs: List[Dict[str, Any]], max_tokens: int = 1500,
+                 min_tokens: int = 32) -> List[Dict[str, Any]]:
+    """
+    把检索结果打包进token预算
+
+    Args:
+        retrieved_docs: SimpleVectorDB.search 的结果
+        max_tokens: 上下文的token预算（按 tokenizer.count_units 估算）
+        min_tokens: 预算剩余不足一个块时，剩余量不少于该值才放入截断后的块
+
+    Returns:
+        [{"content", "metadata", "similarity", "tokens"}]，按相似度从高到低排列
+    """
+    packed = []
+    remaining = max_tokens
+    for doc in sorted(retrieved_docs, key=lambda item: item["similarity"], reverse=True):
+        if remaining < min_tokens:
+            break
+        content = doc["document"]["content"].strip()
+        for chosen in packed:
+            if content in chosen["content"]:
+                content = ""
+                break
+            # 同一来源的相邻块在切块时有重叠，只保留新增的部分
+            content = content[_overlap(chosen["content"], content):]
+            tail = _overlap(content, chosen["content"])
+            if tail:
+                content = content[:len(content) - tail]
+        content = content.strip()
+        if not content:
+            continue
+        tokens = count_units(content)
+        if tokens > remaining:
+            content = _truncate(content, remaining)
+            tokens = remaining
+        packed.append({
+            "content": content,
+            "metadata": doc["document"].get("metadata") or {},
+            "similarity": doc["similarity"],
+            "tokens": tokens
+        })
+        remaining -= tokens
+    return packed
+
+
+def build_messages(query: str, packed: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """构建对话消息：系统提示 + 编号的参考资料 + 问题"""
+    sections = []
+    for i, chunk in enumerate(packed, 1):
+        source = chunk["metadata"].get("source")
+        header = f"[{i}] 来源：{source}" if source else f"[{i}]"
+        sections.append(f"{header}\n{chunk['content']}")
+    context = "\n\n".join(sections) or "（没有检索到相关资料）"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"参考资料：\n{context}\n\n问题：{query}"}
+    ]
+
+
+class OpenAIChatLLM:
+    """OpenAI兼容接口（OpenAI、统一大模型网关、Ollama）的流式对话"""
+
+    def __init__(self, client: OpenAI = None, model: str = None, temperature: float = 0.3):
+        self._client = client
+        self.model = model or os.getenv("RAG_LLM_MODEL") or os.getenv("LLM_MODEL_NAME", "gpt-4o-mini")
+        self.temperature = temperature
+
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def stream(self, messages: List[Dict[str, str]], max_tokens: int = 512,
+               cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            stream=True
+        )
+        try:
+            for chunk in response:
+                if cancel is not None and cancel.is_set():
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # 取消或调用方提前停止迭代时关闭连接，上游不再继续生成
+            response.close()
+
+
+class FakeLLM:
+    """
+    本地模拟模型：从参考资料中抽取与问题重合词最多的句子作为回答，逐个token流式产出
+
+    first_token_latency / token_delay 可模拟模型的首字延迟和生成速度
+    """
+
+    def __init__(self, max_sentences: int = 2, first_token_latency: float = 0.0, token_delay: float = 0.0):
+        self.max_sentences = max_sentences
+        self.first_token_latency = first_token_latency
+        self.token_delay = token_delay
+
+    def _answer(self, messages: List[Dict[str, str]]) -> str:
+        content = messages[-1]["content"]
+        context, _, query = content.rpartition("问题：")
+        query_terms = set(default_tokenizer.counts(query))
+        scored = []
+        for position, match in enumerate(_SENTENCE_PATTERN.finditer(context)):
+            sentence = match.group().strip()
+            if not sentence or sentence.startswith("[") or sentence == "参考资料：":
+                continue
+            score = len(query_terms.intersection(default_tokenizer.tokenize(sentence)))
+            if score:
+                scored.append((score, position, sentence))
+        if not scored:
+            return "无法从资料中找到答案。"
+        best = sorted(scored, key=lambda item: (-item[0], item[1]))[:self.max_sentences]
+        return "".join(sentence for _, _, sentence in sorted(best, key=lambda item: item[1]))
+
+    def stream(self, messages: List[Dict[str, str]], max_tokens: int = 512,
+               cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        answer = self._answer(messages)
+        start = 0
+        for count, match in enumerate(UNIT_PATTERN.finditer(answer), 1):
+            if count > max_tokens or (cancel is not None and cancel.is_set()):
+                return
+            if count > 1 and self.token_delay:
+                time.sleep(self.token_delay)
+            yield answer[start:match.end()]
+            start = match.end()
+
+
+def create_llm():
+    """根据环境变量创建生成模型：RAG_LLM_BACKEND=openai / fake，未设置时有API密钥则用openai"""
+    backend = os.getenv("RAG_LLM_BACKEND")
+    if backend is None:
+        backend = "openai" if os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY") else "fake"
+    if backend == "fake":
+        return FakeLLM()
+    if backend != "openai":
+        raise ValueError(f"不支持的生成模型：{backend}，可选：openai, fake")
+    return OpenAIChatLLM()
+
+
+def stream_answer(query: str, retrieved_docs: List[Dict[str, Any]], llm=None,
+                  max_context_tokens: int = None, max_tokens: int = None,
+                  cancel: Optional[threading.Event] = None) -> Iterator[str]:
+    """
+    基于检索结果流式生成回答
+
+    Args:
+        llm: 生成模型（OpenAIChatLLM / FakeLLM），默认由 create_llm() 创建
+        max_context_tokens: 上下文token预算，默认取环境变量 RAG_CONTEXT_TOKENS（1500）
+        max_tokens: 回答的最大token数，默认取环境变量 RAG_ANSWER_MAX_TOKENS（512）
+        cancel: 设置后停止生成
+    """
+    llm = llm or create_llm()
+    if max_context_tokens is None:
+        max_context_tokens = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+    if max_tokens is None:
+        max_tokens = int(os.getenv("RAG_ANSWER_MAX_TOKENS", "512"))
+    messages = build_messages(query, pack_context(retrieved_docs, max_context_tokens))
+    yield from llm.stream(messages, max_tokens, cancel)
@@ -0,0 +1,156 @@
+"""
+模型响应缓存 - 为确定性的对话调用（temp=0 或显式要求缓存）提供带TTL和LRU淘汰的缓存
+
+支持两种存储后端：
+- memory：进程内缓存（默认）
+- sqlite：磁盘缓存，网关重启后依然有效
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+class MemoryCacheBackend:
+    """进程内LRU缓存，条目超过TTL后失效"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (过期时间, 响应)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """基于SQLite的磁盘缓存，按最近访问时间做LRU淘汰"""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_access ON response_cache(last_access)")
+        # 启动时清理已过期的条目
+        self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now:
+            self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            self.evictions += 1
+            return None
+        self._conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now)
+        )
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN "
+                "(SELECT key FROM response_cache ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def clear(self):
+        self._conn.execute("DELETE FROM response_cache")
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """响应缓存，统计命中、未命中和淘汰次数"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, prompt: str, **params) -> str:
+        """根据模型、prompt和生成参数计算缓存键"""
+        raw = json.dumps([model, prompt, params], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        self.backend.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+def create_response_cache() -> ResponseCache:
+    """根据环境变量创建响应缓存（MODEL_CACHE_PATH 的相对路径相对于本文件所在目录）"""
+    backend_name = os.getenv("MODEL_CACHE_BACKEND", "memory")
+    max_entries = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", "1024"))
+    ttl = float(os.getenv("MODEL_CACHE_TTL", "3600"))
+    if backend_name == "sqlite":
+        path = os.getenv("MODEL_CACHE_PATH", "data/response_cache.db")
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        return ResponseCache(SQLiteCacheBackend(path, max_entries, ttl))
+    return ResponseCache(MemoryCacheBackend(max_entries, ttl))
@@ -0,0 +1,46 @@
+# IVF近似最近邻索引测试脚本（python -m pytest test_ann_index.py 或直接运行，不需要联网）
+
+import numpy as np
+
+from ann_index import IVFIndex
+from benchmark_ann import recall_at_k
+from benchmark_retrieval import CorpusGenerator
+from dense_index import DenseIndex, HashingEmbedder
+
+
+def build_indexes(vectors, **options):
+    exact = DenseIndex(HashingEmbedder())
+    exact.add_vectors(vectors)
+    index = IVFIndex(HashingEmbedder(), train_threshold=len(vectors), **options)
+    index.add_vectors(vectors)
+    assert index.trained
+    return exact, index
+
+
+def test_default_recall_on_text_corpus():
+    """默认参数在哈希嵌入的文本语料上 recall@10 不低于0.9"""
+    generator = CorpusGenerator(seed=7)
+    embedder = HashingEmbedder()
+    vectors = embedder.embed([generator.document() for _ in range(5000)])
+    queries = embedder.embed([generator.query() for _ in range(100)])
+    exact, index = build_indexes(vectors)
+    recall = recall_at_k(exact.search_vectors(queries, 10), index.search_vectors(queries, 10), 10)
+    assert recall >= 0.9
+
+
+def test_small_nprobe_recall_on_clustered_vectors():
+    """有聚类结构的向量只探测少量列表（不回退到精确检索）也能接近完全召回"""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((50, 256)).astype(np.float32)
+    points = centers[rng.integers(0, 50, 5100)] + 0.5 * rng.standard_normal((5100, 256)).astype(np.float32)
+    vectors, queries = points[:5000], points[5000:]
+    exact, index = build_indexes(vectors)
+    approximate = index.search_vectors(queries, 10, nprobe=4)
+    assert recall_at_k(exact.search_vectors(queries, 10), approximate, 10) >= 0.95
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
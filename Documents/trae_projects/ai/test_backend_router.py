@@ -0,0 +1,65 @@
+# 多后端路由测试脚本（python -m pytest test_backend_router.py 或直接运行，不需要联网）
+
+import asyncio
+import time
+
+import httpx
+
+from backend_router import Backend, BackendRouter
+
+
+def mock_backend(name, chat_status):
+    """/models 总是正常、/chat/completions 返回 chat_status[0] 的后端（修改列表即可切换状态）"""
+    def handler(request):
+        if request.url.path.endswith("/models"):
+            return httpx.Response(200, json={"data": []})
+        return httpx.Response(chat_status[0], json={"choices": []})
+
+    backend = Backend(f"http://{name}/v1", name=name)
+    backend._http = httpx.AsyncClient(base_url=backend.api_base, transport=httpx.MockTransport(handler))
+    return backend
+
+
+def test_probe_does_not_end_ejection_before_cooldown():
+    """因请求失败被摘除的后端，探测成功也要等冷却结束、半开请求成功后才恢复"""
+    async def run():
+        chat_status = [500]
+        backend = mock_backend("ollama", chat_status)
+        router = BackendRouter([backend], max_failures=2, eject_seconds=60)
+
+        async def chat():
+            try:
+                await router.post("/chat/completions", "m", json={})
+                return True
+            except httpx.HTTPStatusError:
+                return False
+
+        for _ in range(2):
+            assert not await chat()
+        assert not backend.available(time.time())
+
+        assert await router.probe(backend)
+        assert backend.healthy
+        assert not backend.available(time.time())
+
+        # 冷却结束后的半开请求失败：立即再次摘除
+        backend.ejected_until = time.time()
+        assert not await chat()
+        assert not backend.available(time.time())
+
+        # 冷却结束后的半开请求成功：恢复
+        backend.ejected_until = time.time()
+        chat_status[0] = 200
+        assert await chat()
+        assert backend.consecutive_failures == 0
+        assert backend.available(time.time())
+        await router.aclose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
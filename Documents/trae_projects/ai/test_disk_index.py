@@ -0,0 +1,52 @@
+# 磁盘索引测试脚本（python -m pytest test_disk_index.py）
+
+import pytest
+
+from disk_index import DiskIndex
+from tokenizer import default_tokenizer
+
+DOCUMENTS = [{"content": f"第{i}篇文档 python 检索 doc{i}"} for i in range(10)]
+
+
+def segment_doc_ids(path):
+    """重新打开索引，返回段中的全部文档ID（有重复说明同一批文档被写成了多个段）和缓冲区中的文档数"""
+    index = DiskIndex(path)
+    try:
+        ids = [doc_id for segment in index._segments for doc_id in range(segment.base, segment.base + segment.count)]
+        return ids, len(index._buffer)
+    finally:
+        index.close()
+
+
+def test_two_instances_do_not_write_duplicate_segments(tmp_path):
+    """同一目录的两个实例：只有写入者写段，读取者只对未写入段的文档打分，关闭两者后没有重复的文档ID"""
+    path = str(tmp_path / "index")
+    writer = DiskIndex(path, flush_threshold=1000)
+    writer.add_documents(DOCUMENTS)
+    reader = DiskIndex(path, flush_threshold=1000)
+    assert writer.is_writer and not reader.is_writer
+
+    hits = reader.search(default_tokenizer.counts("doc3"), top_k=1)
+    assert hits and hits[0][0] == 3
+    with pytest.raises(RuntimeError):
+        reader.add_documents([{"content": "另一个写入者"}])
+    reader.close()
+    writer.close()
+
+    ids, buffered = segment_doc_ids(path)
+    assert sorted(ids) == list(range(len(DOCUMENTS)))
+    assert buffered == 0
+
+
+def test_writer_lock_is_released_on_close(tmp_path):
+    """写入者关闭后，其他实例可以接着写入，文档ID连续"""
+    path = str(tmp_path / "index")
+    first = DiskIndex(path, flush_threshold=1000)
+    first.add_documents(DOCUMENTS[:6])
+    second = DiskIndex(path)
+    first.close()
+    assert second.add_documents(DOCUMENTS[6:]) == list(range(6, 10))
+    second.close()
+
+    ids, _ = segment_doc_ids(path)
+    assert sorted(ids) == list(range(len(DOCUMENTS)))
@@ -0,0 +1,54 @@
+# RAG查询缓存测试脚本（python -m pytest test_rag_cache.py 或直接运行，不需要联网）
+
+from rag_cache import create_rag_cache
+from rag_demo import SimpleVectorDB, load_documents
+
+ENTITY_QUESTIONS = ["Java 是什么时候创建的？", "Go 是什么时候创建的？", "C++ 是什么时候创建的？"]
+
+
+def build_cache(threshold=None):
+    db = SimpleVectorDB()
+    db.add_documents(load_documents())
+    cache = create_rag_cache(db)
+    if threshold is not None:
+        cache.semantic_cache.threshold = threshold
+    return cache
+
+
+def generate(query, retrieved_docs):
+    return f"回答：{query}"
+
+
+def test_same_question_hits_semantic_cache():
+    cache = build_cache()
+    cache.answer("Python 是什么时候创建的？", generate)
+    answer, _ = cache.answer("Python是什么时候创建的", generate)
+    assert answer == "回答：Python 是什么时候创建的？"
+    assert cache.semantic_cache.hits == 1
+
+
+def test_different_entity_questions_miss():
+    """句式相同、实体不同的问题不能返回已缓存问题的回答"""
+    cache = build_cache()
+    cache.answer("Python 是什么时候创建的？", generate)
+    for query in ENTITY_QUESTIONS:
+        answer, _ = cache.answer(query, generate)
+        assert answer == f"回答：{query}"
+    assert cache.semantic_cache.hits == 0
+
+
+def test_low_threshold_is_guarded_by_retrieved_documents():
+    """阈值很低时，检索到的文档不同的相似问题也不会命中"""
+    cache = build_cache(threshold=0.5)
+    cache.answer("Python 是什么时候创建的？", generate)
+    for query in ENTITY_QUESTIONS:
+        answer, _ = cache.answer(query, generate)
+        assert answer == f"回答：{query}"
+    assert cache.semantic_cache.rejections > 0
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
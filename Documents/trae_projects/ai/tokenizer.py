@@ -0,0 +1,153 @@
+"""
+中英文分词器 - 为检索（SimpleVectorDB）生成词项
+
+- 一次正则扫描切出英文/数字串和连续的汉字串；英文转小写，标点和其他字符直接跳过
+- 汉字串默认切成相邻二元组（"创建于" -> "创建"、"建于"），单个汉字保留原样；
+  提供词典时先按词典做正向最大匹配，词典未覆盖的片段再切二元组
+- 重复出现的查询字符串通过LRU缓存直接返回词频结果
+- 批量接口用于建库，不占用查询缓存
+"""
+
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+import operator
+import re
+
+# 检索词项的切分单位：小写英文/数字串和连续的汉字串（调用方先把文本转成小写）
+WORD_PATTERN = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff\u3400-\u4dbf]+")
+
+# 估算token数（切块、上下文预算、usage）时的单位：英文单词/数字串、单个汉字、单个标点
+UNIT_PATTERN = re.compile(r"[A-Za-z0-9]+|[\u4e00-\u9fff\u3400-\u4dbf]|\S")
+
+
+def _bigrams(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return list(map(operator.add, run, run[1:]))
+
+
+def count_units(text: str) -> int:
+    """按 UNIT_PATTERN 估算文本的token数"""
+    return sum(1 for _ in UNIT_PATTERN.finditer(text))
+
+
+def load_dictionary(path: str) -> List[str]:
+    """读取词典文件：每行一个词，可以带词频等其他列（如jieba词典格式），只取第一列"""
+    words = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if parts:
+                words.append(parts[0])
+    return words
+
+
+class Tokenizer:
+    """中英文分词器"""
+
+    def __init__(self, dictionary: Optional[Iterable[str]] = None, cache_size: int = 4096):
+        """
+        Args:
+            dictionary: 可选的中文词表，提供时使用正向最大匹配分词
+            cache_size: 查询词频缓存的条目数
+        """
+        self.dictionary = {word.lower() for word in dictionary} if dictionary else None
+        # 首字 -> 以该字开头的词长（从长到短），匹配时只尝试这些长度
+        self._lengths = {}
+        for word in self.dictionary or ():
+            if len(word) > 1:
+                self._lengths.setdefault(word[0], set()).add(len(word))
+        self._lengths = {first: sorted(lengths, reverse=True) for first, lengths in self._lengths.items()}
+        # 词的首字组成的字符集：当前字不是任何词的首字时，用它跳到下一个可能匹配的位置
+        self._starts = re.compile("[" + "".join(map(re.escape, self._lengths)) + "]") if self._lengths else None
+        self.cache_size = cache_size
+        self._cached_counts = lru_cache(maxsize=cache_size)(self._counts)
+
+    def __getstate__(self):
+        # 缓存不能序列化（例如传给进程池），在接收方重新创建
+        state = self.__dict__.copy()
+        del state["_cached_counts"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cached_counts = lru_cache(maxsize=self.cache_size)(self._counts)
+
+    def _segment(self, run: str, tokens: List[str]):
+        """正向最大匹配，结果追加到 tokens；词典中没有的连续片段切成二元组"""
+        unmatched = 0  # 尚未匹配的片段起点
+        i, end = 0, len(run)
+        dictionary, lengths_by_first, search = self.dictionary, self._lengths, self._starts.search
+        while i < end:
+            lengths = lengths_by_first.get(run[i])
+            if lengths is None:
+                # 不是任何词的首字：跳到下一个首字（词典较小时大部分字符在正则中跳过）
+                match = search(run, i + 1)
+                if match is None:
+                    break
+                i = match.start()
+                continue
+            for length in lengths:
+                if i + length > end:
+                    continue
+                word = run[i:i + length]
+                if word in dictionary:
+                    if i - unmatched > 1:
+                        fragment = run[unmatched:i]
+                        tokens.extend(map(operator.add, fragment, fragment[1:]))
+                    elif i > unmatched:
+                        tokens.append(run[unmatched])
+                    tokens.append(word)
+                    i += length
+                    unmatched = i
+                    break
+            else:
+                i += 1
+        if end - unmatched > 1:
+            fragment = run[unmatched:]
+            tokens.extend(map(operator.add, fragment, fragment[1:]))
+        elif end > unmatched:
+            tokens.append(run[unmatched])
+
+    def tokenize(self, text: str) -> List[str]:
+        """切分文本，返回词项列表"""
+        tokens = []
+        append, extend = tokens.append, tokens.extend
+        if self._starts is None:
+            for piece in WORD_PATTERN.findall(text.lower()):
+                if piece[0] < "\u3400" or len(piece) == 1:  # 英文、数字或单个汉字
+                    append(piece)
+                else:
+                    extend(map(operator.add, piece, piece[1:]))  # 相邻二元组
+        else:
+            segment = self._segment
+            for piece in WORD_PATTERN.findall(text.lower()):
+                if piece[0] < "\u3400" or len(piece) == 1:
+                    append(piece)
+                else:
+                    segment(piece, tokens)
+        return tokens
+
+    def _counts(self, text: str) -> Dict[str, int]:
+        return Counter(self.tokenize(text))
+
+    def counts(self, text: str) -> Dict[str, int]:
+        """统计词频（带LRU缓存，返回的字典会被复用，调用方不要修改）"""
+        return self._cached_counts(text)
+
+    def tokenize_batch(self, texts: Iterable[str]) -> List[List[str]]:
+        tokenize = self.tokenize
+        return [tokenize(text) for text in texts]
+
+    def counts_batch(self, texts: Iterable[str]) -> List[Dict[str, int]]:
+        """批量统计词频（不经过缓存，用于建库）"""
+        tokenize = self.tokenize
+        return [Counter(tokenize(text)) for text in texts]
+
+    def cache_info(self):
+        return self._cached_counts.cache_info()
+
+
+# 默认分词器（不带词典）
+default_tokenizer = Tokenizer()